@@ -0,0 +1,25 @@
+"""Keyset pagination indexes
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-16 00:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Cursor pages filtered by category seek on (category_id, id); unfiltered
+    # recipe pages use the primary key and category pages use ix_categories_name.
+    op.create_index('ix_recipes_category_id_id', 'recipes', ['category_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_recipes_category_id_id', table_name='recipes')
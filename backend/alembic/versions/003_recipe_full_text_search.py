@@ -0,0 +1,67 @@
+"""Recipe full-text search
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-16 00:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+
+    if bind.dialect.name == 'postgresql':
+        op.execute("ALTER TABLE recipes ADD COLUMN search_vector tsvector")
+        # Backfill existing rows; kept in sync with search.POSTGRES_REINDEX
+        op.execute(
+            """
+            UPDATE recipes AS r SET search_vector =
+                setweight(to_tsvector('english', coalesce(r.title, '')), 'A') ||
+                setweight(to_tsvector('english', coalesce(r.description, '')), 'B') ||
+                setweight(to_tsvector('english', coalesce(i.names, '')), 'B') ||
+                setweight(to_tsvector('english', coalesce(r.instructions, '')), 'C')
+            FROM (
+                SELECT rr.id, string_agg(ing.name, ' ') AS names
+                FROM recipes AS rr
+                LEFT JOIN ingredients AS ing ON ing.recipe_id = rr.id
+                GROUP BY rr.id
+            ) AS i
+            WHERE r.id = i.id
+            """
+        )
+        op.execute("CREATE INDEX ix_recipes_search_vector ON recipes USING GIN (search_vector)")
+
+    elif bind.dialect.name == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS recipes_fts USING fts5("
+            "title, description, instructions, ingredients, "
+            "tokenize='porter unicode61 remove_diacritics 2')"
+        )
+        op.execute(
+            """
+            INSERT INTO recipes_fts (rowid, title, description, instructions, ingredients)
+            SELECT r.id, r.title, coalesce(r.description, ''), r.instructions,
+                   coalesce((SELECT group_concat(ing.name, ' ')
+                             FROM ingredients AS ing
+                             WHERE ing.recipe_id = r.id), '')
+            FROM recipes AS r
+            """
+        )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+
+    if bind.dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_recipes_search_vector")
+        op.drop_column('recipes', 'search_vector')
+    elif bind.dialect.name == 'sqlite':
+        op.execute("DROP TABLE IF EXISTS recipes_fts")
@@ -0,0 +1,57 @@
+"""Normalized ingredient names for ingredient matching
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-16 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from normalization import normalize_ingredient_name
+
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+
+
+def upgrade() -> None:
+    op.add_column('ingredients', sa.Column('name_key', sa.String(length=200), nullable=True))
+
+    # Backfill in id order, one batch at a time, so memory stays bounded
+    bind = op.get_bind()
+    ingredients = sa.table('ingredients', sa.column('id'), sa.column('name'), sa.column('name_key'))
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(ingredients.c.id, ingredients.c.name)
+            .where(ingredients.c.id > last_id)
+            .order_by(ingredients.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        bind.execute(
+            ingredients.update()
+            .where(ingredients.c.id == sa.bindparam('_id'))
+            .values(name_key=sa.bindparam('_name_key')),
+            [{'_id': row.id, '_name_key': normalize_ingredient_name(row.name)} for row in rows],
+        )
+        last_id = rows[-1].id
+
+    with op.batch_alter_table('ingredients') as batch_op:
+        batch_op.alter_column('name_key', existing_type=sa.String(length=200), nullable=False)
+
+    op.create_index('ix_ingredients_name_key_recipe_id', 'ingredients', ['name_key', 'recipe_id'], unique=False)
+    op.create_index('ix_ingredients_recipe_id_name_key', 'ingredients', ['recipe_id', 'name_key'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_ingredients_recipe_id_name_key', table_name='ingredients')
+    op.drop_index('ix_ingredients_name_key_recipe_id', table_name='ingredients')
+    op.drop_column('ingredients', 'name_key')
@@ -0,0 +1,40 @@
+"""Row versions and insert-time updated_at for HTTP validators
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-16 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    for table in ('categories', 'recipes'):
+        op.add_column(table, sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+        # Rows inserted so far never had updated_at set
+        op.execute(f"UPDATE {table} SET updated_at = created_at WHERE updated_at IS NULL")
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(
+                'updated_at',
+                existing_type=sa.DateTime(timezone=True),
+                server_default=sa.func.now(),
+            )
+
+
+def downgrade() -> None:
+    for table in ('recipes', 'categories'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(
+                'updated_at',
+                existing_type=sa.DateTime(timezone=True),
+                server_default=None,
+            )
+        op.drop_column(table, 'version')
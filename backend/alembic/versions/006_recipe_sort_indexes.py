@@ -0,0 +1,47 @@
+"""Indexes for recipe sorting and range filters
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-16 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+# Must match models.sort_last / models.total_time_expression exactly, or the
+# planner will not use the expression indexes
+UNKNOWN_TIME = 2147483647
+TOTAL_TIME = 'coalesce(prep_time + cook_time, prep_time, cook_time)'
+
+INDEXES = [
+    # (name, columns): one (sort key, id) index per sort= option
+    ('ix_recipes_created_at_id', ['created_at', 'id']),
+    ('ix_recipes_title_id', ['title', 'id']),
+    ('ix_recipes_prep_time_key', [sa.text(f'coalesce(prep_time, {UNKNOWN_TIME})'), 'id']),
+    ('ix_recipes_cook_time_key', [sa.text(f'coalesce(cook_time, {UNKNOWN_TIME})'), 'id']),
+    ('ix_recipes_total_time_key', [sa.text(f'coalesce({TOTAL_TIME}, {UNKNOWN_TIME})'), 'id']),
+    # Browsing a category newest first or by title
+    ('ix_recipes_category_id_created_at_id', ['category_id', 'created_at', 'id']),
+    ('ix_recipes_category_id_title_id', ['category_id', 'title', 'id']),
+    ('ix_recipes_servings', ['servings']),
+]
+
+
+def upgrade() -> None:
+    # recipes.category_id and ingredients.recipe_id already lead the composite
+    # indexes from 002 (category_id, id) and 004 (recipe_id, name_key), which
+    # serve foreign key lookups too, so neither gets an index of its own.
+    for name, columns in INDEXES:
+        op.create_index(name, 'recipes', columns, unique=False)
+
+
+def downgrade() -> None:
+    for name, _ in reversed(INDEXES):
+        op.drop_index(name, table_name='recipes')
@@ -0,0 +1,38 @@
+"""Trigram indexes for autocomplete
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_recipes_title_trgm', 'recipes', 'title'),
+    ('ix_ingredients_name_trgm', 'ingredients', 'name'),
+    ('ix_ingredients_unit_trgm', 'ingredients', 'unit'),
+]
+
+
+def upgrade() -> None:
+    # Other databases autocomplete from an in-memory index instead
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, column in INDEXES:
+        op.execute(f'CREATE INDEX {name} ON {table} USING GIN ({column} gin_trgm_ops)')
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    # The extension stays: other objects may have come to depend on it
+    for name, _, _ in reversed(INDEXES):
+        op.execute(f'DROP INDEX {name}')
@@ -0,0 +1,53 @@
+"""Change log for delta sync
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'changes',
+        sa.Column('revision', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('entity', sa.String(length=20), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.Column('deleted', sa.Boolean(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('revision')
+    )
+    op.create_table(
+        'change_log_head',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('revision', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    # Existing rows are logged once, so syncing from 0 returns everything
+    op.execute("""
+        INSERT INTO changes (revision, entity, entity_id, deleted)
+        SELECT row_number() OVER (ORDER BY kind, id), entity, id, false
+        FROM (
+            SELECT 0 AS kind, 'category' AS entity, id FROM categories
+            UNION ALL
+            SELECT 1, 'recipe', id FROM recipes
+        ) AS existing
+    """)
+    op.execute("""
+        INSERT INTO change_log_head (id, revision)
+        SELECT 1, coalesce(max(revision), 0) FROM changes
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('change_log_head')
+    op.drop_table('changes')
@@ -0,0 +1,33 @@
+"""Ingredient position, so a recipe keeps the order its ingredients were sent in
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('ingredients', sa.Column('position', sa.Integer(), server_default='0', nullable=False))
+    # Existing lists were kept in id order
+    op.execute("""
+        UPDATE ingredients
+        SET position = (
+            SELECT count(*) FROM ingredients AS earlier
+            WHERE earlier.recipe_id = ingredients.recipe_id
+              AND earlier.id < ingredients.id
+        )
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('ingredients', 'position')
@@ -0,0 +1,37 @@
+"""Indexes for descending time sorts with unknown times last
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '011'
+down_revision = '010'
+branch_labels = None
+depends_on = None
+
+# Must match models.sort_last(..., descending=True) exactly, or the planner
+# will not use the expression indexes
+UNKNOWN_TIME_DESCENDING = -1
+TOTAL_TIME = 'coalesce(prep_time + cook_time, prep_time, cook_time)'
+
+INDEXES = [
+    ('ix_recipes_prep_time_desc_key', [sa.text(f'coalesce(prep_time, {UNKNOWN_TIME_DESCENDING})'), 'id']),
+    ('ix_recipes_cook_time_desc_key', [sa.text(f'coalesce(cook_time, {UNKNOWN_TIME_DESCENDING})'), 'id']),
+    ('ix_recipes_total_time_desc_key', [sa.text(f'coalesce({TOTAL_TIME}, {UNKNOWN_TIME_DESCENDING})'), 'id']),
+]
+
+
+def upgrade() -> None:
+    for name, columns in INDEXES:
+        op.create_index(name, 'recipes', columns, unique=False)
+
+
+def downgrade() -> None:
+    for name, _ in reversed(INDEXES):
+        op.drop_index(name, table_name='recipes')
@@ -0,0 +1,396 @@
+"""Typeahead suggestions for recipe titles, ingredient names and units.
+
+Postgres answers from trigram (pg_trgm) GIN indexes: ILIKE finds prefix and
+word-prefix matches and word similarity catches typos. Other databases
+(SQLite in development and the tests) use an in-memory sorted prefix index
+per kind, built from one GROUP BY query each and rebuilt in the background
+after writes. Either way the search stops at a hard time budget and returns
+the best suggestions found by then; the budget does not cover the one
+blocking build of the in-memory indexes on a process's first lookup.
+"""
+import bisect
+import logging
+import threading
+import time
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import DDL, distinct, event, func, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+from cache import response_cache
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("title", "ingredient", "unit")
+
+# Match quality, best first
+PREFIX, WORD_PREFIX, TYPO = 0, 1, 2
+
+# Suggestion as (match quality, text, count)
+Match = Tuple[int, str, int]
+
+# Keys scanned between two checks of the deadline
+_CHECK_EVERY = 256
+
+# Schema objects for databases built with Base.metadata.create_all (tests,
+# fresh installs); existing databases get them from migration 007.
+event.listen(
+    models.Recipe.__table__,
+    "after_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+event.listen(
+    models.Recipe.__table__,
+    "after_create",
+    DDL(
+        "CREATE INDEX ix_recipes_title_trgm ON recipes USING GIN (title gin_trgm_ops)"
+    ).execute_if(dialect="postgresql"),
+)
+for _column in ("name", "unit"):
+    event.listen(
+        models.Ingredient.__table__,
+        "after_create",
+        DDL(
+            f"CREATE INDEX ix_ingredients_{_column}_trgm "
+            f"ON ingredients USING GIN ({_column} gin_trgm_ops)"
+        ).execute_if(dialect="postgresql"),
+    )
+
+
+def fold(value: str) -> str:
+    """Lowercased, accent-free, whitespace-collapsed form used for matching"""
+    value = unicodedata.normalize("NFKD", value)
+    value = "".join(c for c in value if not unicodedata.combining(c))
+    return " ".join(value.lower().split())
+
+
+def max_typos(query: str) -> int:
+    # Short prefixes have too many near neighbours to tolerate typos
+    if len(query) < 4:
+        return 0
+    if len(query) < 8:
+        return 1
+    return 2
+
+
+def _prefix_distance(query: str, value: str, limit: int) -> Tuple[Optional[int], int]:
+    # Also returns how many leading characters of value decided the outcome
+    n = len(query)
+    value = value[: n + limit]
+    m = len(value)
+    before = None
+    previous = list(range(m + 1))
+    for i in range(1, n + 1):
+        current = [i] + [0] * m
+        q = query[i - 1]
+        for j in range(1, m + 1):
+            cost = 0 if q == value[j - 1] else 1
+            best = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and q == value[j - 2] and query[i - 2] == value[j - 1]:
+                best = min(best, before[j - 2] + 1)
+            current[j] = best
+        # Cells beyond column i + limit always exceed the limit
+        if min(current) > limit:
+            return None, i + limit
+        before, previous = previous, current
+    distance = min(previous)
+    return (distance if distance <= limit else None), n + limit
+
+
+def prefix_distance(query: str, value: str, limit: int) -> Optional[int]:
+    """Edit distance from ``query`` to the closest prefix of ``value``.
+
+    Counts insertions, deletions, substitutions and adjacent transpositions.
+    Returns None as soon as the distance is known to exceed ``limit``.
+    """
+    return _prefix_distance(query, value, limit)[0]
+
+
+def _rank(match: Match):
+    quality, value, count = match
+    return quality, -count, len(value), value
+
+
+class PrefixIndex:
+    """Sorted keys for every word suffix of every entry.
+
+    "Tomato Basil Soup" is stored under "tomato basil soup", "basil soup" and
+    "soup", so a binary search finds both whole-string and word prefixes.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, int]]):
+        self.entries: List[Tuple[str, int]] = []
+        keys = []
+        for value, count in entries:
+            words = fold(value).split()
+            if not words:
+                continue
+            index = len(self.entries)
+            self.entries.append((value, count))
+            for position in range(len(words)):
+                keys.append((" ".join(words[position:]), position, index))
+        keys.sort()
+        self._keys = keys
+        self._strings = [key for key, _, _ in keys]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _range(self, prefix: str) -> Tuple[int, int]:
+        return (
+            bisect.bisect_left(self._strings, prefix),
+            bisect.bisect_left(self._strings, prefix + "\uffff"),
+        )
+
+    def search(self, query: str, limit: int, deadline: float) -> List[Match]:
+        """Best ``limit`` matches for ``query``, prefix matches first"""
+        query = fold(query)
+        if not query:
+            return []
+        found: Dict[int, int] = {}
+
+        start, end = self._range(query)
+        for i in range(start, end):
+            if (i - start) % _CHECK_EVERY == 0 and time.perf_counter() > deadline:
+                break
+            _, position, index = self._keys[i]
+            quality = PREFIX if position == 0 else WORD_PREFIX
+            if found.get(index, TYPO) > quality:
+                found[index] = quality
+
+        typos = max_typos(query)
+        if typos and len(found) < limit:
+            # Typo candidates share the first letter: a cheap, common cutoff.
+            # A distance depends only on the first few characters of a key,
+            # so a failed one rules out every key sharing them, as in a trie.
+            i, end = self._range(query[0])
+            checks = 0
+            while i < end:
+                checks += 1
+                if checks % _CHECK_EVERY == 0 and time.perf_counter() > deadline:
+                    break
+                key, _, index = self._keys[i]
+                distance, depth = _prefix_distance(query, key, typos)
+                if distance is None and len(key) >= depth:
+                    i = bisect.bisect_left(
+                        self._strings, key[:depth] + "\uffff", i + 1, end
+                    )
+                    continue
+                if distance is not None and index not in found:
+                    found[index] = TYPO
+                i += 1
+
+        matches = [(quality, *self.entries[index]) for index, quality in found.items()]
+        matches.sort(key=_rank)
+        return matches[:limit]
+
+
+def _memory_rows(db: Session, kind: str):
+    Recipe, Ingredient = models.Recipe, models.Ingredient
+    if kind == "title":
+        stmt = select(Recipe.title, func.count()).group_by(Recipe.title)
+    elif kind == "ingredient":
+        stmt = select(
+            func.min(Ingredient.name), func.count(distinct(Ingredient.recipe_id))
+        ).group_by(Ingredient.name_key)
+    else:
+        stmt = (
+            select(func.min(Ingredient.unit), func.count())
+            .where(Ingredient.unit.is_not(None), Ingredient.unit != "")
+            .group_by(func.lower(Ingredient.unit))
+        )
+    return db.execute(stmt).all()
+
+
+class MemoryIndexes:
+    """One PrefixIndex per kind, rebuilt in the background after writes.
+
+    Writes are detected through the response cache generation, which every
+    invalidation (including those from other workers) moves forward. Until
+    a rebuild finishes, lookups keep using the previous indexes, so only
+    the first lookup in a process waits for a build, and a new rebuild
+    starts at most once per ``min_rebuild_seconds``.
+    """
+
+    def __init__(self, min_rebuild_seconds: float = 5.0):
+        self.min_rebuild_seconds = min_rebuild_seconds
+        self._lock = threading.Lock()
+        self._indexes: Optional[Dict[str, PrefixIndex]] = None
+        self._generation: Optional[int] = None
+        self._started_at = float("-inf")
+        self._rebuild: Optional[threading.Thread] = None
+
+    def _build(self, db: Session, generation: int) -> None:
+        indexes = {kind: PrefixIndex(_memory_rows(db, kind)) for kind in KINDS}
+        self._indexes, self._generation = indexes, generation
+
+    def _build_in_background(self, bind, generation: int) -> None:
+        try:
+            with Session(bind=bind) as db:
+                self._build(db, generation)
+        except Exception:
+            logger.exception("Could not rebuild the autocomplete indexes")
+        finally:
+            with self._lock:
+                self._rebuild = None
+
+    def get(self, db: Session) -> Dict[str, PrefixIndex]:
+        generation = response_cache.generation
+        if self._indexes is not None and self._generation == generation:
+            return self._indexes
+        with self._lock:
+            if self._indexes is None:
+                # Nothing to answer from yet
+                self._build(db, generation)
+                self._started_at = time.monotonic()
+            elif (
+                self._generation != generation
+                and self._rebuild is None
+                and time.monotonic() - self._started_at >= self.min_rebuild_seconds
+            ):
+                self._started_at = time.monotonic()
+                bind = db.get_bind()
+                if bind.dialect.is_async:
+                    # The async driver cannot be used from another thread;
+                    # only SQLite with DB_ASYNC (tests) gets here
+                    self._build(db, generation)
+                else:
+                    self._rebuild = threading.Thread(
+                        target=self._build_in_background,
+                        args=(bind, generation),
+                        name="autocomplete-rebuild",
+                        daemon=True,
+                    )
+                    self._rebuild.start()
+            return self._indexes
+
+    def wait(self) -> None:
+        """Wait for a running rebuild to finish"""
+        rebuild = self._rebuild
+        if rebuild is not None:
+            rebuild.join()
+
+    def clear(self) -> None:
+        self.wait()
+        with self._lock:
+            self._indexes = None
+            self._generation = None
+            self._started_at = float("-inf")
+
+
+memory_indexes = MemoryIndexes(settings.autocomplete_min_rebuild_seconds)
+
+
+# Postgres: candidates from the trigram indexes, best match first. The
+# similarity test only applies when the query is long enough for typos.
+_POSTGRES_MATCH = """
+    CASE WHEN {col} ILIKE :prefix THEN 0 WHEN {col} ILIKE :word THEN 1 ELSE 2 END
+"""
+_POSTGRES_WHERE = """
+    ({col} ILIKE :prefix OR {col} ILIKE :word OR (:typos AND :q <% {col}))
+"""
+
+POSTGRES_QUERIES = {
+    "title": text(
+        f"""
+        SELECT title, count(*) AS count,
+               {_POSTGRES_MATCH.format(col="title")} AS match
+        FROM recipes
+        WHERE {_POSTGRES_WHERE.format(col="title")}
+        GROUP BY title
+        ORDER BY match, word_similarity(:q, title) DESC, count DESC, title
+        LIMIT :limit
+        """
+    ),
+    "ingredient": text(
+        f"""
+        SELECT min(name), count(DISTINCT recipe_id) AS count,
+               min({_POSTGRES_MATCH.format(col="name")}) AS match
+        FROM ingredients
+        WHERE {_POSTGRES_WHERE.format(col="name")}
+        GROUP BY name_key
+        ORDER BY match, max(word_similarity(:q, name)) DESC, count DESC, min(name)
+        LIMIT :limit
+        """
+    ),
+    "unit": text(
+        f"""
+        SELECT min(unit), count(*) AS count,
+               min({_POSTGRES_MATCH.format(col="unit")}) AS match
+        FROM ingredients
+        WHERE {_POSTGRES_WHERE.format(col="unit")}
+        GROUP BY lower(unit)
+        ORDER BY match, max(word_similarity(:q, unit)) DESC, count DESC, min(unit)
+        LIMIT :limit
+        """
+    ),
+}
+
+
+def _like_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _postgres_search(
+    db: Session, query: str, kinds: Sequence[str], limit: int, deadline: float
+) -> List[Tuple[str, Match]]:
+    query = " ".join(query.split())
+    params = {
+        "q": query,
+        "prefix": _like_escape(query) + "%",
+        "word": "% " + _like_escape(query) + "%",
+        "typos": max_typos(fold(query)) > 0,
+        "limit": limit,
+    }
+    found = []
+    for kind in kinds:
+        remaining_ms = int((deadline - time.perf_counter()) * 1000)
+        if remaining_ms < 1:
+            break
+        try:
+            # Transaction-local, so it cannot leak into later statements
+            db.execute(
+                text("SELECT set_config('statement_timeout', :ms, true)"),
+                {"ms": str(remaining_ms)},
+            )
+            rows = db.execute(POSTGRES_QUERIES[kind], params).all()
+        except DBAPIError:
+            # Over budget: answer with what the other kinds found
+            db.rollback()
+            break
+        found += [(kind, (match, value, count)) for value, count, match in rows]
+    return found
+
+
+def suggest(
+    db: Session,
+    query: str,
+    kinds: Sequence[str] = KINDS,
+    limit: int = 10,
+    budget_ms: Optional[float] = None,
+) -> List[schemas.Suggestion]:
+    """Top ``limit`` suggestions for ``query`` across ``kinds``"""
+    if budget_ms is None:
+        budget_ms = settings.autocomplete_budget_ms
+    deadline = time.perf_counter() + budget_ms / 1000
+
+    if db.get_bind().dialect.name == "postgresql":
+        found = _postgres_search(db, query, kinds, limit, deadline)
+    else:
+        indexes = memory_indexes.get(db)
+        found = [
+            (kind, match)
+            for kind in kinds
+            for match in indexes[kind].search(query, limit, deadline)
+        ]
+
+    found.sort(key=lambda item: _rank(item[1]))
+    return [
+        schemas.Suggestion(text=value, kind=kind, count=count)
+        for kind, (_, value, count) in found[:limit]
+    ]
@@ -0,0 +1,113 @@
+"""Seeded synthetic data: categories, recipes and their ingredients.
+
+The same seed always gives the same rows, so timings and query plans from
+different commits are measured against identical data.
+"""
+import random
+from dataclasses import dataclass
+from typing import List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+import bulk_import
+import crud
+import models
+import schemas
+
+WORDS = [
+    "tomato", "basil", "chicken", "rice", "lemon", "garlic", "onion", "beef",
+    "pasta", "cheese", "apple", "butter", "ginger", "potato", "mushroom",
+    "spinach", "salmon", "chili", "honey", "yogurt", "pepper", "carrot",
+]  # fmt: skip
+UNITS = ["g", "kg", "ml", "l", "cup", "tbsp", "tsp", None]
+# Distinct ingredient names: WORDS x VARIANTS
+VARIANTS = 40
+BATCH_SIZE = 1000
+
+
+@dataclass
+class Dataset:
+    category_ids: List[int]
+    recipe_ids: List[int]
+
+
+def recipe(
+    rng: random.Random,
+    number: int,
+    category_ids: List[int],
+    ingredients: int,
+) -> schemas.RecipeCreate:
+    """One synthetic recipe; about 10% have no category"""
+    category_id: Optional[int] = None
+    if category_ids and rng.random() < 0.9:
+        category_id = rng.choice(category_ids)
+    return schemas.RecipeCreate(
+        title=" ".join(rng.sample(WORDS, 3)).title() + f" {number}",
+        description="A dish worth making again. " * 3,
+        instructions="Chop, stir and simmer. " * 20,
+        prep_time=rng.choice([None, 5, 10, 15, 20, 30]),
+        cook_time=rng.choice([None, 10, 20, 45, 90]),
+        servings=rng.choice([None, 1, 2, 4, 6, 8]),
+        category_id=category_id,
+        ingredients=[
+            schemas.IngredientCreate(
+                name=f"{rng.choice(WORDS)} {rng.randrange(VARIANTS)}",
+                amount=rng.choice([0.5, 1, 2, 250]),
+                unit=rng.choice(UNITS),
+            )
+            for _ in range(ingredients)
+        ],
+    )
+
+
+def add_recipes(
+    db: Session,
+    rng: random.Random,
+    count: int,
+    category_ids: List[int],
+    ingredients: int = 8,
+    first_number: int = 0,
+) -> List[int]:
+    """Bulk-insert ``count`` synthetic recipes; returns their ids"""
+    last_id = db.scalar(select(func.max(models.Recipe.id))) or 0
+    report = bulk_import.ImportReport()
+    for start in range(first_number, first_number + count, BATCH_SIZE):
+        end = min(start + BATCH_SIZE, first_number + count)
+        batch = [
+            (number, recipe(rng, number, category_ids, ingredients))
+            for number in range(start, end)
+        ]
+        bulk_import.insert_batch(db, batch, report)
+    return list(
+        db.scalars(
+            select(models.Recipe.id)
+            .where(models.Recipe.id > last_id)
+            .order_by(models.Recipe.id)
+        )
+    )
+
+
+def generate(
+    db: Session,
+    categories: int = 20,
+    recipes: int = 5000,
+    ingredients: int = 8,
+    seed: int = 0,
+) -> Dataset:
+    """Insert the dataset into an empty database, in bulk"""
+    rng = random.Random(seed)
+    category_ids = [
+        crud.create_category(db, schemas.CategoryCreate(name=f"Category {i}")).id
+        for i in range(categories)
+    ]
+    recipe_ids = add_recipes(db, rng, recipes, category_ids, ingredients)
+    return Dataset(category_ids, recipe_ids)
+
+
+def load(db: Session) -> Dataset:
+    """The ids of a dataset generated earlier"""
+    return Dataset(
+        list(db.scalars(select(models.Category.id).order_by(models.Category.id))),
+        list(db.scalars(select(models.Recipe.id).order_by(models.Recipe.id))),
+    )
@@ -0,0 +1,125 @@
+"""Per-page cost of serializing GET /api/recipes, old paths vs plain rows.
+
+Seeds an in-memory SQLite database and times, for one page of recipes:
+
+  response_model  ORM instances -> RecipeList validation -> jsonable_encoder
+                  -> json.dumps (FastAPI's default response_model path)
+  orm_adapter     ORM instances -> one TypeAdapter validate + dump_json
+  rows            column select -> plain dicts -> pydantic_core.to_json
+
+Run from backend/:  python -m benchmarks.list_serialization [--recipes N]
+"""
+import argparse
+import json
+import statistics
+import time
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import bulk_import
+import crud
+import schemas
+from database import Base
+
+adapter = TypeAdapter(List[schemas.RecipeList])
+
+
+def seed(db, recipes: int) -> None:
+    categories = [
+        crud.create_category(db, schemas.CategoryCreate(name=f"Category {i}"))
+        for i in range(10)
+    ]
+    rows = [
+        (
+            i,
+            schemas.RecipeCreate(
+                title=f"Recipe {i}",
+                description="A reasonably long description of the dish " * 3,
+                instructions="Step. " * 50,
+                prep_time=i % 60,
+                cook_time=i % 90,
+                servings=4,
+                category_id=categories[i % 10].id,
+                ingredients=[
+                    schemas.IngredientCreate(name=f"item {j}") for j in range(8)
+                ],
+            ),
+        )
+        for i in range(recipes)
+    ]
+    report = bulk_import.ImportReport()
+    for start in range(0, len(rows), 1000):
+        bulk_import.insert_batch(db, rows[start : start + 1000], report)
+
+
+def response_model_path(db, limit: int) -> bytes:
+    recipes, _ = crud.get_recipes_page(db, limit=limit)
+    models = [schemas.RecipeList.model_validate(recipe) for recipe in recipes]
+    return json.dumps(jsonable_encoder(models)).encode()
+
+
+def orm_adapter_path(db, limit: int) -> bytes:
+    recipes, _ = crud.get_recipes_page(db, limit=limit)
+    return adapter.dump_json(adapter.validate_python(recipes))
+
+
+def rows_path(db, limit: int) -> bytes:
+    return crud.get_recipes_page_json(db, limit=limit)[0]
+
+
+def measure(session_factory, fn, limit: int, repeat: int) -> List[float]:
+    timings = []
+    for _ in range(repeat):
+        # A fresh session per page, as each request gets
+        db = session_factory()
+        try:
+            started = time.perf_counter()
+            fn(db, limit)
+            timings.append((time.perf_counter() - started) * 1000)
+        finally:
+            db.close()
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recipes", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autoflush=False, bind=engine)
+    db = session_factory()
+    seed(db, args.recipes)
+    db.close()
+
+    paths = {
+        "response_model": response_model_path,
+        "orm_adapter": orm_adapter_path,
+        "rows": rows_path,
+    }
+    results = {}
+    for name, fn in paths.items():
+        measure(session_factory, fn, args.limit, 10)  # warm up
+        timings = measure(session_factory, fn, args.limit, args.repeat)
+        results[name] = statistics.median(timings)
+
+    baseline = results["response_model"]
+    print(f"{args.limit} recipes per page, median of {args.repeat} runs")
+    for name, median in results.items():
+        print(f"  {name:<15} {median:8.3f} ms/page  {baseline / median:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,536 @@
+"""Latency and throughput of every recipe and category endpoint.
+
+Seeds a database with benchmarks.data, then drives one endpoint scenario at
+a time with a fixed number of requests at a given concurrency, and reports
+p50/p95/p99 latency, throughput, errors and SQL statements per request.
+
+Targets:
+
+  inprocess  requests go straight to the ASGI app: no network, no server
+  uvicorn    the app is served by uvicorn on a loopback port in this process
+  --url      a server started separately, which must serve the database
+             given by --database-url; SQL counts are not available
+
+Results can be written as JSON and compared with an earlier run, e.g. from
+the previous commit:
+
+  python -m benchmarks.load --output before.json
+  python -m benchmarks.load --compare before.json
+
+Run from backend/. Without --database-url a temporary SQLite file is used.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlencode
+
+import httpx
+import uvicorn
+from sqlalchemy import create_engine, event, func, inspect, select
+from sqlalchemy.orm import Session, sessionmaker
+
+import crud
+import metrics
+import models
+import schemas
+from benchmarks import data
+from cache import response_cache
+from config import settings
+from database import Base, create_db_engine, session_router
+from main import app
+
+PAGE = 20
+SORTS = ["title", "-created_at", "prep_time", "total_time"]
+
+
+@dataclass
+class State:
+    """What scenarios draw their requests from"""
+
+    rng: random.Random
+    dataset: data.Dataset
+    counter: itertools.count = field(default_factory=itertools.count)
+    # Ids made by a scenario's prepare step for it to delete
+    pool: List[int] = field(default_factory=list)
+
+    def recipe_id(self) -> int:
+        return self.rng.choice(self.dataset.recipe_ids)
+
+    def category_id(self) -> int:
+        return self.rng.choice(self.dataset.category_ids)
+
+    def word(self) -> str:
+        return self.rng.choice(data.WORDS)
+
+    def ingredient(self) -> str:
+        return f"{self.word()} {self.rng.randrange(data.VARIANTS)}"
+
+    def recipe(self) -> dict:
+        number = next(self.counter)
+        recipe = data.recipe(self.rng, number, self.dataset.category_ids, 8)
+        return recipe.model_dump(mode="json")
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: Callable[[State], str]
+    body: Optional[Callable[[State], object]] = None  # JSON, or bytes as is
+    # Makes whatever the timed requests will consume: (db, state, count)
+    prepare: Optional[Callable[[Session, State, int], None]] = None
+    # Slow or bulky; only run when asked for by name or with --scenarios all
+    heavy: bool = False
+
+
+def _query(path: str, **params) -> str:
+    return f"{path}?{urlencode(params)}"
+
+
+def _prepare_recipes(db: Session, state: State, count: int) -> None:
+    state.pool = data.add_recipes(
+        db, state.rng, count, state.dataset.category_ids, first_number=10**6
+    )
+
+
+def _prepare_categories(db: Session, state: State, count: int) -> None:
+    state.pool = [
+        crud.create_category(
+            db, schemas.CategoryCreate(name=f"Disposable {next(state.counter)}")
+        ).id
+        for _ in range(count)
+    ]
+
+
+def _shopping_body(state: State) -> dict:
+    # A month of dinners for a family of four
+    return {
+        "recipes": [{"recipe_id": state.recipe_id(), "servings": 4} for _ in range(30)]
+    }
+
+
+def _import_body(state: State) -> bytes:
+    rows = [json.dumps(state.recipe()) for _ in range(100)]
+    return "\n".join(rows).encode()
+
+
+SCENARIOS = [
+    Scenario("list_recipes", "GET", lambda s: _query("/api/recipes/", limit=PAGE)),
+    Scenario(
+        "list_recipes_sorted",
+        "GET",
+        lambda s: _query("/api/recipes/", limit=PAGE, sort=s.rng.choice(SORTS)),
+    ),
+    Scenario(
+        "list_recipes_by_category",
+        "GET",
+        lambda s: _query("/api/recipes/", limit=PAGE, category_id=s.category_id()),
+    ),
+    Scenario(
+        "list_recipes_filtered",
+        "GET",
+        lambda s: _query(
+            "/api/recipes/",
+            limit=PAGE,
+            max_total_time=s.rng.choice([20, 30, 60]),
+            min_servings=2,
+            sort="total_time",
+        ),
+    ),
+    Scenario(
+        "list_recipes_counted",
+        "GET",
+        lambda s: _query("/api/recipes/", limit=PAGE, count="exact"),
+    ),
+    Scenario(
+        "search_recipes",
+        "GET",
+        lambda s: _query("/api/recipes/", limit=PAGE, search=s.word()),
+    ),
+    Scenario("recipe_facets", "GET", lambda s: "/api/recipes/facets"),
+    Scenario(
+        "cook_with",
+        "GET",
+        lambda s: _query(
+            "/api/recipes/cook-with",
+            ingredients=",".join(s.ingredient() for _ in range(3)),
+            limit=PAGE,
+        ),
+    ),
+    Scenario(
+        "autocomplete",
+        "GET",
+        lambda s: _query("/api/recipes/autocomplete", q=s.word()[:3]),
+    ),
+    Scenario("get_recipe", "GET", lambda s: f"/api/recipes/{s.recipe_id()}"),
+    Scenario(
+        "get_recipes_batch",
+        "GET",
+        lambda s: _query(
+            "/api/recipes/batch",
+            ids=",".join(str(s.recipe_id()) for _ in range(PAGE)),
+        ),
+    ),
+    Scenario(
+        "shopping_list",
+        "POST",
+        lambda s: "/api/recipes/shopping-list",
+        body=_shopping_body,
+    ),
+    Scenario("export_recipes", "GET", lambda s: "/api/recipes/export", heavy=True),
+    Scenario("list_categories", "GET", lambda s: "/api/categories/"),
+    Scenario("get_category", "GET", lambda s: f"/api/categories/{s.category_id()}"),
+    Scenario("create_recipe", "POST", lambda s: "/api/recipes/", body=State.recipe),
+    Scenario(
+        "update_recipe",
+        "PUT",
+        lambda s: f"/api/recipes/{s.recipe_id()}",
+        body=State.recipe,
+    ),
+    Scenario(
+        "patch_recipe",
+        "PATCH",
+        lambda s: f"/api/recipes/{s.recipe_id()}",
+        body=lambda s: {"title": f"Renamed {next(s.counter)}"},
+    ),
+    Scenario(
+        "delete_recipe",
+        "DELETE",
+        lambda s: f"/api/recipes/{s.pool.pop()}",
+        prepare=_prepare_recipes,
+    ),
+    Scenario(
+        "import_recipes",
+        "POST",
+        lambda s: "/api/recipes/import",
+        body=_import_body,
+        heavy=True,
+    ),
+    Scenario(
+        "create_category",
+        "POST",
+        lambda s: "/api/categories/",
+        body=lambda s: {"name": f"Benchmark {next(s.counter)}"},
+    ),
+    Scenario(
+        "update_category",
+        "PUT",
+        lambda s: f"/api/categories/{s.category_id()}",
+        body=lambda s: {"name": f"Renamed {next(s.counter)}"},
+    ),
+    Scenario(
+        "delete_category",
+        "DELETE",
+        lambda s: f"/api/categories/{s.pool.pop()}",
+        prepare=_prepare_categories,
+    ),
+]
+
+
+def percentile(ordered: List[float], p: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(latencies: List[float], errors: int, seconds: float) -> dict:
+    ordered = sorted(latency * 1000 for latency in latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "throughput_rps": round(len(ordered) / seconds, 1),
+        "latency_ms": {
+            "mean": round(sum(ordered) / len(ordered), 3),
+            "p50": round(percentile(ordered, 50), 3),
+            "p95": round(percentile(ordered, 95), 3),
+            "p99": round(percentile(ordered, 99), 3),
+            "max": round(ordered[-1], 3),
+        },
+    }
+
+
+async def drive(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    state: State,
+    requests: int,
+    concurrency: int,
+):
+    """Send ``requests`` requests from ``concurrency`` concurrent workers.
+
+    Returns ``(latencies, errors, seconds)``; an error is a status of 400 or
+    more or a failed connection.
+    """
+    latencies: List[float] = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            body = scenario.body(state) if scenario.body else None
+            kwargs = {"content": body} if isinstance(body, bytes) else {"json": body}
+            started = time.perf_counter()
+            try:
+                response = await client.request(
+                    scenario.method, scenario.path(state), **kwargs
+                )
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - started)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+class StatementCounter:
+    """Counts the SQL statements an engine sends"""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+class UvicornThread:
+    """The app served by uvicorn on a free loopback port, in a thread"""
+
+    def __init__(self):
+        config = uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self) -> str:
+        self.thread.start()
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise RuntimeError("uvicorn failed to start")
+            time.sleep(0.01)
+        port = self.server.servers[0].sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    def __exit__(self, *exc_info):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+def _engine(url: str):
+    if url.startswith("sqlite"):
+        engine = create_engine(url, connect_args={"check_same_thread": False})
+
+        @event.listens_for(engine, "connect")
+        def wal(connection, record):
+            # Readers do not block the writer, as in any real deployment
+            connection.execute("PRAGMA journal_mode=WAL")
+
+        return engine
+    return create_db_engine(url)
+
+
+def _dataset(session_factory, engine, args) -> data.Dataset:
+    if not args.reseed and inspect(engine).has_table(models.Recipe.__tablename__):
+        with session_factory() as db:
+            if db.scalar(select(func.count(models.Recipe.id))):
+                return data.load(db)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with session_factory() as db:
+        dataset = data.generate(
+            db, args.categories, args.recipes, args.ingredients, args.seed
+        )
+    with engine.begin() as connection:
+        connection.exec_driver_sql("ANALYZE")
+    return dataset
+
+
+def _selected(names: Optional[str]) -> List[Scenario]:
+    if names == "all":
+        return SCENARIOS
+    if not names:
+        return [scenario for scenario in SCENARIOS if not scenario.heavy]
+    by_name = {scenario.name: scenario for scenario in SCENARIOS}
+    unknown = [name for name in names.split(",") if name not in by_name]
+    if unknown:
+        raise SystemExit(f"unknown scenarios: {', '.join(unknown)}")
+    return [by_name[name] for name in names.split(",")]
+
+
+async def run(args, session_factory, engine, dataset, base_url) -> Dict[str, dict]:
+    counter = StatementCounter(engine) if not args.url else None
+    if base_url:
+        client = httpx.AsyncClient(base_url=base_url, timeout=60)
+    else:
+        transport = httpx.ASGITransport(app=app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://bench")
+
+    results = {}
+    async with client:
+        for scenario in _selected(args.scenarios):
+            state = State(random.Random(args.seed), dataset)
+            if scenario.prepare:
+                with session_factory() as db:
+                    scenario.prepare(db, state, args.warmup + args.requests)
+            response_cache.clear()
+            await drive(client, scenario, state, args.warmup, args.concurrency)
+
+            statements = counter.count if counter else 0
+            latencies, errors, seconds = await drive(
+                client, scenario, state, args.requests, args.concurrency
+            )
+            result = summarize(latencies, errors, seconds)
+            result["sql_per_request"] = (
+                round((counter.count - statements) / args.requests, 2)
+                if counter
+                else None
+            )
+            results[scenario.name] = result
+            print(_row(scenario.name, result), file=sys.stderr)
+    return results
+
+
+def _row(name: str, result: dict) -> str:
+    latency = result["latency_ms"]
+    sql = result["sql_per_request"]
+    return (
+        f"{name:<26} p50 {latency['p50']:8.2f}  p95 {latency['p95']:8.2f}  "
+        f"p99 {latency['p99']:8.2f} ms  {result['throughput_rps']:8.1f} req/s  "
+        f"sql {'-' if sql is None else sql:>5}  errors {result['errors']}"
+    )
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> List[str]:
+    """Scenarios that got slower or chattier than ``baseline``"""
+    regressions = []
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        p95, old_p95 = result["latency_ms"]["p95"], before["latency_ms"]["p95"]
+        if p95 > old_p95 * threshold:
+            regressions.append(f"{name}: p95 {old_p95} -> {p95} ms")
+        if result["throughput_rps"] * threshold < before["throughput_rps"]:
+            regressions.append(
+                f"{name}: throughput {before['throughput_rps']} -> "
+                f"{result['throughput_rps']} req/s"
+            )
+        sql, old_sql = result["sql_per_request"], before["sql_per_request"]
+        # Cache misses make the average wobble a little between runs
+        if sql is not None and old_sql is not None and sql > old_sql + 0.5:
+            regressions.append(f"{name}: SQL per request {old_sql} -> {sql}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="default: a temporary SQLite file")
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--recipes", type=int, default=5000)
+    parser.add_argument("--ingredients", type=int, default=8, help="per recipe")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--reseed", action="store_true", help="regenerate data in a seeded database"
+    )
+    parser.add_argument(
+        "--target", choices=["inprocess", "uvicorn"], default="inprocess"
+    )
+    parser.add_argument("--url", help="benchmark a running server instead")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=500, help="per scenario")
+    parser.add_argument("--warmup", type=int, default=50, help="per scenario")
+    parser.add_argument(
+        "--scenarios", help="comma-separated names, or 'all' to add the heavy ones"
+    )
+    parser.add_argument("--no-cache", action="store_true", help="bypass response cache")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="slowdown ratio that counts as a regression",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = args.database_url or "sqlite:///" + os.path.join(directory, "bench.db")
+        engine = _engine(url)
+        session_factory = sessionmaker(autoflush=False, bind=engine)
+        dataset = _dataset(session_factory, engine, args)
+
+        # Swapped in behind get_db rather than through dependency_overrides,
+        # which make FastAPI re-analyse every dependency on every request
+        session_router.primary_factory = session_factory
+        if settings.metrics_enabled:
+            metrics.instrument_engine(engine)
+        response_cache.enabled = not args.no_cache
+        if args.url or args.target == "inprocess":
+            results = asyncio.run(run(args, session_factory, engine, dataset, args.url))
+        else:
+            with UvicornThread() as base_url:
+                results = asyncio.run(
+                    run(args, session_factory, engine, dataset, base_url)
+                )
+        engine.dispose()
+
+    report = {
+        "meta": {
+            "commit": _commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "database": engine.dialect.name,
+            "target": args.url or args.target,
+            "cache": not args.no_cache,
+            "categories": len(dataset.category_ids),
+            "recipes": len(dataset.recipe_ids),
+            "ingredients_per_recipe": args.ingredients,
+            "seed": args.seed,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""Live change events for Server-Sent Events subscribers.
+
+``changelog.record`` queues an event per write on the session, and the
+events are published only once that transaction commits (and dropped if it
+rolls back). The broadcaster fans them out to the subscribers in this
+process: each subscriber is an asyncio queue, so an idle one is a coroutine
+parked on an empty queue and costs no work until a matching event arrives.
+Subscribers are indexed by the category they filter on, so an event only
+touches the subscribers that want it. An optional backend relays events
+between worker processes.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_PENDING = "broadcast_events"
+
+
+@dataclass(frozen=True)
+class ChangeEvent:
+    revision: int
+    type: str  # "recipe" or "category"
+    id: int
+    deleted: bool
+    # Categories the write may have affected: a recipe's category before and
+    # after, or the category itself
+    category_ids: tuple
+
+    def to_sse(self) -> str:
+        data = json.dumps(asdict(self), separators=(",", ":"))
+        return f"id: {self.revision}\ndata: {data}\n\n"
+
+
+def queue(db: Session, events: Iterable[ChangeEvent]) -> None:
+    """Publish ``events`` once the session's transaction commits"""
+    db.info.setdefault(_PENDING, []).extend(events)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed(session: Session) -> None:
+    events = session.info.pop(_PENDING, None)
+    if events:
+        broadcaster.publish(events)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_rolled_back(session: Session) -> None:
+    session.info.pop(_PENDING, None)
+
+
+class EventBackend:
+    """Relays change events to the other worker processes.
+
+    The base class is the single-process default and does nothing.
+    Subclasses publish events from this worker and call the ``on_events``
+    callback given to ``start`` when another worker publishes.
+    """
+
+    def start(self, on_events: Callable[[List[ChangeEvent]], None]) -> None:
+        pass
+
+    def publish(self, events: List[ChangeEvent]) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+
+class RedisEventBackend(EventBackend):
+    """Share change events between workers over a Redis pub/sub channel.
+
+    Requires the optional ``redis`` package.
+    """
+
+    channel = "recipe-api:change-events"
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError(
+                "EVENTS_REDIS_URL is set but the redis package is not installed"
+            ) from e
+        self._client = redis.Redis.from_url(url)
+        self._origin = f"{os.getpid()}-{id(self)}"
+        self._thread = None
+
+    def start(self, on_events: Callable[[List[ChangeEvent]], None]) -> None:
+        def handle(message):
+            payload = json.loads(message["data"])
+            if payload["origin"] != self._origin:
+                on_events(
+                    [
+                        ChangeEvent(**{**e, "category_ids": tuple(e["category_ids"])})
+                        for e in payload["events"]
+                    ]
+                )
+
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{self.channel: handle})
+        self._thread = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def publish(self, events: List[ChangeEvent]) -> None:
+        payload = json.dumps(
+            {"origin": self._origin, "events": [asdict(e) for e in events]}
+        )
+        try:
+            self._client.publish(self.channel, payload)
+        except Exception:
+            # Subscribers on other workers miss these; never fail the write
+            logger.exception("Failed to publish change events")
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._thread.stop()
+            self._thread = None
+
+
+# Put on a subscriber's queue in place of events it was too slow to take
+OVERFLOW = None
+
+
+class Subscription:
+    """One subscriber's queue, read from the event loop it was created on"""
+
+    def __init__(self, category_id: Optional[int], max_pending: int):
+        self.category_id = category_id
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(max_pending)
+
+    def deliver(self, change: ChangeEvent) -> None:
+        try:
+            self.queue.put_nowait(change)
+        except asyncio.QueueFull:
+            # The client resyncs from the change feed instead
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(OVERFLOW)
+
+    async def get(self, timeout: float) -> Optional[ChangeEvent]:
+        """The next event; raises asyncio.TimeoutError after ``timeout``"""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class Broadcaster:
+    """Fans change events out to subscribers, from any thread"""
+
+    def __init__(
+        self,
+        backend: Optional[EventBackend] = None,
+        max_pending: int = settings.events_max_pending,
+    ):
+        self.backend = backend or EventBackend()
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        # Keyed by the category filtered on; None for every event
+        self._subscribers: Dict[Optional[int], Set[Subscription]] = defaultdict(set)
+
+    def start(self) -> None:
+        self.backend.start(self._fan_out)
+
+    def stop(self) -> None:
+        self.backend.stop()
+
+    def subscribe(self, category_id: Optional[int] = None) -> Subscription:
+        """Call from the event loop the subscription will be read on"""
+        subscription = Subscription(category_id, self.max_pending)
+        with self._lock:
+            self._subscribers[category_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.category_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.category_id]
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+    async def stream(
+        self, category_id: Optional[int], keepalive_seconds: float
+    ) -> AsyncIterator[str]:
+        """Server-Sent Events for one subscriber, until the client goes away.
+
+        A comment is sent after ``keepalive_seconds`` without events so
+        proxies keep the connection open. If the client falls behind, a
+        ``resync`` event is sent and the stream ends.
+        """
+        subscription = self.subscribe(category_id)
+        try:
+            yield ": connected\n\n"
+            while True:
+                try:
+                    e = await subscription.get(keepalive_seconds)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if e is OVERFLOW:
+                    yield "event: resync\ndata: {}\n\n"
+                    return
+                yield e.to_sse()
+        finally:
+            self.unsubscribe(subscription)
+
+    def publish(self, events: List[ChangeEvent]) -> None:
+        self._fan_out(events)
+        self.backend.publish(events)
+
+    def _fan_out(self, events: List[ChangeEvent]) -> None:
+        # One wakeup per event loop, however many of its subscribers match
+        by_loop: Dict[asyncio.AbstractEventLoop, list] = defaultdict(list)
+        with self._lock:
+            for e in events:
+                keys = (None, *(c for c in e.category_ids if c is not None))
+                for key in set(keys):
+                    for subscription in self._subscribers.get(key, ()):
+                        by_loop[subscription.loop].append((subscription, e))
+        for loop, deliveries in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_deliver, deliveries)
+            except RuntimeError:
+                pass  # the loop has closed; its subscribers are gone
+
+
+def _deliver(deliveries) -> None:
+    for subscription, e in deliveries:
+        subscription.deliver(e)
+
+
+def _create_backend() -> EventBackend:
+    if settings.events_redis_url:
+        return RedisEventBackend(settings.events_redis_url)
+    return EventBackend()
+
+
+broadcaster = Broadcaster(backend=_create_backend())
@@ -0,0 +1,268 @@
+"""Streaming bulk import of recipes.
+
+The request body is parsed incrementally, either as NDJSON (one recipe per
+line) or as a JSON array, and each row is validated with RecipeCreate as it
+arrives. Valid rows are inserted in batches: multi-row INSERT ... RETURNING
+statements for the recipes, one executemany for all of their ingredients,
+then a single search-index refresh and commit per batch. Memory is bounded
+by the batch size and the number of reported errors, not by the size of the
+upload.
+"""
+import codecs
+import json
+from dataclasses import dataclass, field
+from typing import AsyncIterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+import changelog
+import models
+import schemas
+import search as search_engine
+from cache import RECIPE_LISTS, response_cache
+from normalization import normalize_ingredient_name
+
+# Largest single row accepted; a bigger one is reported and the upload stopped
+MAX_ROW_BYTES = 1024 * 1024
+
+# Stop collecting error details after this many; failures are still counted
+MAX_REPORTED_ERRORS = 100
+
+_decoder = json.JSONDecoder()
+
+
+class ImportAborted(ValueError):
+    """The body cannot be parsed any further"""
+
+
+@dataclass
+class ImportReport:
+    inserted: int = 0
+    failed: int = 0
+    errors: List[schemas.ImportRowError] = field(default_factory=list)
+    aborted: Optional[str] = None
+
+    def add_error(self, row: int, errors: List[str]) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(schemas.ImportRowError(row=row, errors=errors))
+
+    def result(self) -> schemas.ImportResult:
+        return schemas.ImportResult(
+            inserted=self.inserted,
+            failed=self.failed,
+            errors=self.errors,
+            errors_truncated=self.failed > len(self.errors),
+            aborted=self.aborted,
+        )
+
+
+async def _iter_ndjson(first: str, chunks: AsyncIterator[str]):
+    buffer = first
+    row = 0
+    while True:
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            row += 1
+            if line.strip():
+                yield row, line
+        if len(buffer) > MAX_ROW_BYTES:
+            raise ImportAborted(f"Row {row + 1} exceeds {MAX_ROW_BYTES} bytes")
+        try:
+            buffer += await chunks.__anext__()
+        except StopAsyncIteration:
+            break
+    if buffer.strip():
+        yield row + 1, buffer
+
+
+async def _iter_array(first: str, chunks: AsyncIterator[str]):
+    buffer = first.lstrip()[1:]  # drop the opening "["
+    row = 0
+    more = True
+    expect_value = True
+    while True:
+        buffer = buffer.lstrip()
+        if buffer and not expect_value:
+            if buffer[0] == "]":
+                return
+            if buffer[0] != ",":
+                raise ImportAborted(f"Expected ',' or ']' after row {row}")
+            buffer = buffer[1:]
+            expect_value = True
+            continue
+        if buffer and expect_value:
+            if row == 0 and buffer[0] == "]":
+                return
+            try:
+                value, end = _decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                pass  # most likely cut off mid-row: read more below
+            else:
+                # A value ending exactly at the buffer end may be truncated
+                # (a number), so only accept it once more data has arrived
+                if end < len(buffer) or not more:
+                    row += 1
+                    yield row, value
+                    buffer = buffer[end:]
+                    expect_value = False
+                    continue
+
+        if not more:
+            if buffer:
+                raise ImportAborted(f"Malformed JSON at row {row + 1}")
+            raise ImportAborted("Unterminated JSON array")
+        if len(buffer) > MAX_ROW_BYTES:
+            raise ImportAborted(f"Row {row + 1} exceeds {MAX_ROW_BYTES} bytes")
+        try:
+            buffer += await chunks.__anext__()
+        except StopAsyncIteration:
+            more = False
+
+
+async def iter_rows(body: AsyncIterator[bytes]):
+    """Yield ``(row_number, value)`` for each row of an NDJSON or JSON array body.
+
+    ``value`` is the decoded object for JSON arrays and the raw line for
+    NDJSON. The format is picked from the first non-blank character.
+    """
+
+    async def text_chunks():
+        # Incremental decoding keeps multi-byte characters split across
+        # chunks intact
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        try:
+            async for chunk in body:
+                text = decoder.decode(chunk)
+                if text:
+                    yield text
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            raise ImportAborted("Request body is not valid UTF-8")
+
+    chunks = text_chunks()
+    first = ""
+    async for chunk in chunks:
+        first += chunk
+        if first.strip():
+            break
+    if not first.strip():
+        return
+
+    rows = (
+        _iter_array(first, chunks)
+        if first.lstrip().startswith("[")
+        else _iter_ndjson(first, chunks)
+    )
+    async for row in rows:
+        yield row
+
+
+def parse_row(value) -> schemas.RecipeCreate:
+    """Validate one decoded row (or NDJSON line) as a RecipeCreate"""
+    if isinstance(value, str):
+        return schemas.RecipeCreate.model_validate_json(value)
+    return schemas.RecipeCreate.model_validate(value)
+
+
+def validation_messages(error: ValidationError) -> List[str]:
+    return [
+        f"{'.'.join(str(part) for part in e['loc']) or 'row'}: {e['msg']}"
+        for e in error.errors()
+    ]
+
+
+def insert_batch(
+    db: Session,
+    batch: List[Tuple[int, schemas.RecipeCreate]],
+    report: ImportReport,
+) -> None:
+    """Insert a batch of validated rows and commit, recording failures.
+
+    Rows pointing at a missing category are rejected up front. If the
+    database still refuses the batch, it is retried row by row so only the
+    offending rows are reported.
+    """
+    category_ids = {r.category_id for _, r in batch if r.category_id is not None}
+    if category_ids:
+        known = set(
+            db.scalars(
+                select(models.Category.id).where(models.Category.id.in_(category_ids))
+            )
+        )
+        accepted = []
+        for row, recipe in batch:
+            if recipe.category_id is not None and recipe.category_id not in known:
+                report.add_error(
+                    row, [f"category_id: category {recipe.category_id} not found"]
+                )
+            else:
+                accepted.append((row, recipe))
+        batch = accepted
+    if not batch:
+        return
+
+    try:
+        _insert(db, [recipe for _, recipe in batch])
+        db.commit()
+    except DBAPIError as e:
+        db.rollback()
+        if len(batch) == 1:
+            report.add_error(batch[0][0], [str(e.orig)])
+            return
+        for item in batch:
+            insert_batch(db, [item], report)
+        return
+
+    report.inserted += len(batch)
+    response_cache.invalidate(RECIPE_LISTS)
+
+
+def _insert_recipes(db: Session, recipes: List[schemas.RecipeCreate]) -> List[int]:
+    # Ids in the order of ``recipes``
+    rows = [recipe.model_dump(exclude={"ingredients"}) for recipe in recipes]
+    if db.get_bind().dialect.name != "sqlite":
+        return db.scalars(
+            insert(models.Recipe).returning(
+                models.Recipe.id, sort_by_parameter_order=True
+            ),
+            rows,
+        ).all()
+    # SQLAlchemy cannot order RETURNING on SQLite and falls back to one
+    # INSERT per row. SQLite hands out rowids in increasing order as it
+    # inserts, and the transaction holds the write lock between statements,
+    # so sorting the ids of unordered multi-row INSERTs restores the order.
+    table = models.Recipe.__table__
+    return sorted(db.scalars(insert(table).returning(table.c.id), rows))
+
+
+def _insert(db: Session, recipes: List[schemas.RecipeCreate]) -> List[int]:
+    recipe_ids = _insert_recipes(db, recipes)
+
+    ingredient_rows = [
+        {
+            **ingredient.model_dump(),
+            "recipe_id": recipe_id,
+            # Bulk inserts bypass the model validator that sets name_key
+            "name_key": normalize_ingredient_name(ingredient.name),
+            "position": position,
+        }
+        for recipe_id, recipe in zip(recipe_ids, recipes)
+        for position, ingredient in enumerate(recipe.ingredients)
+    ]
+    if ingredient_rows:
+        # On the table, as the ORM would fetch server defaults back with an
+        # ordered RETURNING, which SQLite runs as one INSERT per row
+        db.execute(insert(models.Ingredient.__table__), ingredient_rows)
+
+    search_engine.index_recipes(db, recipe_ids)
+    changelog.record(
+        db,
+        changelog.RECIPE,
+        recipe_ids,
+        own_category_ids=[recipe.category_id for recipe in recipes],
+    )
+    return recipe_ids
@@ -0,0 +1,292 @@
+"""In-process cache of serialized API responses.
+
+Read endpoints store the exact response bytes under a key and a set of tags
+("recipe:12", "category:3", "recipes", ...). The CRUD write functions
+invalidate by tag after they commit, so an entry is dropped precisely when
+something it was built from changes. A TTL bounds staleness for anything
+invalidation cannot see, and an optional shared backend broadcasts
+invalidations to the other worker processes.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+from fastapi import Response
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+CachedResponse = Tuple[bytes, Dict[str, str]]
+
+# Tags carried by every cached recipe list and category list response
+RECIPE_LISTS = "recipes"
+CATEGORY_LISTS = "categories"
+
+
+def recipe_tag(recipe_id: int) -> str:
+    return f"recipe:{recipe_id}"
+
+
+def category_tag(category_id: int) -> str:
+    return f"category:{category_id}"
+
+
+class LRUTTLCache:
+    """Bounded least-recently-used cache whose entries also expire after a TTL"""
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        ttl_seconds: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, object, Set[str]]]" = (
+            OrderedDict()
+        )
+        self._keys_by_tag: Dict[str, Set[Hashable]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        # Bumped by every invalidation, and when it happened; see set()
+        self.generation = 0
+        self._invalidated_at = float("-inf")
+
+    def get(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value, _ = entry
+            if expires_at <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(
+        self,
+        key: Hashable,
+        value,
+        tags: Iterable[str] = (),
+        generation: Optional[int] = None,
+        lag_seconds: float = 0.0,
+    ) -> None:
+        """Store ``value`` under ``key``.
+
+        Pass the ``generation`` read before loading the value from the
+        database: if anything was invalidated in the meantime the value may
+        predate that write, so it is not stored. A value read from a replica
+        up to ``lag_seconds`` behind the primary may predate a write that
+        committed before it was read, so it is only stored once nothing has
+        been invalidated for that long.
+        """
+        tags = set(tags)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if lag_seconds and self._clock() - self._invalidated_at < lag_seconds:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (self._clock() + self.ttl_seconds, value, tags)
+            for tag in tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_tags(self, tags: Iterable[str]) -> int:
+        """Drop every entry carrying any of ``tags``; returns how many"""
+        removed = 0
+        with self._lock:
+            self.generation += 1
+            self._invalidated_at = self._clock()
+            for tag in tags:
+                for key in self._keys_by_tag.pop(tag, set()):
+                    if key in self._entries:
+                        self._remove(key)
+                        removed += 1
+            self.invalidations += removed
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_tag.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+
+class InvalidationBackend:
+    """Broadcasts tag invalidations to the other worker processes.
+
+    The base class is the single-process default and does nothing.
+    Subclasses publish tags from this worker and call the ``on_invalidate``
+    callback given to ``start`` when another worker publishes.
+    """
+
+    def start(self, on_invalidate: Callable[[Iterable[str]], None]) -> None:
+        pass
+
+    def publish(self, tags: Iterable[str]) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+
+class RedisInvalidationBackend(InvalidationBackend):
+    """Share invalidations between workers over a Redis pub/sub channel.
+
+    Requires the optional ``redis`` package.
+    """
+
+    channel = "recipe-api:cache-invalidate"
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError(
+                "CACHE_REDIS_URL is set but the redis package is not installed"
+            ) from e
+        self._client = redis.Redis.from_url(url)
+        self._origin = f"{os.getpid()}-{id(self)}"
+        self._thread = None
+
+    def start(self, on_invalidate: Callable[[Iterable[str]], None]) -> None:
+        def handle(message):
+            payload = json.loads(message["data"])
+            if payload["origin"] != self._origin:
+                on_invalidate(payload["tags"])
+
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{self.channel: handle})
+        self._thread = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def publish(self, tags: Iterable[str]) -> None:
+        payload = json.dumps({"origin": self._origin, "tags": list(tags)})
+        try:
+            self._client.publish(self.channel, payload)
+        except Exception:
+            # Other workers fall back to the TTL; never fail the write
+            logger.exception("Failed to publish cache invalidation")
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._thread.stop()
+            self._thread = None
+
+
+class ResponseCache:
+    """Serialized-response cache with write-driven, tag-based invalidation"""
+
+    def __init__(
+        self,
+        store: LRUTTLCache,
+        backend: Optional[InvalidationBackend] = None,
+        enabled: bool = True,
+    ):
+        self.store = store
+        self.backend = backend or InvalidationBackend()
+        self.enabled = enabled
+
+    def start(self) -> None:
+        self.backend.start(self.store.invalidate_tags)
+
+    def stop(self) -> None:
+        self.backend.stop()
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        if not self.enabled:
+            return None
+        return self.store.get(key)
+
+    @property
+    def generation(self) -> int:
+        return self.store.generation
+
+    def set(
+        self,
+        key: Hashable,
+        body: bytes,
+        tags: Iterable[str],
+        headers: Optional[Dict[str, str]] = None,
+        generation: Optional[int] = None,
+        lag_seconds: float = 0.0,
+    ) -> None:
+        if self.enabled:
+            self.store.set(
+                key, (body, dict(headers or {})), tags, generation, lag_seconds
+            )
+
+    def invalidate(self, *tags: str) -> None:
+        self.store.invalidate_tags(tags)
+        self.backend.publish(tags)
+
+    def clear(self) -> None:
+        self.store.clear()
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, **self.store.stats()}
+
+
+def json_response(cached: CachedResponse, status_code: int = 200) -> Response:
+    body, headers = cached
+    return Response(
+        content=body,
+        status_code=status_code,
+        media_type="application/json",
+        headers=headers,
+    )
+
+
+def _create_backend() -> InvalidationBackend:
+    if settings.cache_redis_url:
+        return RedisInvalidationBackend(settings.cache_redis_url)
+    return InvalidationBackend()
+
+
+response_cache = ResponseCache(
+    LRUTTLCache(
+        max_entries=settings.cache_max_entries,
+        ttl_seconds=settings.cache_ttl_seconds,
+    ),
+    backend=_create_backend(),
+    enabled=settings.cache_enabled,
+)
@@ -0,0 +1,87 @@
+from typing import Optional
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    """Application settings, read from the environment and .env"""
+
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+
+    # Database connection
+    db_host: str = "localhost"
+    db_port: int = 5432
+    db_name: str = "recipe_db"
+    db_user: str = "recipe_user"
+    db_password: str = "recipe_password"
+
+    # Serve requests through SQLAlchemy AsyncSession + asyncpg
+    db_async: bool = False
+
+    # Optional read replica (full SQLAlchemy URL) for GET requests
+    db_replica_url: Optional[str] = None
+    # After a write, that client's reads go to the primary for this long
+    db_read_your_writes_seconds: float = 5.0
+    # After the replica fails to connect, skip it for this long
+    db_replica_retry_seconds: float = 30.0
+
+    # Connection pool, per worker process: size the total of
+    # workers * (pool_size + max_overflow) below Postgres max_connections
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: int = 30  # seconds to wait for a free connection
+    db_pool_recycle: int = 1800  # seconds before a connection is replaced
+    db_pool_pre_ping: bool = True
+
+    # Server-side cap on any single statement, in milliseconds (0 disables)
+    db_statement_timeout_ms: int = 30000
+
+    # Log every SQL statement; for debugging only
+    db_echo: bool = False
+
+    # In-process cache of serialized read responses
+    cache_enabled: bool = True
+    cache_max_entries: int = 10000
+    cache_ttl_seconds: float = 60.0
+    # Share invalidations between workers via Redis pub/sub (needs redis)
+    cache_redis_url: Optional[str] = None
+
+    # Prometheus metrics at GET /metrics, with request and database timings
+    metrics_enabled: bool = True
+
+    # Typeahead: hard cap on one search, and (for the in-memory index used
+    # without Postgres) the minimum time between background rebuilds after
+    # writes, during which suggestions may miss the latest changes
+    autocomplete_budget_ms: float = 25.0
+    autocomplete_min_rebuild_seconds: float = 5.0
+
+    # Background jobs: threads per worker process, rows per committed chunk,
+    # and how long a running job may go without progress before another
+    # worker takes it over (also how often workers look for such jobs)
+    job_workers: int = 2
+    job_chunk_size: int = 500
+    job_stale_seconds: float = 300.0
+
+    # Server-Sent Events of changes: events buffered per subscriber before a
+    # slow one is told to resync, seconds between keepalive comments, and
+    # Redis pub/sub to relay events between workers (needs redis)
+    events_max_pending: int = 1000
+    events_keepalive_seconds: float = 15.0
+    events_redis_url: Optional[str] = None
+
+    @property
+    def database_url(self) -> str:
+        return (
+            f"postgresql://{self.db_user}:{self.db_password}"
+            f"@{self.db_host}:{self.db_port}/{self.db_name}"
+        )
+
+    @property
+    def async_database_url(self) -> str:
+        return (
+            f"postgresql+asyncpg://{self.db_user}:{self.db_password}"
+            f"@{self.db_host}:{self.db_port}/{self.db_name}"
+        )
+
+
+settings = Settings()
@@ -1,12 +1,18 @@
 import pytest
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from fastapi.testclient import TestClient
 import os
 
 from database import Base
 from main import app
+from autocomplete import memory_indexes
+from cache import response_cache
 from database import get_db
+import metrics
 
 # Use a test database
 TEST_DATABASE_URL = "sqlite:///./test.db"
@@ -14,6 +20,19 @@ TEST_DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(TEST_DATABASE_URL, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Same database through aiosqlite for the DB_ASYNC code path. TestClient runs
+# each request on a fresh event loop, so connections must not be pooled.
+ASYNC_TEST_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
+
+async_engine = create_async_engine(ASYNC_TEST_DATABASE_URL, poolclass=NullPool)
+AsyncTestingSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+
+# Requests go to these engines instead of the ones main.py instrumented
+metrics.instrument_engine(engine)
+metrics.instrument_engine(async_engine.sync_engine, "primary_async")
+
 
 def override_get_db():
     try:
@@ -23,6 +42,11 @@ def override_get_db():
         db.close()
 
 
+async def override_get_async_db():
+    async with AsyncTestingSessionLocal() as db:
+        yield db
+
+
 app.dependency_overrides[get_db] = override_get_db
 
 
@@ -31,8 +55,57 @@ def test_db():
     Base.metadata.create_all(bind=engine)
     yield
     Base.metadata.drop_all(bind=engine)
+    response_cache.clear()
+    memory_indexes.clear()
 
 
 @pytest.fixture(scope="function")
 def client(test_db):
     return TestClient(app)
+
+
+@pytest.fixture(scope="function")
+def async_client(test_db):
+    """Client whose requests run on AsyncSession, as with DB_ASYNC=true"""
+    app.dependency_overrides[get_db] = override_get_async_db
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides[get_db] = override_get_db
+
+
+@contextmanager
+def count_queries():
+    """Collect every SQL statement sent to the test database"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture
+def assert_max_queries():
+    """Fail the test if the wrapped block runs more than ``limit`` statements
+
+    Usage::
+
+        with assert_max_queries(2):
+            client.get("/api/recipes/1")
+    """
+
+    @contextmanager
+    def _assert_max_queries(limit: int):
+        with count_queries() as statements:
+            yield statements
+        assert len(statements) <= limit, (
+            f"Expected at most {limit} queries, got {len(statements)}:\n"
+            + "\n".join(statements)
+        )
+
+    return _assert_max_queries
@@ -1,37 +1,117 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List, Optional
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import (
+    case,
+    delete,
+    distinct,
+    func,
+    insert,
+    inspect,
+    select,
+    text,
+    update,
+)
+from typing import List, Optional, Sequence, Tuple
+import changelog
+import fieldsets
 import models
 import schemas
+import search as search_engine
+from cache import (
+    CATEGORY_LISTS,
+    RECIPE_LISTS,
+    category_tag,
+    recipe_tag,
+    response_cache,
+)
+from normalization import normalize_ingredient_name
+from pagination import paginate
+
+
+def _touch(db_obj):
+    """Mark a recipe or category as modified: next version, fresh updated_at"""
+    model = type(db_obj)
+    db_obj.version = model.version + 1
+    db_obj.updated_at = func.now()
 
 
 # Category CRUD operations
-def get_category(db: Session, category_id: int):
-    return db.query(models.Category).filter(models.Category.id == category_id).first()
+# Columns a projected detail still needs for its ETag and Last-Modified
+CATEGORY_VALIDATOR_COLUMNS = ("id", "version", "updated_at")
+
+
+def get_category(db: Session, category_id: int, fields: Optional[Tuple] = None):
+    query = db.query(models.Category)
+    if fields is not None:
+        query = query.options(
+            *fieldsets.category_options(fields, CATEGORY_VALIDATOR_COLUMNS)
+        )
+    return query.filter(models.Category.id == category_id).first()
+
+
+def get_category_validators(db: Session, category_id: int):
+    """Just what a conditional GET needs: (version, updated_at) or None"""
+    return db.execute(
+        select(models.Category.version, models.Category.updated_at).where(
+            models.Category.id == category_id
+        )
+    ).first()
 
 
 def get_category_by_name(db: Session, name: str):
     return db.query(models.Category).filter(models.Category.name == name).first()
 
 
+CATEGORY_ORDER = [(models.Category.name, False), (models.Category.id, False)]
+
+
+def get_categories_page(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    fields: Optional[Tuple] = None,
+):
+    query = db.query(models.Category)
+    if fields is not None:
+        query = query.options(*fieldsets.category_options(fields))
+    return paginate(
+        query,
+        CATEGORY_ORDER,
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+    )
+
+
 def get_categories(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Category).offset(skip).limit(limit).all()
+    return get_categories_page(db, skip=skip, limit=limit)[0]
 
 
 def create_category(db: Session, category: schemas.CategoryCreate):
     db_category = models.Category(**category.model_dump())
     db.add(db_category)
+    db.flush()
+    changelog.record(db, changelog.CATEGORY, [db_category.id])
     db.commit()
+    response_cache.invalidate(CATEGORY_LISTS)
     db.refresh(db_category)
     return db_category
 
 
+def _invalidate_category(category_id: int):
+    # Recipe lists and recipe details embed the category
+    response_cache.invalidate(category_tag(category_id), CATEGORY_LISTS, RECIPE_LISTS)
+
+
 def update_category(db: Session, category_id: int, category: schemas.CategoryUpdate):
     db_category = get_category(db, category_id)
     if db_category:
         for key, value in category.model_dump().items():
             setattr(db_category, key, value)
+        _touch(db_category)
+        changelog.record(db, changelog.CATEGORY, [category_id])
         db.commit()
+        _invalidate_category(category_id)
         db.refresh(db_category)
     return db_category
 
@@ -39,34 +119,348 @@ def update_category(db: Session, category_id: int, category: schemas.CategoryUpd
 def delete_category(db: Session, category_id: int):
     db_category = get_category(db, category_id)
     if db_category:
+        # Its recipes are left without a category, which changes them too
+        recipe_ids = [recipe.id for recipe in db_category.recipes]
         db.delete(db_category)
+        changelog.record(db, changelog.RECIPE, recipe_ids, category_ids=[category_id])
+        changelog.record(db, changelog.CATEGORY, [category_id], deleted=True)
         db.commit()
+        _invalidate_category(category_id)
     return db_category
 
 
 # Recipe CRUD operations
-def get_recipe(db: Session, recipe_id: int):
-    return db.query(models.Recipe).filter(models.Recipe.id == recipe_id).first()
 
+# Loader strategies per response shape. The many-to-one category rides along
+# in the same SELECT; ingredients come from one extra "WHERE recipe_id IN"
+# query per page instead of one query per recipe.
+RECIPE_LIST_OPTIONS = (joinedload(models.Recipe.category),)
+RECIPE_DETAIL_OPTIONS = (
+    joinedload(models.Recipe.category),
+    selectinload(models.Recipe.ingredients),
+)
 
-def get_recipes(
+
+# Besides the validators, a projected detail loads category_id so the
+# cached response can be tagged with its category
+RECIPE_VALIDATOR_COLUMNS = ("id", "version", "updated_at", "category_id")
+
+
+def get_recipe(
+    db: Session,
+    recipe_id: int,
+    populate_existing: bool = False,
+    fields: Optional[Tuple] = None,
+):
+    if fields is None:
+        options = RECIPE_DETAIL_OPTIONS
+    else:
+        options = fieldsets.recipe_options(fields, RECIPE_VALIDATOR_COLUMNS)
+    query = db.query(models.Recipe).options(*options)
+    if populate_existing:
+        query = query.populate_existing()
+    return query.filter(models.Recipe.id == recipe_id).first()
+
+
+# Ids one multi-get may ask for
+MAX_BATCH_IDS = 200
+
+# Recipe ids are 32-bit INTEGER columns; an id outside this range cannot
+# even be bound to a query
+MIN_RECIPE_ID, MAX_RECIPE_ID = -(2**31), 2**31 - 1
+
+
+def get_recipes_by_ids(
+    db: Session, recipe_ids: Sequence[int], fields: Optional[Tuple] = None
+) -> Tuple[list, List[int]]:
+    """The recipes with ``recipe_ids`` in the order asked for, and the ids
+    not found; duplicates are returned once.
+
+    Two queries whatever the number of ids: recipes joined to their
+    categories, then every ingredient of the batch.
+    """
+    recipe_ids = list(dict.fromkeys(recipe_ids))
+    if fields is None:
+        options = RECIPE_DETAIL_OPTIONS
+    else:
+        options = fieldsets.recipe_options(fields)
+    found = {
+        recipe.id: recipe
+        for recipe in db.scalars(
+            select(models.Recipe)
+            .options(*options)
+            .where(models.Recipe.id.in_(recipe_ids))
+        ).unique()
+    }
+    recipes = [found[i] for i in recipe_ids if i in found]
+    missing = [i for i in recipe_ids if i not in found]
+    return recipes, missing
+
+
+RECIPE_ORDER = [(models.Recipe.id, False)]
+
+# sort= options; "-" in front sorts descending. Nullable times sort on a
+# non-null key (unknown last) so keyset cursors never compare NULLs. Each key
+# has a (key, id) index, see models.Recipe.
+RECIPE_SORT_KEYS = {
+    "created_at": models.Recipe.created_at,
+    "title": models.Recipe.title,
+    "prep_time": models.sort_last(models.Recipe.prep_time),
+    "cook_time": models.sort_last(models.Recipe.cook_time),
+    "total_time": models.sort_last(models.Recipe.total_time),
+}
+
+# Descending sorts of the times, on keys that put unknown times last that way
+DESCENDING_SORT_KEYS = {
+    "prep_time": models.sort_last(models.Recipe.prep_time, descending=True),
+    "cook_time": models.sort_last(models.Recipe.cook_time, descending=True),
+    "total_time": models.sort_last(models.Recipe.total_time, descending=True),
+}
+
+# Fields with min_/max_ range filters (inclusive). Times are filtered on
+# their sort key, so one expression index serves filtering and sorting.
+RANGE_FILTER_KEYS = {
+    "prep_time": RECIPE_SORT_KEYS["prep_time"],
+    "cook_time": RECIPE_SORT_KEYS["cook_time"],
+    "total_time": RECIPE_SORT_KEYS["total_time"],
+    "servings": models.Recipe.servings,
+}
+
+# ((field, min, max), ...) with None for an open end
+RangeFilters = Tuple[Tuple[str, Optional[int], Optional[int]], ...]
+
+
+def recipe_order(sort: str):
+    descending = sort.startswith("-")
+    field = sort.lstrip("-")
+    key = RECIPE_SORT_KEYS[field]
+    if descending:
+        key = DESCENDING_SORT_KEYS.get(field, key)
+    # Same direction for the tie-breaker keeps the seek a row-value comparison
+    return [(key, descending), (models.Recipe.id, descending)]
+
+
+def range_conditions(ranges: RangeFilters) -> list:
+    conditions = []
+    for field, low, high in ranges:
+        key = RANGE_FILTER_KEYS[field]
+        if low is not None:
+            conditions.append(key >= low)
+        if high is not None:
+            conditions.append(key <= high)
+        elif field != "servings":
+            # Keep recipes without this time (the sort key sentinel) out
+            conditions.append(key < models.UNKNOWN_TIME)
+    return conditions
+
+
+def get_recipe_validators(db: Session, recipe_id: int):
+    """Versions and timestamps of a recipe and its category, or None.
+
+    Lets a conditional GET be answered without loading ingredients.
+    """
+    return db.execute(
+        select(
+            models.Recipe.version,
+            models.Recipe.updated_at,
+            models.Category.version.label("category_version"),
+            models.Category.updated_at.label("category_updated_at"),
+        )
+        .outerjoin(models.Category, models.Recipe.category_id == models.Category.id)
+        .where(models.Recipe.id == recipe_id)
+    ).first()
+
+
+def _filter_recipes(
+    db: Session,
+    query,
+    category_id,
+    search,
+    sort: Optional[str] = None,
+    ranges: RangeFilters = (),
+):
+    # Shared by the ORM and the plain-row list queries and the count
+    order_by = RECIPE_ORDER
+    if category_id:
+        query = query.filter(models.Recipe.category_id == category_id)
+    conditions = range_conditions(ranges)
+    if conditions:
+        query = query.filter(*conditions)
+
+    if search:
+        # Ranked full-text match, best first; id breaks ties
+        query, score = search_engine.apply_search(db, query, search)
+        order_by = [(score, False)] + RECIPE_ORDER
+    if sort:
+        order_by = recipe_order(sort)
+    return query, order_by
+
+
+def get_recipes_page(
     db: Session,
     skip: int = 0,
     limit: int = 100,
     category_id: Optional[int] = None,
     search: Optional[str] = None,
+    cursor: Optional[str] = None,
+    sort: Optional[str] = None,
+    ranges: RangeFilters = (),
 ):
-    query = db.query(models.Recipe)
+    query = db.query(models.Recipe).options(*RECIPE_LIST_OPTIONS)
+    query, order_by = _filter_recipes(db, query, category_id, search, sort, ranges)
+    return paginate(query, order_by, skip=skip, limit=limit, cursor=cursor)
 
-    if category_id:
-        query = query.filter(models.Recipe.category_id == category_id)
 
-    if search:
-        query = query.filter(
-            func.lower(models.Recipe.title).contains(func.lower(search))
+def get_recipes_page_json(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    category_id: Optional[int] = None,
+    search: Optional[str] = None,
+    cursor: Optional[str] = None,
+    fields: Tuple = fieldsets.RECIPE_LIST_FIELDS,
+    sort: Optional[str] = None,
+    ranges: RangeFilters = (),
+):
+    """get_recipes_page as serialized bytes, read with column selects.
+
+    Returns ``(body, next_cursor)``.
+    """
+    columns = fieldsets.recipe_row_columns(fields)
+    query = db.query(*columns).select_from(models.Recipe)
+    if "category" in fields:
+        query = query.outerjoin(
+            models.Category, models.Recipe.category_id == models.Category.id
         )
+    query, order_by = _filter_recipes(db, query, category_id, search, sort, ranges)
+    rows, next_cursor = paginate(query, order_by, skip=skip, limit=limit, cursor=cursor)
+    return fieldsets.dump_recipe_rows(rows, columns, fields), next_cursor
+
+
+# Below this many rows an estimate saves nothing worth its inaccuracy
+ESTIMATE_MIN_ROWS = 100000
+
+
+def estimated_recipe_count(db: Session) -> Optional[int]:
+    """Planner estimate of the recipes table size, or None if unavailable.
+
+    Postgres keeps ``pg_class.reltuples`` current through VACUUM and ANALYZE,
+    so reading it costs the same however large the table is. Small or
+    never-analyzed tables return None so the caller counts exactly.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    estimate = db.execute(
+        text("SELECT reltuples FROM pg_class WHERE oid = CAST(:table AS regclass)"),
+        {"table": models.Recipe.__tablename__},
+    ).scalar()
+    if estimate is None or estimate < ESTIMATE_MIN_ROWS:
+        return None
+    return int(estimate)
+
+
+def count_recipes(
+    db: Session,
+    category_id: Optional[int] = None,
+    search: Optional[str] = None,
+    estimated: bool = False,
+    ranges: RangeFilters = (),
+):
+    """How many recipes a list query matches: ``(count, is_estimate)``.
 
-    return query.offset(skip).limit(limit).all()
+    Only the unfiltered list is ever estimated.
+    """
+    if estimated and not category_id and not search and not ranges:
+        estimate = estimated_recipe_count(db)
+        if estimate is not None:
+            return estimate, True
+
+    query = db.query(func.count(models.Recipe.id)).select_from(models.Recipe)
+    query, _ = _filter_recipes(db, query, category_id, search, ranges=ranges)
+    return query.scalar(), False
+
+
+def get_recipes(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    category_id: Optional[int] = None,
+    search: Optional[str] = None,
+    sort: Optional[str] = None,
+    ranges: RangeFilters = (),
+):
+    return get_recipes_page(
+        db,
+        skip=skip,
+        limit=limit,
+        category_id=category_id,
+        search=search,
+        sort=sort,
+        ranges=ranges,
+    )[0]
+
+
+def get_recipes_by_ingredients(
+    db: Session,
+    ingredient_names: List[str],
+    limit: int = 20,
+    max_missing: Optional[int] = None,
+):
+    """Rank recipes by how many of their ingredients are in ingredient_names.
+
+    Candidates come from the (name_key, recipe_id) index, and coverage is
+    counted per candidate from the (recipe_id, name_key) index, so no
+    recipe without any of the given ingredients is ever read.
+    """
+    wanted = sorted({normalize_ingredient_name(n) for n in ingredient_names} - {""})
+    if not wanted:
+        return []
+
+    Ingredient = models.Ingredient
+    matched = func.count(
+        distinct(case((Ingredient.name_key.in_(wanted), Ingredient.name_key)))
+    )
+    missing = func.count(distinct(Ingredient.name_key)) - matched
+    candidates = select(Ingredient.recipe_id).where(Ingredient.name_key.in_(wanted))
+
+    stmt = (
+        select(Ingredient.recipe_id, matched, missing)
+        .where(Ingredient.recipe_id.in_(candidates))
+        .group_by(Ingredient.recipe_id)
+        .order_by(missing.asc(), matched.desc(), Ingredient.recipe_id.asc())
+        .limit(limit)
+    )
+    if max_missing is not None:
+        stmt = stmt.having(missing <= max_missing)
+    rows = db.execute(stmt).all()
+    if not rows:
+        return []
+
+    recipe_ids = [row.recipe_id for row in rows]
+    recipes = {
+        recipe.id: recipe
+        for recipe in db.query(models.Recipe)
+        .options(*RECIPE_LIST_OPTIONS)
+        .filter(models.Recipe.id.in_(recipe_ids))
+    }
+    missing_names = {recipe_id: [] for recipe_id in recipe_ids}
+    for recipe_id, name in db.execute(
+        select(Ingredient.recipe_id, Ingredient.name)
+        .where(Ingredient.recipe_id.in_(recipe_ids))
+        .where(Ingredient.name_key.not_in(wanted))
+        .order_by(Ingredient.recipe_id, Ingredient.position, Ingredient.id)
+    ):
+        missing_names[recipe_id].append(name)
+
+    return [
+        schemas.RecipeMatch(
+            recipe=schemas.RecipeList.model_validate(recipes[row.recipe_id]),
+            matched_count=row[1],
+            missing_count=row[2],
+            missing_ingredients=missing_names[row.recipe_id],
+        )
+        for row in rows
+    ]
 
 
 def create_recipe(db: Session, recipe: schemas.RecipeCreate):
@@ -79,13 +473,176 @@ def create_recipe(db: Session, recipe: schemas.RecipeCreate):
     db.flush()  # Flush to get the recipe ID
 
     # Create ingredients
-    for ingredient_data in ingredients_data:
-        db_ingredient = models.Ingredient(**ingredient_data, recipe_id=db_recipe.id)
+    for position, ingredient_data in enumerate(ingredients_data):
+        db_ingredient = models.Ingredient(
+            **ingredient_data, recipe_id=db_recipe.id, position=position
+        )
         db.add(db_ingredient)
 
+    db.flush()
+    search_engine.index_recipes(db, [db_recipe.id])
+    changelog.record(
+        db, changelog.RECIPE, [db_recipe.id], category_ids=[db_recipe.category_id]
+    )
     db.commit()
-    db.refresh(db_recipe)
-    return db_recipe
+    response_cache.invalidate(RECIPE_LISTS)
+    # Reload with the detail loaders so serialization does not lazy load
+    return get_recipe(db, db_recipe.id, populate_existing=True)
+
+
+class InvalidIngredientOperation(ValueError):
+    """A PATCH ingredient operation refers to an ingredient the recipe lacks"""
+
+
+# Recipe columns that feed the full-text search document
+SEARCHABLE_FIELDS = {"title", "description", "instructions"}
+
+INGREDIENT_FIELDS = ("name", "amount", "unit")
+
+
+def _set_changed(db_obj, values: dict) -> set:
+    """Assign only the values that differ; returns the changed field names"""
+    changed = set()
+    for key, value in values.items():
+        if getattr(db_obj, key) != value:
+            setattr(db_obj, key, value)
+            changed.add(key)
+    return changed
+
+
+def _ingredient_row(ingredient_id: int, existing, values: dict) -> Optional[dict]:
+    # Bulk UPDATE parameters for one ingredient, or None if nothing changed
+    row = {
+        key: value
+        for key, value in values.items()
+        if key in INGREDIENT_FIELDS and getattr(existing, key) != value
+    }
+    if not row:
+        return None
+    if "name" in row:
+        # Bulk statements bypass the model validator that sets name_key
+        row["name_key"] = normalize_ingredient_name(row["name"])
+    row["id"] = ingredient_id
+    return row
+
+
+def _diff_ingredients(
+    existing: List[models.Ingredient], desired: List[schemas.IngredientUpdate]
+):
+    """Match the desired ingredient list against the stored rows.
+
+    An entry carrying the id of one of the recipe's ingredients is matched to
+    it; the others are matched to the row at the same position if the names
+    agree, then to any remaining row with the same name. Every kept or new
+    row takes its place in the desired list as its position, so reordering
+    the list is an update too. Returns ``(updates, inserts, delete_ids)``.
+    """
+    by_id = {row.id: row for row in existing}
+    matches = {}  # position in desired -> existing row
+    for position, item in enumerate(desired):
+        if item.id in by_id and by_id[item.id] not in matches.values():
+            matches[position] = by_id[item.id]
+
+    keys = [normalize_ingredient_name(item.name) for item in desired]
+    unmatched = [
+        position for position in range(len(desired)) if position not in matches
+    ]
+    taken = {row.id for row in matches.values()}
+    for position in list(unmatched):
+        if position < len(existing):
+            row = existing[position]
+            if row.id not in taken and row.name_key == keys[position]:
+                matches[position] = row
+                taken.add(row.id)
+                unmatched.remove(position)
+    for position in list(unmatched):
+        for row in existing:
+            if row.id not in taken and row.name_key == keys[position]:
+                matches[position] = row
+                taken.add(row.id)
+                unmatched.remove(position)
+                break
+
+    updates = []
+    for position, row in matches.items():
+        values = desired[position].model_dump(include=set(INGREDIENT_FIELDS))
+        update_row = _ingredient_row(row.id, row, values)
+        if row.position != position:
+            update_row = {**(update_row or {"id": row.id}), "position": position}
+        if update_row:
+            updates.append(update_row)
+    inserts = [
+        {
+            **desired[position].model_dump(include=set(INGREDIENT_FIELDS)),
+            "position": position,
+        }
+        for position in unmatched
+    ]
+    delete_ids = [row.id for row in existing if row.id not in taken]
+    return updates, inserts, delete_ids
+
+
+def _write_ingredients(
+    db: Session,
+    recipe_id: int,
+    updates: List[dict],
+    inserts: List[dict],
+    delete_ids: List[int],
+) -> None:
+    # One statement per kind of change, however many ingredients it touches
+    if delete_ids:
+        db.execute(
+            delete(models.Ingredient).where(models.Ingredient.id.in_(delete_ids))
+        )
+    if updates:
+        db.execute(update(models.Ingredient), updates)
+    if inserts:
+        db.execute(
+            insert(models.Ingredient),
+            [
+                {
+                    **values,
+                    "recipe_id": recipe_id,
+                    "name_key": normalize_ingredient_name(values["name"]),
+                }
+                for values in inserts
+            ],
+        )
+
+
+def _save_recipe_changes(
+    db: Session,
+    db_recipe: models.Recipe,
+    changed_fields: set,
+    updates: List[dict],
+    inserts: List[dict],
+    delete_ids: List[int],
+):
+    if not (changed_fields or updates or inserts or delete_ids):
+        # Nothing to write: keep the version, the ETag and the cache
+        return db_recipe
+
+    recipe_id = db_recipe.id
+    # The category it is moving out of, if any, before the flush forgets it
+    category_ids = [
+        db_recipe.category_id,
+        *inspect(db_recipe).attrs.category_id.history.deleted,
+    ]
+    # Ingredient-only edits change the recipe too
+    _touch(db_recipe)
+    _write_ingredients(db, recipe_id, updates, inserts, delete_ids)
+    db.flush()
+    if (
+        changed_fields & SEARCHABLE_FIELDS
+        or inserts
+        or delete_ids
+        or any("name" in row for row in updates)
+    ):
+        search_engine.index_recipes(db, [recipe_id])
+    changelog.record(db, changelog.RECIPE, [recipe_id], category_ids=category_ids)
+    db.commit()
+    response_cache.invalidate(recipe_tag(recipe_id), RECIPE_LISTS)
+    return get_recipe(db, recipe_id, populate_existing=True)
 
 
 def update_recipe(db: Session, recipe_id: int, recipe: schemas.RecipeUpdate):
@@ -95,32 +652,132 @@ def update_recipe(db: Session, recipe_id: int, recipe: schemas.RecipeUpdate):
 
     # Update recipe fields
     recipe_data = recipe.model_dump(exclude={"ingredients"})
-    for key, value in recipe_data.items():
-        if value is not None:
-            setattr(db_recipe, key, value)
+    changed = _set_changed(
+        db_recipe,
+        {key: value for key, value in recipe_data.items() if value is not None},
+    )
 
-    # Update ingredients if provided
+    # Replace the ingredient list if provided, touching only the rows that differ
+    updates, inserts, delete_ids = [], [], []
     if recipe.ingredients is not None:
-        # Delete existing ingredients
-        db.query(models.Ingredient).filter(
-            models.Ingredient.recipe_id == recipe_id
-        ).delete()
-
-        # Create new ingredients
-        for ingredient_data in recipe.ingredients:
-            db_ingredient = models.Ingredient(
-                **ingredient_data.model_dump(), recipe_id=recipe_id
-            )
-            db.add(db_ingredient)
+        updates, inserts, delete_ids = _diff_ingredients(
+            db_recipe.ingredients, recipe.ingredients
+        )
 
-    db.commit()
-    db.refresh(db_recipe)
-    return db_recipe
+    return _save_recipe_changes(db, db_recipe, changed, updates, inserts, delete_ids)
+
+
+def patch_recipe(db: Session, recipe_id: int, patch: schemas.RecipePatch):
+    """Apply only the fields and ingredient operations present in ``patch``"""
+    db_recipe = get_recipe(db, recipe_id)
+    if not db_recipe:
+        return None
+
+    updates, inserts, delete_ids = [], [], []
+    operations = patch.ingredients
+    if operations is not None:
+        by_id = {row.id: row for row in db_recipe.ingredients}
+        referenced = [item.id for item in operations.update] + operations.remove
+        unknown = sorted({i for i in referenced if i not in by_id})
+        if unknown:
+            raise InvalidIngredientOperation(
+                f"Ingredients {unknown} do not belong to recipe {recipe_id}"
+            )
+        removed = set(operations.remove)
+        both = sorted({item.id for item in operations.update} & removed)
+        if both:
+            raise InvalidIngredientOperation(
+                f"Ingredients {both} are both updated and removed"
+            )
+        for item in operations.update:
+            row = _ingredient_row(
+                item.id, by_id[item.id], item.model_dump(exclude_unset=True)
+            )
+            if row:
+                updates.append(row)
+        # Added ingredients go after the existing ones
+        start = max((row.position for row in db_recipe.ingredients), default=-1) + 1
+        inserts = [
+            {**item.model_dump(), "position": start + offset}
+            for offset, item in enumerate(operations.add)
+        ]
+        delete_ids = sorted(removed)
+
+    changed = _set_changed(
+        db_recipe, patch.model_dump(exclude_unset=True, exclude={"ingredients"})
+    )
+    return _save_recipe_changes(db, db_recipe, changed, updates, inserts, delete_ids)
 
 
 def delete_recipe(db: Session, recipe_id: int):
     db_recipe = get_recipe(db, recipe_id)
     if db_recipe:
         db.delete(db_recipe)
+        search_engine.remove_recipes(db, [recipe_id])
+        changelog.record(
+            db,
+            changelog.RECIPE,
+            [recipe_id],
+            deleted=True,
+            category_ids=[db_recipe.category_id],
+        )
         db.commit()
+        response_cache.invalidate(recipe_tag(recipe_id), RECIPE_LISTS)
     return db_recipe
+
+
+def get_changes(db: Session, since: int, limit: int = 100) -> schemas.ChangeFeed:
+    """Writes after revision ``since``, oldest first, up to ``limit`` of them.
+
+    A recipe or category written several times within the page appears once,
+    at its last revision there, with its current state or as deleted.
+    """
+    rows = db.execute(
+        select(
+            models.Change.revision,
+            models.Change.entity,
+            models.Change.entity_id,
+            models.Change.deleted,
+        )
+        .where(models.Change.revision > since)
+        .order_by(models.Change.revision)
+        .limit(limit + 1)
+    ).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    latest = {(row.entity, row.entity_id): row for row in rows}
+
+    def live_ids(entity):
+        return [i for (e, i), row in latest.items() if e == entity and not row.deleted]
+
+    current = {}
+    recipe_ids = live_ids(changelog.RECIPE)
+    if recipe_ids:
+        recipes, _ = get_recipes_by_ids(db, recipe_ids)
+        current.update(((changelog.RECIPE, r.id), r) for r in recipes)
+    category_ids = live_ids(changelog.CATEGORY)
+    if category_ids:
+        categories = db.scalars(
+            select(models.Category).where(models.Category.id.in_(category_ids))
+        )
+        current.update(((changelog.CATEGORY, c.id), c) for c in categories)
+
+    changes = []
+    for key, row in sorted(latest.items(), key=lambda item: item[1].revision):
+        change = schemas.Change(
+            revision=row.revision, type=row.entity, id=row.entity_id
+        )
+        obj = current.get(key)
+        if obj is None:
+            # Deleted, possibly by a write after this page
+            change.deleted = True
+        elif row.entity == changelog.RECIPE:
+            change.recipe = schemas.Recipe.model_validate(obj)
+        else:
+            change.category = schemas.Category.model_validate(obj)
+        changes.append(change)
+    return schemas.ChangeFeed(
+        changes=changes,
+        next=rows[-1].revision if rows else since,
+        has_more=has_more,
+    )
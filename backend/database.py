@@ -1,34 +1,281 @@
+import logging
+import time
+from fastapi import Request, Response
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-import os
-from dotenv import load_dotenv
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.concurrency import run_in_threadpool
+from typing import Optional, Union
+from config import Settings, settings
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
 # Database configuration
-DB_HOST = os.getenv("DB_HOST", "localhost")
-DB_PORT = os.getenv("DB_PORT", "5432")
-DB_NAME = os.getenv("DB_NAME", "recipe_db")
-DB_USER = os.getenv("DB_USER", "recipe_user")
-DB_PASSWORD = os.getenv("DB_PASSWORD", "recipe_password")
+DATABASE_URL = settings.database_url
+ASYNC_DATABASE_URL = settings.async_database_url
+
+# Serve requests through AsyncSession/asyncpg instead of the threadpool
+DB_ASYNC = settings.db_async
+
+
+def _engine_options(url: str, config: Settings) -> dict:
+    """Engine keyword arguments for ``url`` from the pool/timeout settings"""
+    options = {"echo": config.db_echo}
+    driver = make_url(url).drivername
+    if driver.startswith("sqlite"):
+        # SQLite has no server-side pool or statement timeout to tune
+        return options
+
+    options.update(
+        pool_size=config.db_pool_size,
+        max_overflow=config.db_max_overflow,
+        pool_timeout=config.db_pool_timeout,
+        pool_recycle=config.db_pool_recycle,
+        pool_pre_ping=config.db_pool_pre_ping,
+    )
+    if config.db_statement_timeout_ms:
+        timeout = str(config.db_statement_timeout_ms)
+        if driver == "postgresql+asyncpg":
+            options["connect_args"] = {
+                "server_settings": {"statement_timeout": timeout}
+            }
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={timeout}"}
+    return options
+
+
+def to_async_url(url: str) -> str:
+    """Swap a sync database URL's driver for its asyncio counterpart"""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        return parsed.set(drivername="sqlite+aiosqlite").render_as_string(False)
+    return parsed.set(drivername="postgresql+asyncpg").render_as_string(False)
+
+
+def create_db_engine(url: str, config: Settings = settings):
+    """Create a sync engine configured from settings"""
+    return create_engine(url, **_engine_options(url, config))
+
+
+def create_async_db_engine(url: str, config: Settings = settings):
+    """Create an async engine configured from settings"""
+    return create_async_engine(url, **_engine_options(url, config))
 
-DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
 # Create engine
-engine = create_engine(DATABASE_URL, echo=True)
+engine = create_db_engine(DATABASE_URL)
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine and session factory, only created when DB_ASYNC is enabled
+async_engine = create_async_db_engine(ASYNC_DATABASE_URL) if DB_ASYNC else None
+AsyncSessionLocal = (
+    async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    if DB_ASYNC
+    else None
+)
+
+# Session.info key holding how far a replica session may trail the primary
+_REPLICA_LAG = "replica_lag_seconds"
+
+
+class ReplicaSession(Session):
+    """A Session on the read replica that connects when its first query runs.
+
+    ``SessionRouter`` sets ``fallback_router`` on the sessions it hands out.
+    If the replica cannot be reached on that first connect, the session
+    reads from the router's primary for the rest of its life instead. A
+    request answered from the response cache never takes a connection.
+    """
+
+    fallback_router: Optional["SessionRouter"] = None
+
+    def _connection_for_bind(self, engine, execution_options=None, **kw):
+        # Every query and flush connects through here; only the first one
+        # may fall back
+        router, self.fallback_router = self.fallback_router, None
+        try:
+            return super()._connection_for_bind(engine, execution_options, **kw)
+        except DBAPIError as e:
+            if router is None:
+                raise
+            router.replica_failed(e)
+            self.bind = router.primary_bind
+            self.info.pop(_REPLICA_LAG, None)
+            return super()._connection_for_bind(self.bind, execution_options, **kw)
+
+
+# Read replica, only created when DB_REPLICA_URL is set
+replica_engine = None
+ReplicaSessionLocal = None
+async_replica_engine = None
+AsyncReplicaSessionLocal = None
+if settings.db_replica_url:
+    if DB_ASYNC:
+        async_replica_engine = create_async_db_engine(
+            to_async_url(settings.db_replica_url)
+        )
+        AsyncReplicaSessionLocal = async_sessionmaker(
+            async_replica_engine,
+            sync_session_class=ReplicaSession,
+            autoflush=False,
+            expire_on_commit=False,
+        )
+    else:
+        replica_engine = create_db_engine(settings.db_replica_url)
+        ReplicaSessionLocal = sessionmaker(
+            class_=ReplicaSession,
+            autocommit=False,
+            autoflush=False,
+            bind=replica_engine,
+        )
+
+# Either session flavour, as handed to the routers by get_db
+DBSession = Union[Session, AsyncSession]
+
+READ_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+# Cookie carrying the time until which a client must read from the primary
+READ_YOUR_WRITES_COOKIE = "primary_until"
+
+
+class SessionRouter:
+    """Route read-only requests to the replica and everything else to the primary.
+
+    A client that just wrote gets a cookie keeping its reads on the primary
+    for ``read_your_writes_seconds``, so replication lag never hides its own
+    changes. ``replica_factory`` makes ``ReplicaSession``s (or AsyncSessions
+    over them), which connect on their first query: when the replica cannot
+    be reached then, the read falls back to the primary and the replica is
+    left alone for ``retry_seconds``.
+    """
+
+    def __init__(
+        self,
+        primary_factory,
+        replica_factory=None,
+        read_your_writes_seconds: float = settings.db_read_your_writes_seconds,
+        retry_seconds: float = settings.db_replica_retry_seconds,
+    ):
+        self.primary_factory = primary_factory
+        self.replica_factory = replica_factory
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self.retry_seconds = retry_seconds
+        self._replica_down_until = 0.0
+
+    @property
+    def primary_bind(self):
+        """The engine a replica session falls back on"""
+        bind = self.primary_factory.kw["bind"]
+        # An AsyncSession's inner Session connects through the sync engine
+        return getattr(bind, "sync_engine", bind)
+
+    def wants_replica(self, request: Request) -> bool:
+        if self.replica_factory is None or request.method not in READ_METHODS:
+            return False
+        if time.monotonic() < self._replica_down_until:
+            return False
+        try:
+            primary_until = float(request.cookies.get(READ_YOUR_WRITES_COOKIE, 0))
+        except ValueError:
+            primary_until = 0.0
+        return time.time() >= primary_until
+
+    def mark_write(self, request: Request, response: Response) -> None:
+        if self.replica_factory is None or request.method in READ_METHODS:
+            return
+        response.set_cookie(
+            READ_YOUR_WRITES_COOKIE,
+            str(time.time() + self.read_your_writes_seconds),
+            max_age=max(int(self.read_your_writes_seconds), 1),
+            httponly=True,
+            samesite="lax",
+        )
+
+    def replica_failed(self, error: Exception) -> None:
+        logger.warning(
+            "Read replica unavailable, using primary for %ss: %s",
+            self.retry_seconds,
+            error,
+        )
+        self._replica_down_until = time.monotonic() + self.retry_seconds
+
+    def session(self, request: Request, response: Response) -> DBSession:
+        """A session for ``request``; nothing connects until a query runs"""
+        if self.wants_replica(request):
+            db = self.replica_factory()
+            getattr(db, "sync_session", db).fallback_router = self
+            db.info[_REPLICA_LAG] = self.read_your_writes_seconds
+            return db
+        self.mark_write(request, response)
+        return self.primary_factory()
+
+
+def replica_lag(db: DBSession) -> float:
+    """Seconds ``db`` may trail the primary by: 0 unless it reads the replica.
+
+    Replication is assumed to catch up within the read-your-writes window.
+    """
+    return db.info.get(_REPLICA_LAG, 0.0)
+
+
+session_router = SessionRouter(SessionLocal, ReplicaSessionLocal)
+async_session_router: Optional[SessionRouter] = (
+    SessionRouter(AsyncSessionLocal, AsyncReplicaSessionLocal) if DB_ASYNC else None
+)
+
+
+def pool_status() -> dict:
+    """Live connection pool counters of the engine serving requests"""
+    pool = (async_engine or engine).pool
+    status = {"pool": type(pool).__name__}
+    if hasattr(pool, "checkedout"):
+        status.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            # QueuePool counts down from -size until the pool is exhausted
+            overflow=max(pool.overflow(), 0),
+            max_overflow=settings.db_max_overflow,
+        )
+    return status
+
+
 # Create declarative base
 Base = declarative_base()
 
 
 # Dependency to get database session
-def get_db():
-    db = SessionLocal()
+def get_sync_db(request: Request, response: Response):
+    db = session_router.session(request, response)
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db(request: Request, response: Response):
+    db = async_session_router.session(request, response)
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+get_db = get_async_db if DB_ASYNC else get_sync_db
+
+
+async def run_db(db: DBSession, fn, *args, **kwargs):
+    """Run a CRUD function against whichever session get_db handed out.
+
+    CRUD functions take a plain Session. With an AsyncSession they run via
+    run_sync on the event loop, the driver awaiting I/O through greenlets;
+    with a Session they run in the threadpool like a sync route would.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
@@ -0,0 +1,99 @@
+"""Facet counts for recipe browsing.
+
+All facets come from one aggregate query grouped by category: each group
+carries its recipe count plus one conditional count per time bucket and
+servings range, and the bucket totals are summed from the groups.
+"""
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, case, func
+from sqlalchemy.orm import Session
+
+import crud
+import models
+import schemas
+import search as search_engine
+
+# (label, min, max): min inclusive, max exclusive, None for open-ended
+TIME_BUCKETS: List[Tuple[str, Optional[int], Optional[int]]] = [
+    ("under 15 min", 0, 15),
+    ("15-29 min", 15, 30),
+    ("30-59 min", 30, 60),
+    ("60 min or more", 60, None),
+]
+
+SERVINGS_BUCKETS: List[Tuple[str, Optional[int], Optional[int]]] = [
+    ("1-2", 1, 3),
+    ("3-4", 3, 5),
+    ("5-6", 5, 7),
+    ("7 or more", 7, None),
+]
+
+
+def _count_in(expr, low: Optional[int], high: Optional[int]):
+    # Rows of the group whose expr falls in [low, high); NULLs fall in none
+    conditions = []
+    if low is not None:
+        conditions.append(expr >= low)
+    if high is not None:
+        conditions.append(expr < high)
+    return func.coalesce(func.sum(case((and_(*conditions), 1), else_=0)), 0)
+
+
+def _buckets(definitions, counts: List[int]) -> List[schemas.FacetBucket]:
+    return [
+        schemas.FacetBucket(label=label, min=low, max=high, count=count)
+        for (label, low, high), count in zip(definitions, counts)
+    ]
+
+
+def recipe_facets(
+    db: Session, search: Optional[str] = None, ranges: crud.RangeFilters = ()
+) -> schemas.RecipeFacets:
+    """Counts per category, total-time bucket and servings range.
+
+    Only categories with at least one matching recipe are listed, most
+    recipes first; uncategorized recipes appear with ``category_id`` None.
+    """
+    Recipe = models.Recipe
+    time_counts = [
+        _count_in(Recipe.total_time, low, high) for _, low, high in TIME_BUCKETS
+    ]
+    servings_counts = [
+        _count_in(Recipe.servings, low, high) for _, low, high in SERVINGS_BUCKETS
+    ]
+    query = (
+        db.query(
+            models.Category.id,
+            models.Category.name,
+            func.count(Recipe.id),
+            *time_counts,
+            *servings_counts,
+        )
+        .select_from(Recipe)
+        .outerjoin(models.Category, Recipe.category_id == models.Category.id)
+        .group_by(models.Category.id, models.Category.name)
+    )
+    conditions = crud.range_conditions(ranges)
+    if conditions:
+        query = query.filter(*conditions)
+    if search:
+        query, _ = search_engine.apply_search(db, query, search)
+    rows = query.all()
+
+    times = len(TIME_BUCKETS)
+    buckets = times + len(SERVINGS_BUCKETS)
+    categories = sorted(
+        (
+            schemas.CategoryFacet(category_id=row[0], name=row[1], count=row[2])
+            for row in rows
+        ),
+        key=lambda facet: (-facet.count, facet.name is None, facet.name or ""),
+    )
+    totals = [sum(row[3 + i] for row in rows) for i in range(buckets)]
+    return schemas.RecipeFacets(
+        total=sum(row[2] for row in rows),
+        categories=categories,
+        total_time=_buckets(TIME_BUCKETS, totals[:times]),
+        servings=_buckets(SERVINGS_BUCKETS, totals[times:]),
+    )
@@ -0,0 +1,153 @@
+"""Sparse fieldsets: ``?fields=id,title,total_time`` trims a response.
+
+The selection is pushed into the query as well: only the columns behind the
+requested fields are loaded (``load_only``) and relationships that were not
+asked for are never loaded, so less is read, hydrated and serialized.
+"""
+from typing import Iterable, Optional, Sequence, Tuple
+
+import pydantic_core
+from sqlalchemy.orm import joinedload, load_only, selectinload
+
+import models
+import schemas
+
+FIELDS_DESCRIPTION = "Comma-separated fields to return (default: all fields)"
+
+Fields = Tuple[str, ...]
+
+
+class InvalidFields(ValueError):
+    """Raised when ``fields=`` names a field the response does not have"""
+
+
+def _schema_fields(schema) -> Fields:
+    # The serialization schema lists computed fields (total_time) as well
+    return tuple(schema.model_json_schema(mode="serialization")["properties"])
+
+
+RECIPE_FIELDS = _schema_fields(schemas.Recipe)
+RECIPE_LIST_FIELDS = _schema_fields(schemas.RecipeList)
+CATEGORY_FIELDS = _schema_fields(schemas.Category)
+
+# Columns a computed field is derived from
+_DERIVED_COLUMNS = {"total_time": ("prep_time", "cook_time")}
+
+
+def parse_fields(raw: Optional[str], allowed: Fields) -> Optional[Fields]:
+    """The requested fields in schema order, or None for the full response"""
+    if raw is None:
+        return None
+    names = {name.strip() for name in raw.split(",") if name.strip()}
+    if not names:
+        raise InvalidFields("fields must name at least one field")
+    unknown = sorted(names - set(allowed))
+    if unknown:
+        raise InvalidFields(
+            f"Unknown fields: {', '.join(unknown)}; available: {', '.join(allowed)}"
+        )
+    return tuple(name for name in allowed if name in names)
+
+
+def _columns(model, fields: Fields, always: Iterable[str]):
+    table_columns = set(model.__table__.columns.keys())
+    names = set(always)
+    for name in fields:
+        names.update(_DERIVED_COLUMNS.get(name, (name,)))
+    return [getattr(model, name) for name in sorted(names & table_columns)]
+
+
+def recipe_options(fields: Fields, always: Sequence[str] = ("id",)):
+    """Loader options fetching just what ``fields`` needs from a Recipe query"""
+    options = [load_only(*_columns(models.Recipe, fields, always))]
+    if "category" in fields:
+        options.append(joinedload(models.Recipe.category))
+    if "ingredients" in fields:
+        options.append(selectinload(models.Recipe.ingredients))
+    return options
+
+
+def category_options(fields: Fields, always: Sequence[str] = ("id",)):
+    return [load_only(*_columns(models.Category, fields, always))]
+
+
+def _value(obj, name: str):
+    if name == "total_time":
+        return schemas.total_minutes(obj.prep_time, obj.cook_time)
+    if name == "category":
+        category = obj.category
+        return None if category is None else schemas.Category.model_validate(category)
+    if name == "ingredients":
+        return [schemas.Ingredient.model_validate(i) for i in obj.ingredients]
+    return getattr(obj, name)
+
+
+def project(obj, fields: Fields) -> dict:
+    return {name: _value(obj, name) for name in fields}
+
+
+def dump(obj, fields: Fields) -> bytes:
+    """Serialize one object restricted to ``fields``"""
+    return pydantic_core.to_json(project(obj, fields))
+
+
+def dump_list(objs, fields: Fields) -> bytes:
+    return pydantic_core.to_json([project(obj, fields) for obj in objs])
+
+
+def dump_recipe_batch(recipes, missing, fields: Fields) -> bytes:
+    """A multi-get response with each recipe restricted to ``fields``"""
+    return pydantic_core.to_json(
+        {"recipes": [project(r, fields) for r in recipes], "missing": missing}
+    )
+
+
+# Recipe lists are read as plain rows rather than ORM instances: no identity
+# map, no attribute instrumentation and no from_attributes validation. The
+# values come straight from typed columns, so they are serialized as they are.
+_CATEGORY_PREFIX = "category__"
+
+_RECIPE_ROW_COLUMNS = {
+    "category": tuple(
+        getattr(models.Category, name).label(_CATEGORY_PREFIX + name)
+        for name in CATEGORY_FIELDS
+    ),
+    "total_time": (models.Recipe.prep_time, models.Recipe.cook_time),
+}
+
+
+def recipe_row_columns(fields: Fields) -> list:
+    """Labelled columns to select for a recipe list restricted to ``fields``"""
+    columns = {}
+    for name in fields:
+        if name in _RECIPE_ROW_COLUMNS:
+            needed = _RECIPE_ROW_COLUMNS[name]
+        else:
+            needed = (getattr(models.Recipe, name),)
+        for column in needed:
+            columns.setdefault(column.key, column)
+    return [column.label(key) for key, column in columns.items()]
+
+
+def dump_recipe_rows(rows, columns: list, fields: Fields) -> bytes:
+    """Serialize rows fetched with ``recipe_row_columns(fields)``"""
+    names = [column.key for column in columns]
+    items = []
+    for row in rows:
+        values = dict(zip(names, row))
+        item = {}
+        for name in fields:
+            if name == "category":
+                item[name] = (
+                    None
+                    if values[_CATEGORY_PREFIX + "id"] is None
+                    else {f: values[_CATEGORY_PREFIX + f] for f in CATEGORY_FIELDS}
+                )
+            elif name == "total_time":
+                item[name] = schemas.total_minutes(
+                    values["prep_time"], values["cook_time"]
+                )
+            else:
+                item[name] = values[name]
+        items.append(item)
+    return pydantic_core.to_json(items)
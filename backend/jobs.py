@@ -0,0 +1,340 @@
+"""Background jobs for bulk work that would not fit in one request.
+
+A job is a row in the jobs table plus a kind: a function doing one chunk of
+work over recipes taken in id order. Each chunk is committed together with
+the job's progress (processed count and the last id done), so a job can
+stop at any chunk boundary and resume after it: when cancelled, when the
+server shuts down, or when its worker dies. Jobs run on a small thread pool
+in every worker process; workers claim a job with a conditional UPDATE, so
+each job runs in one place at a time however many workers there are.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Type
+
+from pydantic import BaseModel
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import Session
+
+import changelog
+import models
+import schemas
+import search as search_engine
+from cache import RECIPE_LISTS, recipe_tag, response_cache
+from config import settings
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+CANCELLING = "cancelling"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobFinished(ValueError):
+    """The job has already succeeded, failed or been cancelled"""
+
+
+@dataclass
+class JobKind:
+    params: Type[BaseModel]
+    # How many rows the job will process, counted when it first starts
+    count: Callable[[Session, BaseModel], int]
+    # Processes up to ``limit`` rows with ids above ``after`` (all if None),
+    # in id order, without committing; returns the ids it processed
+    run_chunk: Callable[[Session, BaseModel, Optional[int], int], List[int]]
+    # Called with each chunk's ids once it is committed
+    after_commit: Optional[Callable[[BaseModel, List[int]], None]] = None
+
+
+def _next_ids(query, after: Optional[int], limit: int) -> List[int]:
+    if after is not None:
+        query = query.filter(models.Recipe.id > after)
+    return [row[0] for row in query.order_by(models.Recipe.id).limit(limit)]
+
+
+def _count_recipes(db: Session, params) -> int:
+    return db.query(func.count(models.Recipe.id)).scalar()
+
+
+def _reindex_chunk(db: Session, params, after, limit) -> List[int]:
+    ids = _next_ids(db.query(models.Recipe.id), after, limit)
+    search_engine.index_recipes(db, ids)
+    return ids
+
+
+def _search_results_changed(params, ids: List[int]) -> None:
+    response_cache.invalidate(RECIPE_LISTS)
+
+
+def _recategorize_query(db: Session, params: schemas.RecategorizeParams, query):
+    query = query.filter(
+        models.Recipe.category_id.is_(None)
+        if params.from_category_id is None
+        else models.Recipe.category_id == params.from_category_id
+    )
+    if params.search:
+        query, _ = search_engine.apply_search(db, query, params.search)
+    return query
+
+
+def _count_recategorized(db: Session, params) -> int:
+    query = db.query(func.count(models.Recipe.id)).select_from(models.Recipe)
+    return _recategorize_query(db, params, query).scalar()
+
+
+def _recategorize_chunk(db: Session, params, after, limit) -> List[int]:
+    # Moved recipes no longer match, but the id cursor already skips them
+    query = _recategorize_query(db, params, db.query(models.Recipe.id))
+    ids = _next_ids(query, after, limit)
+    if ids:
+        db.execute(
+            update(models.Recipe)
+            .where(models.Recipe.id.in_(ids))
+            .values(
+                category_id=params.to_category_id,
+                version=models.Recipe.version + 1,
+                updated_at=func.now(),
+            )
+        )
+        changelog.record(
+            db,
+            changelog.RECIPE,
+            ids,
+            category_ids=[params.from_category_id, params.to_category_id],
+        )
+    return ids
+
+
+def _recipes_changed(params, ids: List[int]) -> None:
+    response_cache.invalidate(*(recipe_tag(i) for i in ids), RECIPE_LISTS)
+
+
+KINDS: Dict[str, JobKind] = {
+    "reindex": JobKind(
+        schemas.ReindexParams,
+        _count_recipes,
+        _reindex_chunk,
+        _search_results_changed,
+    ),
+    "recategorize": JobKind(
+        schemas.RecategorizeParams,
+        _count_recategorized,
+        _recategorize_chunk,
+        _recipes_changed,
+    ),
+}
+
+
+def create_job(db: Session, kind: str, params: BaseModel) -> models.Job:
+    db_job = models.Job(kind=kind, params=params.model_dump(), status=QUEUED)
+    db.add(db_job)
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+
+def get_job(db: Session, job_id: int) -> Optional[models.Job]:
+    return db.get(models.Job, job_id)
+
+
+def get_jobs(
+    db: Session, status: Optional[str] = None, limit: int = 100
+) -> List[models.Job]:
+    """Most recent first"""
+    query = select(models.Job).order_by(models.Job.id.desc()).limit(limit)
+    if status:
+        query = query.where(models.Job.status == status)
+    return list(db.scalars(query))
+
+
+def cancel_job(db: Session, job_id: int) -> Optional[models.Job]:
+    """Cancel a queued job, or ask a running one to stop after its chunk.
+
+    Raises JobFinished if it has already finished.
+    """
+    job = models.Job
+    for current, new, values in [
+        (QUEUED, CANCELLED, {"finished_at": func.now()}),
+        (RUNNING, CANCELLING, {}),
+    ]:
+        # Conditional, so a worker claiming the job at the same time either
+        # sees the cancellation or gets the job running first
+        changed = db.execute(
+            update(job)
+            .where(job.id == job_id, job.status == current)
+            .values(status=new, **values)
+        ).rowcount
+        if changed:
+            db.commit()
+            break
+    db_job = db.get(job, job_id, populate_existing=True)
+    if db_job is not None and db_job.status in FINISHED and not changed:
+        raise JobFinished(f"Job {job_id} has already {db_job.status}")
+    return db_job
+
+
+class JobRunner:
+    """Runs jobs on a thread pool, resuming any left unfinished.
+
+    ``start`` and ``stop`` are called from the application lifespan. Jobs
+    submitted while the runner is stopped wait in the table until it starts.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        workers: int = settings.job_workers,
+        chunk_size: int = settings.job_chunk_size,
+        stale_seconds: float = settings.job_stale_seconds,
+    ):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.stale_seconds = stale_seconds
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stopping = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._stopping.clear()
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="job")
+        self._sweeper = threading.Thread(
+            target=self._sweep, name="job-sweeper", daemon=True
+        )
+        self._sweeper.start()
+
+    def stop(self) -> None:
+        """Stop after the current chunks; unfinished jobs go back to the queue"""
+        if self._executor is None:
+            return
+        self._stopping.set()
+        self._sweeper.join()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
+
+    def enqueue(self, job_id: int) -> None:
+        if self._executor is not None and not self._stopping.is_set():
+            self._executor.submit(self.run, job_id)
+
+    def _sweep(self) -> None:
+        # Queued jobs from before a restart or from workers that died,
+        # and running jobs whose worker stopped making progress
+        while True:
+            try:
+                for job_id in self.recover():
+                    self.enqueue(job_id)
+            except Exception:
+                logger.exception("Could not look for unfinished jobs")
+            if self._stopping.wait(self.stale_seconds):
+                return
+
+    def _stale_before(self) -> datetime:
+        return datetime.now(timezone.utc) - timedelta(seconds=self.stale_seconds)
+
+    def _claimable(self):
+        job = models.Job
+        return or_(
+            job.status == QUEUED,
+            and_(job.status == RUNNING, job.heartbeat_at < self._stale_before()),
+        )
+
+    def recover(self) -> List[int]:
+        """Ids of jobs waiting for a worker, oldest first"""
+        job = models.Job
+        with self.session_factory() as db:
+            # Nobody is left to act on these cancellations
+            db.execute(
+                update(job)
+                .where(
+                    job.status == CANCELLING, job.heartbeat_at < self._stale_before()
+                )
+                .values(status=CANCELLED, finished_at=func.now())
+            )
+            db.commit()
+            return list(
+                db.scalars(select(job.id).where(self._claimable()).order_by(job.id))
+            )
+
+    def _claim(self, job_id: int) -> bool:
+        job = models.Job
+        with self.session_factory() as db:
+            claimed = db.execute(
+                update(job)
+                .where(job.id == job_id, self._claimable())
+                .values(
+                    status=RUNNING,
+                    started_at=func.coalesce(job.started_at, func.now()),
+                    heartbeat_at=func.now(),
+                )
+            ).rowcount
+            db.commit()
+        return claimed == 1
+
+    def _finish(self, job_id: int, status: str, error: Optional[str] = None) -> None:
+        with self.session_factory() as db:
+            db.execute(
+                update(models.Job)
+                .where(models.Job.id == job_id)
+                .values(status=status, error=error, finished_at=func.now())
+            )
+            db.commit()
+
+    def run(self, job_id: int) -> None:
+        """Run a job to the end, unless it is cancelled or the runner stops"""
+        if not self._claim(job_id):
+            return  # taken by another worker, cancelled or finished
+        try:
+            self._run_chunks(job_id)
+        except Exception as e:
+            logger.exception("Job %s failed", job_id)
+            self._finish(job_id, FAILED, f"{type(e).__name__}: {e}")
+
+    def _run_chunks(self, job_id: int) -> None:
+        with self.session_factory() as db:
+            db_job = db.get(models.Job, job_id)
+            kind = KINDS[db_job.kind]
+            params = kind.params.model_validate(db_job.params)
+            if db_job.total is None:
+                db_job.total = kind.count(db, params)
+                db.commit()
+
+        while True:
+            with self.session_factory() as db:
+                db_job = db.get(models.Job, job_id)
+                if db_job.status == CANCELLING:
+                    db_job.status = CANCELLED
+                    db_job.finished_at = func.now()
+                    db.commit()
+                    return
+                if self._stopping.is_set():
+                    # Shutting down: the next worker to start resumes it
+                    db_job.status = QUEUED
+                    db.commit()
+                    return
+
+                ids = kind.run_chunk(db, params, db_job.cursor, self.chunk_size)
+                if ids:
+                    db_job.cursor = max(ids)
+                    db_job.processed += len(ids)
+                db_job.heartbeat_at = func.now()
+                done = len(ids) < self.chunk_size
+                if done:
+                    db_job.status = SUCCEEDED
+                    db_job.finished_at = func.now()
+                db.commit()
+
+            if ids and kind.after_commit:
+                kind.after_commit(params, ids)
+            if done:
+                return
+
+
+job_runner = JobRunner()
@@ -1,9 +1,21 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import os
 from dotenv import load_dotenv
-from routers import recipe_router, category_router
+from routers import category_router, change_router, job_router, recipe_router
+from database import (
+    async_engine,
+    async_replica_engine,
+    engine,
+    pool_status,
+    replica_engine,
+)
+from broadcast import broadcaster
+from cache import response_cache
+from jobs import job_runner
+from config import settings
+import metrics
 
 # Load environment variables
 load_dotenv()
@@ -13,9 +25,18 @@ load_dotenv()
 async def lifespan(app: FastAPI):
     # Startup
     print("Starting up Recipe Manager API...")
+    response_cache.start()
+    broadcaster.start()
+    job_runner.start()
     yield
     # Shutdown
     print("Shutting down Recipe Manager API...")
+    job_runner.stop()
+    broadcaster.stop()
+    response_cache.stop()
+    for pooled in (async_engine, async_replica_engine):
+        if pooled is not None:
+            await pooled.dispose()
 
 
 app = FastAPI(
@@ -32,11 +53,28 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "X-Next-Cursor",
+        "X-Total-Count",
+        "X-Total-Count-Estimated",
+        "ETag",
+        "Last-Modified",
+    ],
 )
 
+if settings.metrics_enabled:
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.instrument_engine(async_engine.sync_engine if async_engine else engine)
+    if async_replica_engine is not None:
+        metrics.instrument_engine(async_replica_engine.sync_engine, "replica")
+    elif replica_engine is not None:
+        metrics.instrument_engine(replica_engine, "replica")
+
 # Include routers
 app.include_router(recipe_router)
 app.include_router(category_router)
+app.include_router(job_router)
+app.include_router(change_router)
 
 
 @app.get("/")
@@ -50,4 +88,19 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "recipe-manager-api"}
+    return {
+        "status": "healthy",
+        "service": "recipe-manager-api",
+        "database": pool_status(),
+    }
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return response_cache.stats()
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Request, statement and pool metrics in the Prometheus text format"""
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
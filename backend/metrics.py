@@ -0,0 +1,400 @@
+"""Prometheus metrics for HTTP requests and database activity.
+
+Small counters, gauges and histograms rendered in the Prometheus text
+exposition format by GET /metrics, with no client library needed. Recording
+a value is a dict lookup and a few additions under a lock, cheap enough to
+leave on in production. Every worker process keeps its own values, so with
+several workers each one has to be scraped (or its numbers summed).
+"""
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from starlette.routing import Match
+
+from config import settings
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Request latencies from 5 ms to 10 s, statements from 0.5 ms to 5 s
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+    5.0,
+)
+POOL_WAIT_BUCKETS = (0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+STATEMENT_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+# Label for requests no route matched; their paths would be unbounded
+UNMATCHED_ROUTE = "unmatched"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.samples(),
+        ]
+        return "\n".join(lines)
+
+
+class _Scalar(Metric):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Counter(_Scalar):
+    kind = "counter"
+
+
+class Gauge(_Scalar):
+    """A value that goes up and down, or one read when scraped"""
+
+    kind = "gauge"
+
+    def __init__(self, *args, function: Optional[Callable[[], Dict]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Returns {labels: value} at scrape time, instead of stored values
+        self._function = function
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def samples(self) -> Iterable[str]:
+        if self._function is None:
+            yield from super().samples()
+            return
+        for labels, value in self._function().items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float], **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket (non-cumulative) + overflow, sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def count(self, *labels: str) -> int:
+        state = self._values.get(labels)
+        return sum(state[0]) if state else 0
+
+    def sum(self, *labels: str) -> float:
+        state = self._values.get(labels)
+        return state[1] if state else 0.0
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = [
+                (labels, list(counts), total)
+                for labels, (counts, total) in self._values.items()
+            ]
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = _labels(self.labelnames, labels, f'le="{_number(bound)}"')
+                yield f"{self.name}_bucket{le} {cumulative}"
+            base = _labels(self.labelnames, labels)
+            yield f"{self.name}_sum{base} {_number(total)}"
+            yield f"{self.name}_count{base} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+registry = Registry()
+
+REQUESTS = registry.register(
+    Counter(
+        "http_requests_total",
+        "HTTP requests by route and status code",
+        ("method", "route", "status"),
+    )
+)
+REQUEST_DURATION = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "Time from receiving a request to sending the end of its response",
+        ("method", "route"),
+        buckets=REQUEST_BUCKETS,
+    )
+)
+REQUESTS_IN_PROGRESS = registry.register(
+    Gauge(
+        "http_requests_in_progress",
+        "Requests being handled right now",
+        ("method", "route"),
+    )
+)
+REQUEST_STATEMENTS = registry.register(
+    Histogram(
+        "http_request_db_statements",
+        "SQL statements sent while handling one request",
+        ("method", "route"),
+        buckets=STATEMENT_COUNT_BUCKETS,
+    )
+)
+STATEMENT_DURATION = registry.register(
+    Histogram(
+        "db_statement_duration_seconds",
+        "Time to execute one SQL statement, by database and kind of statement",
+        ("database", "operation"),
+        buckets=STATEMENT_BUCKETS,
+    )
+)
+STATEMENT_ERRORS = registry.register(
+    Counter(
+        "db_statement_errors_total",
+        "SQL statements that raised an error",
+        ("database", "operation"),
+    )
+)
+POOL_WAIT = registry.register(
+    Histogram(
+        "db_pool_checkout_seconds",
+        "Time to get a connection from the pool, including opening new ones",
+        ("database",),
+        buckets=POOL_WAIT_BUCKETS,
+    )
+)
+POOL_TIMEOUTS = registry.register(
+    Counter(
+        "db_pool_timeouts_total",
+        "Checkouts that gave up after waiting pool_timeout seconds",
+        ("database",),
+    )
+)
+
+# Engines instrumented so far, for the pool gauges: database label -> pool
+_pools: Dict[str, object] = {}
+
+
+def _pool_values(read: Callable[[object], float]) -> Callable[[], Dict]:
+    def values():
+        return {
+            (database,): read(pool)
+            for database, pool in list(_pools.items())
+            if hasattr(pool, "checkedout")
+        }
+
+    return values
+
+
+def _saturation(pool) -> float:
+    # Share of every connection the pool may open that is in use
+    capacity = pool.size() + max(settings.db_max_overflow, 0)
+    return pool.checkedout() / capacity if capacity else 0.0
+
+
+for _name, _documentation, _read in [
+    ("db_pool_size", "Connections the pool keeps open", lambda p: p.size()),
+    ("db_pool_checked_out", "Connections in use", lambda p: p.checkedout()),
+    (
+        "db_pool_overflow",
+        "Connections open beyond the pool size",
+        lambda p: max(p.overflow(), 0),
+    ),
+    (
+        "db_pool_saturation",
+        "Connections in use over pool_size + max_overflow",
+        _saturation,
+    ),
+]:
+    registry.register(
+        Gauge(_name, _documentation, ("database",), function=_pool_values(_read))
+    )
+
+
+class _RequestStats:
+    __slots__ = ("statements",)
+
+    def __init__(self):
+        self.statements = 0
+
+
+# The request being handled; worker threads running CRUD see it as well,
+# since the threadpool copies the context
+_current_request: ContextVar[Optional[_RequestStats]] = ContextVar(
+    "metrics_request", default=None
+)
+
+_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+
+
+def _operation(statement: str) -> str:
+    word = statement.lstrip()[:6].upper()
+    return word if word in _OPERATIONS else "OTHER"
+
+
+def instrument_engine(engine: Engine, database: str = "primary") -> None:
+    """Time the statements and pool checkouts of a (sync) engine.
+
+    For an AsyncEngine, pass its ``sync_engine``.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        context._metrics_started = time.perf_counter()
+        stats = _current_request.get()
+        if stats is not None:
+            stats.statements += 1
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        started = getattr(context, "_metrics_started", None)
+        if started is not None:
+            STATEMENT_DURATION.observe(
+                time.perf_counter() - started, database, _operation(statement)
+            )
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        if context.statement is not None:
+            STATEMENT_ERRORS.inc(database, _operation(context.statement))
+
+    # The pool has no event before a checkout starts waiting, so its
+    # connect() is wrapped instead
+    pool = engine.pool
+    connect = pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        except PoolTimeout:
+            POOL_TIMEOUTS.inc(database)
+            raise
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - started, database)
+
+    pool.connect = timed_connect
+    _pools[database] = pool
+
+
+def _route(scope) -> str:
+    # The route template, as the router will pick it; a path matched under
+    # another method still names its route (the response is a 405)
+    partial = UNMATCHED_ROUTE
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial == UNMATCHED_ROUTE:
+            partial = route.path
+    return partial
+
+
+class MetricsMiddleware:
+    """Counts and times every HTTP request by method and route template.
+
+    Plain ASGI rather than BaseHTTPMiddleware, so streamed responses are
+    timed to their last chunk and nothing is buffered.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        route = _route(scope)
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        stats = _RequestStats()
+        token = _current_request.set(stats)
+        REQUESTS_IN_PROGRESS.inc(method, route)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_DURATION.observe(time.perf_counter() - started, method, route)
+            REQUESTS_IN_PROGRESS.dec(method, route)
+            REQUESTS.inc(method, route, status)
+            REQUEST_STATEMENTS.observe(stats.statements, method, route)
+            _current_request.reset(token)
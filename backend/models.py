@@ -1,7 +1,53 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Float
-from sqlalchemy.orm import relationship
+from sqlalchemy import (
+    JSON,
+    Boolean,
+    Column,
+    Integer,
+    String,
+    Text,
+    ForeignKey,
+    DateTime,
+    Float,
+    Index,
+    literal_column,
+)
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import relationship, validates
 from sqlalchemy.sql import func
 from database import Base
+from normalization import normalize_ingredient_name
+
+# SQLite keeps timestamps as text. Bind them in the format CURRENT_TIMESTAMP
+# writes (whole seconds) so that values from the server default compare
+# correctly with values sent from Python, such as a pagination cursor's.
+Timestamp = DateTime(timezone=True).with_variant(
+    sqlite.DATETIME(
+        timezone=True,
+        storage_format=(
+            "%(year)04d-%(month)02d-%(day)02d " "%(hour)02d:%(minute)02d:%(second)02d"
+        ),
+    ),
+    "sqlite",
+)
+
+# Sort keys of a recipe without a time, after every real time: above them
+# for ascending sorts and below them (times are never negative) for
+# descending ones. Rendered as literals rather than bound parameters so
+# queries match the expression indexes built on them.
+UNKNOWN_TIME = 2147483647
+UNKNOWN_TIME_DESCENDING = -1
+
+
+def sort_last(expr, descending: bool = False):
+    """Non-null sort key for a nullable time: unknown times sort last"""
+    unknown = UNKNOWN_TIME_DESCENDING if descending else UNKNOWN_TIME
+    return func.coalesce(expr, literal_column(str(unknown)))
+
+
+def total_time_expression(prep_time, cook_time):
+    # The sum if both are known, else whichever is known, else NULL
+    return func.coalesce(prep_time + cook_time, prep_time, cook_time)
 
 
 class Category(Base):
@@ -10,8 +56,10 @@ class Category(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), unique=True, nullable=False, index=True)
     description = Column(Text, nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
+    updated_at = Column(Timestamp, server_default=func.now(), onupdate=func.now())
+    # Incremented on every write; the basis of the HTTP ETag
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     # Relationships
     recipes = relationship("Recipe", back_populates="category")
@@ -28,13 +76,62 @@ class Recipe(Base):
     cook_time = Column(Integer, nullable=True)  # in minutes
     servings = Column(Integer, nullable=True)
     category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
+    updated_at = Column(Timestamp, server_default=func.now(), onupdate=func.now())
+    # Incremented on every write, including ingredient-only edits; the basis
+    # of the HTTP ETag
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
+    @hybrid_property
+    def total_time(self):
+        """Minutes of prep plus cooking; None when neither is known"""
+        if self.prep_time is None and self.cook_time is None:
+            return None
+        return (self.prep_time or 0) + (self.cook_time or 0)
+
+    @total_time.expression
+    def total_time(cls):
+        return total_time_expression(cls.prep_time, cls.cook_time)
 
     # Relationships
     category = relationship("Category", back_populates="recipes")
+    # Kept in the order the client sent; ingredient updates match by position
     ingredients = relationship(
-        "Ingredient", back_populates="recipe", cascade="all, delete-orphan"
+        "Ingredient",
+        back_populates="recipe",
+        cascade="all, delete-orphan",
+        order_by="[Ingredient.position, Ingredient.id]",
+    )
+
+    __table_args__ = (
+        # Keyset pagination within a category seeks on (category_id, id)
+        Index("ix_recipes_category_id_id", "category_id", "id"),
+        # One (sort key, id) index per sort= option, so sorted pages are
+        # index scans in either direction. Time keys are expressions matching
+        # crud.RECIPE_SORT_KEYS exactly, which also serve the range filters,
+        # with a second index per time for descending sorts.
+        Index("ix_recipes_created_at_id", "created_at", "id"),
+        Index("ix_recipes_title_id", "title", "id"),
+        Index("ix_recipes_prep_time_key", sort_last(prep_time), "id"),
+        Index("ix_recipes_cook_time_key", sort_last(cook_time), "id"),
+        Index(
+            "ix_recipes_total_time_key",
+            sort_last(total_time_expression(prep_time, cook_time)),
+            "id",
+        ),
+        Index("ix_recipes_prep_time_desc_key", sort_last(prep_time, True), "id"),
+        Index("ix_recipes_cook_time_desc_key", sort_last(cook_time, True), "id"),
+        Index(
+            "ix_recipes_total_time_desc_key",
+            sort_last(total_time_expression(prep_time, cook_time), True),
+            "id",
+        ),
+        # Browsing a category newest first or by title
+        Index(
+            "ix_recipes_category_id_created_at_id", "category_id", "created_at", "id"
+        ),
+        Index("ix_recipes_category_id_title_id", "category_id", "title", "id"),
+        Index("ix_recipes_servings", "servings"),
     )
 
 
@@ -44,8 +141,71 @@ class Ingredient(Base):
     id = Column(Integer, primary_key=True, index=True)
     recipe_id = Column(Integer, ForeignKey("recipes.id"), nullable=False)
     name = Column(String(200), nullable=False)
+    # Normalized form of name, kept in sync by the validator below
+    name_key = Column(String(200), nullable=False)
     amount = Column(Float, nullable=True)
     unit = Column(String(50), nullable=True)
+    # Place in the recipe's list; rewritten whenever the list is reordered
+    position = Column(Integer, nullable=False, default=0, server_default="0")
 
     # Relationships
     recipe = relationship("Recipe", back_populates="ingredients")
+
+    __table_args__ = (
+        # "Cook with what I have": find recipes containing any given ingredient
+        Index("ix_ingredients_name_key_recipe_id", "name_key", "recipe_id"),
+        # ...then count each candidate recipe's ingredients without a table hit
+        Index("ix_ingredients_recipe_id_name_key", "recipe_id", "name_key"),
+    )
+
+    @validates("name")
+    def _set_name_key(self, key, name):
+        self.name_key = normalize_ingredient_name(name)
+        return name
+
+
+class Job(Base):
+    """A background job and how far it has got; see jobs.py"""
+
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(50), nullable=False)
+    params = Column(JSON, nullable=False)
+    # queued, running, cancelling, succeeded, failed or cancelled
+    status = Column(String(20), nullable=False, default="queued")
+    total = Column(Integer, nullable=True)  # counted when the job first runs
+    processed = Column(Integer, nullable=False, default=0, server_default="0")
+    # Last id processed; a resumed job carries on after it
+    cursor = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(Timestamp, server_default=func.now())
+    started_at = Column(Timestamp, nullable=True)
+    finished_at = Column(Timestamp, nullable=True)
+    # Bumped after every chunk; a running job that stops bumping it has lost
+    # its worker and is taken over by another
+    heartbeat_at = Column(Timestamp, nullable=True)
+
+    __table_args__ = (Index("ix_jobs_status_heartbeat_at", "status", "heartbeat_at"),)
+
+
+class Change(Base):
+    """A write to a recipe or category, numbered in commit order; see changelog.py"""
+
+    __tablename__ = "changes"
+
+    # Assigned from ChangeLogHead, not by a sequence
+    revision = Column(Integer, primary_key=True, autoincrement=False)
+    entity = Column(String(20), nullable=False)  # "recipe" or "category"
+    entity_id = Column(Integer, nullable=False)
+    deleted = Column(Boolean, nullable=False, default=False)
+    created_at = Column(Timestamp, server_default=func.now())
+
+
+class ChangeLogHead(Base):
+    """The single row holding the last revision handed out"""
+
+    __tablename__ = "change_log_head"
+
+    id = Column(Integer, primary_key=True)
+    revision = Column(Integer, nullable=False)
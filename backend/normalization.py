@@ -0,0 +1,35 @@
+import re
+import unicodedata
+
+# Endings that look plural but are not ("asparagus", "couscous", "hummus")
+_KEEP_ENDINGS = ("ss", "us", "is")
+
+
+def _singular(word: str) -> str:
+    if len(word) <= 3 or word.endswith(_KEEP_ENDINGS):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith("oes"):
+        return word[:-2]
+    if word.endswith(("ches", "shes", "xes")):
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def normalize_ingredient_name(name: str) -> str:
+    """Reduce an ingredient name to the key used for ingredient matching.
+
+    Lowercases, folds accents, drops punctuation, collapses whitespace and
+    singularizes the last word, so "Tomatoes", "tomato" and " TOMATO. " all
+    map to "tomato".
+    """
+    text = unicodedata.normalize("NFKD", name)
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    words = re.findall(r"[a-z0-9]+(?:['-][a-z0-9]+)*", text)
+    if not words:
+        return text.strip()
+    words[-1] = _singular(words[-1])
+    return " ".join(words)
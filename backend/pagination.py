@@ -0,0 +1,121 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, literal, or_, tuple_
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded or does not fit the sort"""
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Encode the sort key of the last row of a page as an opaque cursor"""
+    payload = [
+        {"dt": value.isoformat()} if isinstance(value, datetime) else value
+        for value in values
+    ]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """Decode a cursor produced by encode_cursor back into sort key values"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(payload, list):
+            raise ValueError("cursor payload must be a list")
+        return [
+            datetime.fromisoformat(value["dt"]) if isinstance(value, dict) else value
+            for value in payload
+        ]
+    except (ValueError, TypeError, KeyError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}") from e
+
+
+def _fits(expr, value) -> bool:
+    # Whether a decoded cursor value can stand in for the sort key ``expr``
+    try:
+        expected = expr.type.python_type
+    except NotImplementedError:
+        # Untyped expressions such as a search rank: any JSON scalar
+        expected = (int, float, str)
+    if expected is float:
+        expected = (int, float)
+    if isinstance(value, bool) and expected is not bool:
+        return False
+    return isinstance(value, expected)
+
+
+def seek_condition(order_by: Sequence[Tuple[Any, bool]], values: Sequence[Any]):
+    """Build the WHERE clause selecting rows strictly after the given sort key.
+
+    ``order_by`` is a list of ``(expression, descending)`` pairs whose last
+    entry must be a unique column (usually the primary key).
+    """
+    if len(values) != len(order_by):
+        raise InvalidCursor("Cursor does not match the requested sort order")
+    if not all(_fits(expr, value) for (expr, _), value in zip(order_by, values)):
+        raise InvalidCursor("Cursor values do not match the requested sort order")
+
+    directions = {descending for _, descending in order_by}
+    if len(directions) == 1:
+        # Uniform direction: a row-value comparison lets the database walk
+        # the composite index directly.
+        columns = tuple_(*[expr for expr, _ in order_by])
+        # Bind each value with its column's type (and so its dialect format)
+        bound = tuple_(
+            *[literal(v, expr.type) for (expr, _), v in zip(order_by, values)]
+        )
+        if directions.pop():
+            return columns < bound
+        return columns > bound
+
+    # Mixed directions: expand (a, b) > (x, y) into a OR of prefixes.
+    clauses = []
+    for i, (expr, descending) in enumerate(order_by):
+        prefix = [order_by[j][0] == values[j] for j in range(i)]
+        step = expr < values[i] if descending else expr > values[i]
+        clauses.append(and_(*prefix, step))
+    return or_(*clauses)
+
+
+def paginate(
+    query,
+    order_by: Sequence[Tuple[Any, bool]],
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+):
+    """Fetch one page of ``query`` ordered by ``order_by``.
+
+    When ``cursor`` is given the page is located with a keyset seek so its
+    cost does not depend on how deep into the result set it is; otherwise
+    ``skip`` is applied as a plain OFFSET for older clients.
+
+    Returns ``(items, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    # Entity queries yield instances; column queries yield tuples of values
+    descriptions = query.column_descriptions
+    width = len(descriptions)
+    entities = width == 1 and descriptions[0]["expr"] is descriptions[0]["entity"]
+
+    sort_exprs = [expr for expr, _ in order_by]
+    query = query.add_columns(*sort_exprs)
+
+    query = query.order_by(
+        *[expr.desc() if descending else expr.asc() for expr, descending in order_by]
+    )
+    if cursor:
+        query = query.filter(seek_condition(order_by, decode_cursor(cursor)))
+    elif skip:
+        query = query.offset(skip)
+    rows = query.limit(limit).all()
+
+    items = [row[0] if entities else tuple(row[:width]) for row in rows]
+    next_cursor = None
+    if rows and len(rows) == limit:
+        next_cursor = encode_cursor(list(rows[-1][width:]))
+    return items, next_cursor
@@ -0,0 +1,150 @@
+"""EXPLAIN-based checks of the SQL the API sends.
+
+``capture`` records every statement a block of code sends through an engine;
+``explain`` asks the database how it would run one and reduces the answer to
+a QueryPlan: the tables read in full, the indexes used, the sorts the indexes
+could not provide and, on Postgres, the planner's cost and row estimates.
+SQLite's EXPLAIN QUERY PLAN reports no costs, so there only the shape of the
+plan can be checked.
+"""
+import json
+import re
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine
+
+
+@dataclass
+class Statement:
+    sql: str
+    parameters: object  # as passed to the DBAPI cursor
+
+
+@dataclass
+class QueryPlan:
+    sql: str
+    full_scans: Set[str] = field(default_factory=set)  # tables read row by row
+    indexes: Set[str] = field(default_factory=set)  # primary keys as <table>_pkey
+    temp_sorts: int = 0  # ORDER BY / GROUP BY / DISTINCT done by sorting
+    cost: Optional[float] = None  # Postgres only: total cost of the root node
+    rows: Optional[float] = None  # Postgres only: rows the root node returns
+    detail: str = ""  # the plan as the database printed it
+
+    def __str__(self) -> str:
+        return f"{self.sql}\n{self.detail}"
+
+
+_EXPLAINABLE = re.compile(
+    r"^\s*(SELECT|WITH|UPDATE|DELETE|INSERT\b.*\bSELECT)\b", re.I | re.S
+)
+
+
+@contextmanager
+def capture(engine: Engine) -> Iterator[List[Statement]]:
+    """Collect the explainable statements sent through ``engine``.
+
+    Batched statements (executemany) are kept once, with their first set of
+    parameters; plain INSERT ... VALUES is skipped as it has no plan to speak of.
+    """
+    statements: List[Statement] = []
+
+    def before_cursor_execute(conn, cursor, sql, parameters, context, executemany):
+        if not _EXPLAINABLE.match(sql):
+            return
+        if executemany:
+            parameters = parameters[0]
+        statements.append(Statement(sql, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def explain(connection: Connection, statement: Statement) -> QueryPlan:
+    """How the database would run ``statement``, without running it"""
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        return _explain_sqlite(connection, statement)
+    if dialect == "postgresql":
+        return _explain_postgres(connection, statement)
+    raise NotImplementedError(f"no EXPLAIN support for {dialect}")
+
+
+# EXPLAIN QUERY PLAN names a table by its alias when it has one
+_ALIAS = re.compile(r"\b(\w+) AS (\w+)\b", re.I)
+_SQLITE_STEP = re.compile(
+    r"^(SCAN|SEARCH) (\w+)"
+    r"(?: AS \w+)?"
+    r"(?P<how> USING (?:COVERING |AUTOMATIC |PARTIAL )*INDEX (?P<index>\w+)"
+    r"| USING (?:INTEGER )?PRIMARY KEY"
+    r"| VIRTUAL TABLE)?"
+)
+_ORDERED_LIMIT = re.compile(r"\bORDER BY\b.*\bLIMIT\b", re.I | re.S)
+
+
+def _explain_sqlite(connection: Connection, statement: Statement) -> QueryPlan:
+    rows = connection.exec_driver_sql(
+        "EXPLAIN QUERY PLAN " + statement.sql, statement.parameters
+    ).all()
+    details = [row[3] for row in rows]
+    aliases = {alias: table for table, alias in _ALIAS.findall(statement.sql)}
+    plan = QueryPlan(statement.sql, detail="\n".join(details))
+    # "SCAN t" is also how SQLite reports walking a table in rowid order to
+    # produce ORDER BY id ... LIMIT n, stopping after n rows: for the first
+    # table of a limited query sorted without a temporary b-tree, count it
+    # as a primary key scan, as Postgres would report it.
+    ordered_limit = _ORDERED_LIMIT.search(statement.sql) and not any(
+        "ORDER BY" in detail for detail in details if detail.startswith("USE TEMP")
+    )
+    for position, detail in enumerate(details):
+        if detail.startswith("USE TEMP B-TREE"):
+            plan.temp_sorts += 1
+            continue
+        step = _SQLITE_STEP.match(detail)
+        if step is None or step.group(2) == "CONSTANT":
+            continue
+        table = aliases.get(step.group(2), step.group(2))
+        how = step.group("how")
+        if how is None and position == 0 and ordered_limit:
+            plan.indexes.add(f"{table}_pkey")
+        elif how is None or "AUTOMATIC" in how:
+            # An automatic index is built from a full read of the table
+            plan.full_scans.add(table)
+        elif step.group("index"):
+            plan.indexes.add(step.group("index"))
+        elif "VIRTUAL" in how:
+            plan.indexes.add(table)
+        else:
+            plan.indexes.add(f"{table}_pkey")
+    return plan
+
+
+def _explain_postgres(connection: Connection, statement: Statement) -> QueryPlan:
+    result = connection.exec_driver_sql(
+        "EXPLAIN (FORMAT JSON) " + statement.sql, statement.parameters
+    ).scalar()
+    if isinstance(result, str):
+        result = json.loads(result)
+    root = result[0]["Plan"]
+    plan = QueryPlan(
+        statement.sql,
+        cost=root["Total Cost"],
+        rows=root["Plan Rows"],
+        detail=json.dumps(root, indent=2),
+    )
+    nodes = [root]
+    while nodes:
+        node = nodes.pop()
+        if node["Node Type"] == "Seq Scan":
+            plan.full_scans.add(node["Relation Name"])
+        elif node["Node Type"] in ("Sort", "Incremental Sort"):
+            plan.temp_sorts += 1
+        if "Index Name" in node:
+            plan.indexes.add(node["Index Name"])
+        nodes.extend(node.get("Plans", []))
+    return plan
@@ -1,64 +1,494 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import TypeAdapter, ValidationError
 from typing import List, Optional
+import autocomplete
+import bulk_import
+import changelog
 import crud
+import export
+import facets
+import fieldsets
+import jobs
 import schemas
-from database import get_db
+import shopping
+from broadcast import broadcaster
+from cache import (
+    CATEGORY_LISTS,
+    RECIPE_LISTS,
+    category_tag,
+    json_response,
+    recipe_tag,
+    response_cache,
+)
+from conditional import (
+    content_etag,
+    has_conditions,
+    is_not_modified,
+    latest,
+    not_modified_response,
+    validator_headers,
+    version_etag,
+)
+from config import settings
+from database import DBSession, get_db, replica_lag, run_db
+from pagination import InvalidCursor
 
 # Create routers
 recipe_router = APIRouter(prefix="/api/recipes", tags=["recipes"])
 category_router = APIRouter(prefix="/api/categories", tags=["categories"])
+job_router = APIRouter(prefix="/api/jobs", tags=["jobs"])
+change_router = APIRouter(prefix="/api/changes", tags=["changes"])
+
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+# Sent as "true" when X-Total-Count is a planner estimate
+TOTAL_COUNT_ESTIMATED_HEADER = "X-Total-Count-Estimated"
+
+CURSOR_DESCRIPTION = (
+    "Opaque cursor from the previous page's X-Next-Cursor header; "
+    "takes precedence over skip"
+)
+
+category_list_adapter = TypeAdapter(List[schemas.Category])
+
+
+def _respond(request: Request, cached):
+    """Send a serialized response, or 304 if the client's copy is current"""
+    _, headers = cached
+    if is_not_modified(request, headers):
+        return not_modified_response(headers)
+    return json_response(cached)
+
+
+SORT_DESCRIPTION = (
+    "Sort by one of: " + ", ".join(crud.RECIPE_SORT_KEYS) + "; prefix with '-' "
+    "for descending. Recipes without the time sort last."
+)
+SORT_PATTERN = "^-?(" + "|".join(crud.RECIPE_SORT_KEYS) + ")$"
+
+
+def recipe_ranges(
+    min_prep_time: Optional[int] = Query(None, ge=0),
+    max_prep_time: Optional[int] = Query(None, ge=0),
+    min_cook_time: Optional[int] = Query(None, ge=0),
+    max_cook_time: Optional[int] = Query(None, ge=0),
+    min_total_time: Optional[int] = Query(None, ge=0),
+    max_total_time: Optional[int] = Query(None, ge=0),
+    min_servings: Optional[int] = Query(None, ge=0),
+    max_servings: Optional[int] = Query(None, ge=0),
+) -> crud.RangeFilters:
+    """Inclusive min_/max_ filters on times (in minutes) and servings"""
+    bounds = {
+        "prep_time": (min_prep_time, max_prep_time),
+        "cook_time": (min_cook_time, max_cook_time),
+        "total_time": (min_total_time, max_total_time),
+        "servings": (min_servings, max_servings),
+    }
+    return tuple(
+        (field, low, high)
+        for field, (low, high) in bounds.items()
+        if low is not None or high is not None
+    )
+
+
+def _parse_fields(raw: Optional[str], allowed):
+    try:
+        return fieldsets.parse_fields(raw, allowed)
+    except fieldsets.InvalidFields as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _recipe_validators(
+    recipe_id, version, updated_at, category_version, category_updated_at
+):
+    # The detail embeds the category, so its version is part of the ETag
+    return validator_headers(
+        version_etag(recipe_id, version, category_version),
+        latest(updated_at, category_updated_at),
+    )
 
 
 # Recipe endpoints
 @recipe_router.get("/", response_model=List[schemas.RecipeList])
-def list_recipes(
+async def list_recipes(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
     category_id: Optional[int] = Query(None, description="Filter by category ID"),
-    search: Optional[str] = Query(None, description="Search in recipe titles"),
-    db: Session = Depends(get_db),
+    search: Optional[str] = Query(
+        None,
+        description="Full-text search over titles, descriptions, instructions "
+        "and ingredient names, best matches first",
+    ),
+    cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION),
+    sort: Optional[str] = Query(
+        None, pattern=SORT_PATTERN, description=SORT_DESCRIPTION
+    ),
+    ranges: crud.RangeFilters = Depends(recipe_ranges),
+    fields: Optional[str] = Query(None, description=fieldsets.FIELDS_DESCRIPTION),
+    count: Optional[str] = Query(
+        None,
+        pattern="^(exact|estimated)$",
+        description="Send the number of matching recipes in X-Total-Count; "
+        "'estimated' uses the planner's row estimate for the unfiltered list "
+        "of a large table",
+    ),
+    db: DBSession = Depends(get_db),
 ):
     """List all recipes with optional filtering"""
-    recipes = crud.get_recipes(
-        db, skip=skip, limit=limit, category_id=category_id, search=search
+    selected = _parse_fields(fields, fieldsets.RECIPE_LIST_FIELDS)
+    key = (
+        "recipes",
+        skip,
+        limit,
+        category_id,
+        search,
+        cursor,
+        sort,
+        ranges,
+        selected,
+        count,
+    )
+    cached = response_cache.get(key)
+    if cached is not None:
+        return _respond(request, cached)
+
+    generation = response_cache.generation
+    try:
+        body, next_cursor = await run_db(
+            db,
+            crud.get_recipes_page_json,
+            skip=skip,
+            limit=limit,
+            category_id=category_id,
+            search=search,
+            cursor=cursor,
+            fields=selected or fieldsets.RECIPE_LIST_FIELDS,
+            sort=sort,
+            ranges=ranges,
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    count_headers = {}
+    if count:
+        total, estimated = await run_db(
+            db,
+            crud.count_recipes,
+            category_id=category_id,
+            search=search,
+            estimated=count == "estimated",
+            ranges=ranges,
+        )
+        count_headers[TOTAL_COUNT_HEADER] = str(total)
+        if estimated:
+            count_headers[TOTAL_COUNT_ESTIMATED_HEADER] = "true"
+
+    # The total can change while the page itself does not
+    tag_input = body + count_headers.get(TOTAL_COUNT_HEADER, "").encode()
+    headers = {**validator_headers(content_etag(tag_input)), **count_headers}
+    if next_cursor:
+        headers[NEXT_CURSOR_HEADER] = next_cursor
+    response_cache.set(key, body, [RECIPE_LISTS], headers, generation, replica_lag(db))
+    return _respond(request, (body, headers))
+
+
+@recipe_router.get("/facets", response_model=schemas.RecipeFacets)
+async def recipe_facets(
+    request: Request,
+    search: Optional[str] = Query(
+        None, description="Only count recipes matching this full-text search"
+    ),
+    ranges: crud.RangeFilters = Depends(recipe_ranges),
+    db: DBSession = Depends(get_db),
+):
+    """Recipe counts per category, total-time bucket and servings range"""
+    key = ("facets", search, ranges)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return _respond(request, cached)
+
+    generation = response_cache.generation
+    result = await run_db(db, facets.recipe_facets, search=search, ranges=ranges)
+    body = result.model_dump_json().encode()
+    headers = validator_headers(content_etag(body))
+    # Category renames invalidate recipe lists as well
+    response_cache.set(key, body, [RECIPE_LISTS], headers, generation, replica_lag(db))
+    return _respond(request, (body, headers))
+
+
+@recipe_router.get("/autocomplete", response_model=List[schemas.Suggestion])
+async def autocomplete_recipes(
+    q: str = Query(
+        ..., min_length=1, max_length=100, description="What was typed so far"
+    ),
+    kind: Optional[str] = Query(
+        None,
+        pattern="^(" + "|".join(autocomplete.KINDS) + ")$",
+        description="Only suggest recipe titles, ingredient names or units",
+    ),
+    limit: int = Query(10, ge=1, le=50),
+    db: DBSession = Depends(get_db),
+):
+    """Typeahead suggestions: prefix matches first, then word prefixes, then typos"""
+    kinds = (kind,) if kind else autocomplete.KINDS
+    return await run_db(db, autocomplete.suggest, query=q, kinds=kinds, limit=limit)
+
+
+@recipe_router.get("/cook-with", response_model=List[schemas.RecipeMatch])
+async def cook_with(
+    ingredients: str = Query(
+        ..., description="Comma-separated ingredient names you have on hand"
+    ),
+    max_missing: Optional[int] = Query(
+        None, ge=0, description="Only return recipes missing at most this many"
+    ),
+    limit: int = Query(20, ge=1, le=100),
+    db: DBSession = Depends(get_db),
+):
+    """Find recipes you can cook with the given ingredients, best coverage first"""
+    names = [name for name in ingredients.split(",") if name.strip()]
+    return await run_db(
+        db,
+        crud.get_recipes_by_ingredients,
+        ingredient_names=names,
+        limit=limit,
+        max_missing=max_missing,
+    )
+
+
+@recipe_router.get("/export")
+async def export_recipes(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    category_id: Optional[int] = Query(None, description="Filter by category ID"),
+    batch_size: int = Query(500, ge=1, le=10000, description="Rows per fetch"),
+    db: DBSession = Depends(get_db),
+):
+    """Stream every recipe with its category and ingredients as NDJSON or CSV"""
+    if isinstance(db, AsyncSession):
+        body = export.iter_export_async(db, format, category_id, batch_size)
+    else:
+        body = export.iter_export(db, format, category_id, batch_size)
+    return StreamingResponse(
+        body,
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="recipes.{format}"'},
+    )
+
+
+def _parse_ids(raw: str) -> List[int]:
+    try:
+        return [int(part) for part in raw.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail="ids must be comma-separated integers"
+        )
+
+
+async def _recipe_batch(
+    request: Request, ids: List[int], fields: Optional[str], db: DBSession
+):
+    if not ids:
+        raise HTTPException(status_code=400, detail="No recipe ids given")
+    if len(ids) > crud.MAX_BATCH_IDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {crud.MAX_BATCH_IDS} recipe ids per request",
+        )
+    if not all(crud.MIN_RECIPE_ID <= i <= crud.MAX_RECIPE_ID for i in ids):
+        raise HTTPException(
+            status_code=400, detail="Recipe ids must be 32-bit integers"
+        )
+    selected = _parse_fields(fields, fieldsets.RECIPE_FIELDS)
+    key = ("recipe-batch", tuple(ids), selected)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return _respond(request, cached)
+
+    generation = response_cache.generation
+    recipes, missing = await run_db(
+        db, crud.get_recipes_by_ids, recipe_ids=ids, fields=selected
     )
-    return recipes
+    if selected is None:
+        body = (
+            schemas.RecipeBatch.model_validate(
+                {"recipes": recipes, "missing": missing}, from_attributes=True
+            )
+            .model_dump_json()
+            .encode()
+        )
+    else:
+        body = fieldsets.dump_recipe_batch(recipes, missing, selected)
+    headers = validator_headers(content_etag(body))
+    # Every recipe and category write invalidates the recipe lists, which
+    # covers a missing id being created as well
+    response_cache.set(key, body, [RECIPE_LISTS], headers, generation, replica_lag(db))
+    return _respond(request, (body, headers))
+
+
+@recipe_router.get("/batch", response_model=schemas.RecipeBatch)
+async def get_recipes_batch(
+    request: Request,
+    ids: str = Query(..., description="Comma-separated recipe IDs, e.g. 1,2,3"),
+    fields: Optional[str] = Query(None, description=fieldsets.FIELDS_DESCRIPTION),
+    db: DBSession = Depends(get_db),
+):
+    """Get several recipes in the order of their IDs, with the IDs not found"""
+    return await _recipe_batch(request, _parse_ids(ids), fields, db)
 
 
 @recipe_router.get("/{recipe_id}", response_model=schemas.Recipe)
-def get_recipe(recipe_id: int, db: Session = Depends(get_db)):
+async def get_recipe(
+    recipe_id: int,
+    request: Request,
+    fields: Optional[str] = Query(None, description=fieldsets.FIELDS_DESCRIPTION),
+    db: DBSession = Depends(get_db),
+):
     """Get a specific recipe by ID"""
-    recipe = crud.get_recipe(db, recipe_id=recipe_id)
+    selected = _parse_fields(fields, fieldsets.RECIPE_FIELDS)
+    key = ("recipe", recipe_id, selected)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return _respond(request, cached)
+
+    if has_conditions(request):
+        # Revalidate from the version columns alone, without ingredients
+        validators = await run_db(db, crud.get_recipe_validators, recipe_id=recipe_id)
+        if validators is None:
+            raise HTTPException(status_code=404, detail="Recipe not found")
+        headers = _recipe_validators(recipe_id, *validators)
+        if is_not_modified(request, headers):
+            return not_modified_response(headers)
+
+    generation = response_cache.generation
+    recipe = await run_db(db, crud.get_recipe, recipe_id=recipe_id, fields=selected)
     if recipe is None:
         raise HTTPException(status_code=404, detail="Recipe not found")
-    return recipe
+
+    if selected is None:
+        body = schemas.Recipe.model_validate(recipe).model_dump_json().encode()
+    else:
+        body = fieldsets.dump(recipe, selected)
+    tags = [recipe_tag(recipe_id)]
+    if recipe.category_id is not None:
+        tags.append(category_tag(recipe.category_id))
+
+    if selected is None or "category" in selected:
+        category = recipe.category
+        headers = _recipe_validators(
+            recipe_id,
+            recipe.version,
+            recipe.updated_at,
+            category.version if category else None,
+            category.updated_at if category else None,
+        )
+    else:
+        # The category was not loaded, but its version is part of the ETag
+        validators = await run_db(db, crud.get_recipe_validators, recipe_id=recipe_id)
+        if validators is None:
+            raise HTTPException(status_code=404, detail="Recipe not found")
+        headers = _recipe_validators(recipe_id, *validators)
+    response_cache.set(key, body, tags, headers, generation, replica_lag(db))
+    return _respond(request, (body, headers))
 
 
 @recipe_router.post("/", response_model=schemas.Recipe, status_code=201)
-def create_recipe(recipe: schemas.RecipeCreate, db: Session = Depends(get_db)):
+async def create_recipe(recipe: schemas.RecipeCreate, db: DBSession = Depends(get_db)):
     """Create a new recipe"""
     try:
-        return crud.create_recipe(db=db, recipe=recipe)
+        return await run_db(db, crud.create_recipe, recipe=recipe)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@recipe_router.post("/batch", response_model=schemas.RecipeBatch)
+async def post_recipes_batch(
+    request: Request,
+    body: schemas.RecipeIds,
+    fields: Optional[str] = Query(None, description=fieldsets.FIELDS_DESCRIPTION),
+    db: DBSession = Depends(get_db),
+):
+    """Get several recipes, for ID lists too long for a query string"""
+    return await _recipe_batch(request, body.ids, fields, db)
+
+
+@recipe_router.post("/shopping-list", response_model=schemas.ShoppingList)
+async def shopping_list(
+    body: schemas.ShoppingListRequest, db: DBSession = Depends(get_db)
+):
+    """Ingredient totals for a meal plan, scaled to the servings wanted"""
+    if len(body.recipes) > shopping.MAX_RECIPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {shopping.MAX_RECIPES} recipes per shopping list",
+        )
+    return await run_db(db, shopping.shopping_list, items=body.recipes)
+
+
+@recipe_router.post("/import", response_model=schemas.ImportResult)
+async def import_recipes(
+    request: Request,
+    batch_size: int = Query(1000, ge=1, le=10000, description="Rows per INSERT"),
+    db: DBSession = Depends(get_db),
+):
+    """Bulk-import recipes from an NDJSON or JSON array request body.
+
+    Rows are validated as they stream in and inserted in batches; invalid
+    rows are reported by number without failing the rest of the import.
+    """
+    report = bulk_import.ImportReport()
+    batch = []
+    try:
+        async for row, value in bulk_import.iter_rows(request.stream()):
+            try:
+                batch.append((row, bulk_import.parse_row(value)))
+            except ValidationError as e:
+                report.add_error(row, bulk_import.validation_messages(e))
+                continue
+            if len(batch) >= batch_size:
+                await run_db(db, bulk_import.insert_batch, batch, report)
+                batch = []
+    except bulk_import.ImportAborted as e:
+        report.aborted = str(e)
+    if batch:
+        await run_db(db, bulk_import.insert_batch, batch, report)
+    return report.result()
+
+
 @recipe_router.put("/{recipe_id}", response_model=schemas.Recipe)
-def update_recipe(
-    recipe_id: int, recipe: schemas.RecipeUpdate, db: Session = Depends(get_db)
+async def update_recipe(
+    recipe_id: int, recipe: schemas.RecipeUpdate, db: DBSession = Depends(get_db)
 ):
     """Update an existing recipe"""
-    db_recipe = crud.update_recipe(db, recipe_id=recipe_id, recipe=recipe)
+    db_recipe = await run_db(db, crud.update_recipe, recipe_id=recipe_id, recipe=recipe)
+    if db_recipe is None:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    return db_recipe
+
+
+@recipe_router.patch("/{recipe_id}", response_model=schemas.Recipe)
+async def patch_recipe(
+    recipe_id: int, patch: schemas.RecipePatch, db: DBSession = Depends(get_db)
+):
+    """Change only the given fields, and add, update or remove single ingredients"""
+    try:
+        db_recipe = await run_db(
+            db, crud.patch_recipe, recipe_id=recipe_id, patch=patch
+        )
+    except crud.InvalidIngredientOperation as e:
+        raise HTTPException(status_code=422, detail=str(e))
     if db_recipe is None:
         raise HTTPException(status_code=404, detail="Recipe not found")
     return db_recipe
 
 
 @recipe_router.delete("/{recipe_id}", status_code=204)
-def delete_recipe(recipe_id: int, db: Session = Depends(get_db)):
+async def delete_recipe(recipe_id: int, db: DBSession = Depends(get_db)):
     """Delete a recipe"""
-    db_recipe = crud.delete_recipe(db, recipe_id=recipe_id)
+    db_recipe = await run_db(db, crud.delete_recipe, recipe_id=recipe_id)
     if db_recipe is None:
         raise HTTPException(status_code=404, detail="Recipe not found")
     return None
@@ -66,50 +496,218 @@ def delete_recipe(recipe_id: int, db: Session = Depends(get_db)):
 
 # Category endpoints
 @category_router.get("/", response_model=List[schemas.Category])
-def list_categories(
-    skip: int = 0, limit: int = 100, db: Session = Depends(get_db)
+async def list_categories(
+    request: Request,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION),
+    fields: Optional[str] = Query(None, description=fieldsets.FIELDS_DESCRIPTION),
+    db: DBSession = Depends(get_db),
 ):
     """List all categories"""
-    categories = crud.get_categories(db, skip=skip, limit=limit)
-    return categories
+    selected = _parse_fields(fields, fieldsets.CATEGORY_FIELDS)
+    key = ("categories", skip, limit, cursor, selected)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return _respond(request, cached)
+
+    generation = response_cache.generation
+    try:
+        categories, next_cursor = await run_db(
+            db,
+            crud.get_categories_page,
+            skip=skip,
+            limit=limit,
+            cursor=cursor,
+            fields=selected,
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if selected is None:
+        body = category_list_adapter.dump_json(
+            category_list_adapter.validate_python(categories)
+        )
+    else:
+        body = fieldsets.dump_list(categories, selected)
+    headers = validator_headers(content_etag(body))
+    if next_cursor:
+        headers[NEXT_CURSOR_HEADER] = next_cursor
+    response_cache.set(
+        key, body, [CATEGORY_LISTS], headers, generation, replica_lag(db)
+    )
+    return _respond(request, (body, headers))
 
 
 @category_router.get("/{category_id}", response_model=schemas.Category)
-def get_category(category_id: int, db: Session = Depends(get_db)):
+async def get_category(
+    category_id: int,
+    request: Request,
+    fields: Optional[str] = Query(None, description=fieldsets.FIELDS_DESCRIPTION),
+    db: DBSession = Depends(get_db),
+):
     """Get a specific category by ID"""
-    category = crud.get_category(db, category_id=category_id)
+    selected = _parse_fields(fields, fieldsets.CATEGORY_FIELDS)
+    key = ("category", category_id, selected)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return _respond(request, cached)
+
+    if has_conditions(request):
+        validators = await run_db(
+            db, crud.get_category_validators, category_id=category_id
+        )
+        if validators is None:
+            raise HTTPException(status_code=404, detail="Category not found")
+        headers = validator_headers(
+            version_etag(category_id, validators.version), validators.updated_at
+        )
+        if is_not_modified(request, headers):
+            return not_modified_response(headers)
+
+    generation = response_cache.generation
+    category = await run_db(
+        db, crud.get_category, category_id=category_id, fields=selected
+    )
     if category is None:
         raise HTTPException(status_code=404, detail="Category not found")
-    return category
+
+    if selected is None:
+        body = schemas.Category.model_validate(category).model_dump_json().encode()
+    else:
+        body = fieldsets.dump(category, selected)
+    headers = validator_headers(
+        version_etag(category_id, category.version), category.updated_at
+    )
+    response_cache.set(
+        key, body, [category_tag(category_id)], headers, generation, replica_lag(db)
+    )
+    return _respond(request, (body, headers))
 
 
 @category_router.post("/", response_model=schemas.Category, status_code=201)
-def create_category(category: schemas.CategoryCreate, db: Session = Depends(get_db)):
+async def create_category(
+    category: schemas.CategoryCreate, db: DBSession = Depends(get_db)
+):
     """Create a new category"""
     # Check if category with same name already exists
-    db_category = crud.get_category_by_name(db, name=category.name)
+    db_category = await run_db(db, crud.get_category_by_name, name=category.name)
     if db_category:
         raise HTTPException(
             status_code=400, detail="Category with this name already exists"
         )
-    return crud.create_category(db=db, category=category)
+    return await run_db(db, crud.create_category, category=category)
 
 
 @category_router.put("/{category_id}", response_model=schemas.Category)
-def update_category(
-    category_id: int, category: schemas.CategoryUpdate, db: Session = Depends(get_db)
+async def update_category(
+    category_id: int, category: schemas.CategoryUpdate, db: DBSession = Depends(get_db)
 ):
     """Update an existing category"""
-    db_category = crud.update_category(db, category_id=category_id, category=category)
+    db_category = await run_db(
+        db, crud.update_category, category_id=category_id, category=category
+    )
     if db_category is None:
         raise HTTPException(status_code=404, detail="Category not found")
     return db_category
 
 
 @category_router.delete("/{category_id}", status_code=204)
-def delete_category(category_id: int, db: Session = Depends(get_db)):
+async def delete_category(category_id: int, db: DBSession = Depends(get_db)):
     """Delete a category"""
-    db_category = crud.delete_category(db, category_id=category_id)
+    db_category = await run_db(db, crud.delete_category, category_id=category_id)
     if db_category is None:
         raise HTTPException(status_code=404, detail="Category not found")
     return None
+
+
+# Change feed
+@change_router.get("/", response_model=schemas.ChangeFeed)
+async def list_changes(
+    since: Optional[int] = Query(
+        None,
+        ge=0,
+        description="Revision from the previous page's next; 0 for every change "
+        "ever, or leave out to just get the current revision",
+    ),
+    limit: int = Query(100, ge=1, le=1000),
+    db: DBSession = Depends(get_db),
+):
+    """Recipes and categories created, updated or deleted after a revision"""
+    head = await run_db(db, changelog.head)
+    if since is None:
+        return schemas.ChangeFeed(changes=[], next=head, has_more=False)
+    if since > head:
+        raise HTTPException(
+            status_code=410,
+            detail="Revision is ahead of the change log; fetch everything again",
+        )
+    return await run_db(db, crud.get_changes, since=since, limit=limit)
+
+
+@change_router.get("/stream")
+async def stream_changes(
+    category_id: Optional[int] = Query(
+        None, description="Only writes to this category and its recipes"
+    ),
+):
+    """Server-Sent Events for each recipe and category write as it commits.
+
+    Each event's id is its change feed revision: after reconnecting, or on
+    a resync event, catch up with GET /api/changes?since=<last id>.
+    """
+    # No database session: an open stream holds no connection
+    return StreamingResponse(
+        broadcaster.stream(category_id, settings.events_keepalive_seconds),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Background job endpoints
+@job_router.post("/", response_model=schemas.Job, status_code=202)
+async def submit_job(
+    job: schemas.JobCreate, response: Response, db: DBSession = Depends(get_db)
+):
+    """Queue a bulk operation; poll its Location for progress"""
+    if isinstance(job, schemas.RecategorizeJobCreate):
+        to_category_id = job.params.to_category_id
+        if to_category_id is not None and (
+            await run_db(db, crud.get_category, category_id=to_category_id) is None
+        ):
+            raise HTTPException(status_code=404, detail="Category not found")
+    db_job = await run_db(db, jobs.create_job, kind=job.kind, params=job.params)
+    jobs.job_runner.enqueue(db_job.id)
+    response.headers["Location"] = f"{job_router.prefix}/{db_job.id}"
+    return db_job
+
+
+@job_router.get("/", response_model=List[schemas.Job])
+async def list_jobs(
+    status: Optional[str] = Query(None, description="Only jobs in this state"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: DBSession = Depends(get_db),
+):
+    """List jobs, most recent first"""
+    return await run_db(db, jobs.get_jobs, status=status, limit=limit)
+
+
+@job_router.get("/{job_id}", response_model=schemas.Job)
+async def get_job(job_id: int, db: DBSession = Depends(get_db)):
+    """Get a job's state and progress"""
+    db_job = await run_db(db, jobs.get_job, job_id=job_id)
+    if db_job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return db_job
+
+
+@job_router.post("/{job_id}/cancel", response_model=schemas.Job)
+async def cancel_job(job_id: int, db: DBSession = Depends(get_db)):
+    """Cancel a queued job, or stop a running one after its current chunk"""
+    try:
+        db_job = await run_db(db, jobs.cancel_job, job_id=job_id)
+    except jobs.JobFinished as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if db_job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return db_job
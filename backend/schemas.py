@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from pydantic import BaseModel, Field, computed_field, field_validator, model_validator
+from typing import List, Literal, Optional, Union
 from datetime import datetime
 
 
@@ -15,7 +15,31 @@ class IngredientCreate(IngredientBase):
 
 
 class IngredientUpdate(IngredientBase):
-    pass
+    # Id of the existing ingredient this entry replaces; without one,
+    # entries are matched to existing rows by position and name
+    id: Optional[int] = None
+
+
+class IngredientPatch(BaseModel):
+    """Changes to one existing ingredient; omitted fields are left as they are"""
+
+    id: int
+    name: Optional[str] = Field(None, min_length=1, max_length=200)
+    amount: Optional[float] = None
+    unit: Optional[str] = Field(None, max_length=50)
+
+    @field_validator("name")
+    @classmethod
+    def name_not_null(cls, value):
+        if value is None:
+            raise ValueError("name may not be null")
+        return value
+
+
+class IngredientOperations(BaseModel):
+    add: List[IngredientCreate] = []
+    update: List[IngredientPatch] = []
+    remove: List[int] = []
 
 
 class Ingredient(IngredientBase):
@@ -50,6 +74,13 @@ class Category(CategoryBase):
 
 
 # Recipe Schemas
+def total_minutes(prep_time: Optional[int], cook_time: Optional[int]) -> Optional[int]:
+    """Minutes of prep plus cooking; None when neither is known"""
+    if prep_time is None and cook_time is None:
+        return None
+    return (prep_time or 0) + (cook_time or 0)
+
+
 class RecipeBase(BaseModel):
     title: str = Field(..., min_length=1, max_length=200)
     description: Optional[str] = None
@@ -65,7 +96,27 @@ class RecipeCreate(RecipeBase):
 
 
 class RecipeUpdate(RecipeBase):
-    ingredients: Optional[List[IngredientCreate]] = None
+    ingredients: Optional[List[IngredientUpdate]] = None
+
+
+class RecipePatch(BaseModel):
+    """Partial recipe update: only the fields sent are changed"""
+
+    title: Optional[str] = Field(None, min_length=1, max_length=200)
+    description: Optional[str] = None
+    instructions: Optional[str] = Field(None, min_length=1)
+    prep_time: Optional[int] = Field(None, ge=0)
+    cook_time: Optional[int] = Field(None, ge=0)
+    servings: Optional[int] = Field(None, ge=1)
+    category_id: Optional[int] = None
+    ingredients: Optional[IngredientOperations] = None
+
+    @field_validator("title", "instructions")
+    @classmethod
+    def required_not_null(cls, value, info):
+        if value is None:
+            raise ValueError(f"{info.field_name} may not be null")
+        return value
 
 
 class Recipe(RecipeBase):
@@ -75,6 +126,11 @@ class Recipe(RecipeBase):
     category: Optional[Category] = None
     ingredients: List[Ingredient] = []
 
+    @computed_field
+    @property
+    def total_time(self) -> Optional[int]:
+        return total_minutes(self.prep_time, self.cook_time)
+
     class Config:
         from_attributes = True
 
@@ -89,5 +145,171 @@ class RecipeList(BaseModel):
     category: Optional[Category] = None
     created_at: datetime
 
+    @computed_field
+    @property
+    def total_time(self) -> Optional[int]:
+        return total_minutes(self.prep_time, self.cook_time)
+
+    class Config:
+        from_attributes = True
+
+
+class RecipeMatch(BaseModel):
+    """A recipe ranked by how well it is covered by the ingredients on hand"""
+
+    recipe: RecipeList
+    matched_count: int
+    missing_count: int
+    missing_ingredients: List[str] = []
+
+
+class RecipeIds(BaseModel):
+    ids: List[int] = Field(..., min_length=1)
+
+
+class RecipeBatch(BaseModel):
+    """Recipes in the order their ids were asked for, and the ids not found"""
+
+    recipes: List[Recipe]
+    missing: List[int] = []
+
+
+class ShoppingListRecipe(BaseModel):
+    recipe_id: int
+    # Servings to buy for; None keeps the recipe's own
+    servings: Optional[int] = Field(None, gt=0)
+
+
+class ShoppingListRequest(BaseModel):
+    recipes: List[ShoppingListRecipe] = Field(..., min_length=1)
+
+
+class ShoppingItem(BaseModel):
+    name: str
+    amount: Optional[float] = None
+    unit: Optional[str] = None
+
+
+class ShoppingList(BaseModel):
+    """Merged ingredient totals, and the recipe ids not found"""
+
+    items: List[ShoppingItem]
+    missing: List[int] = []
+
+
+class ImportRowError(BaseModel):
+    row: int
+    errors: List[str]
+
+
+class ImportResult(BaseModel):
+    """Outcome of a bulk import; rows are numbered from 1"""
+
+    inserted: int
+    failed: int
+    errors: List[ImportRowError] = []
+    errors_truncated: bool = False
+    aborted: Optional[str] = None
+
+
+class FacetBucket(BaseModel):
+    """Recipes with a value in [min, max); a missing bound is open-ended"""
+
+    label: str
+    min: Optional[int] = None
+    max: Optional[int] = None
+    count: int
+
+
+class Suggestion(BaseModel):
+    text: str
+    kind: str  # "title", "ingredient" or "unit"
+    count: int  # recipes (titles, ingredients) or ingredient lines (units)
+
+
+class CategoryFacet(BaseModel):
+    category_id: Optional[int] = None  # None counts uncategorized recipes
+    name: Optional[str] = None
+    count: int
+
+
+class RecipeFacets(BaseModel):
+    total: int
+    categories: List[CategoryFacet] = []
+    total_time: List[FacetBucket] = []
+    servings: List[FacetBucket] = []
+
+
+# Change feed schemas
+class Change(BaseModel):
+    revision: int
+    type: str  # "recipe" or "category"
+    id: int
+    deleted: bool = False
+    # The current state of an upserted recipe or category
+    recipe: Optional[Recipe] = None
+    category: Optional[Category] = None
+
+
+class ChangeFeed(BaseModel):
+    changes: List[Change]
+    next: int  # since= for the next page
+    has_more: bool
+
+
+# Background job schemas
+class ReindexParams(BaseModel):
+    """Rebuild the search entries of every recipe"""
+
+
+class RecategorizeParams(BaseModel):
+    """Move recipes from one category (None: uncategorized) to another"""
+
+    from_category_id: Optional[int] = None
+    # Only recipes matching this full-text search
+    search: Optional[str] = None
+    to_category_id: Optional[int] = None
+
+    @model_validator(mode="after")
+    def _check_categories(self):
+        if self.from_category_id == self.to_category_id:
+            raise ValueError("from_category_id and to_category_id are the same")
+        return self
+
+
+class ReindexJobCreate(BaseModel):
+    kind: Literal["reindex"]
+    params: ReindexParams = ReindexParams()
+
+
+class RecategorizeJobCreate(BaseModel):
+    kind: Literal["recategorize"]
+    params: RecategorizeParams
+
+
+# Told apart by their kind literals
+JobCreate = Union[ReindexJobCreate, RecategorizeJobCreate]
+
+
+class Job(BaseModel):
+    id: int
+    kind: str
+    params: dict
+    status: str
+    total: Optional[int] = None
+    processed: int
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    @computed_field
+    @property
+    def progress(self) -> Optional[float]:
+        """Share of the work done, from 0 to 1, once the total is known"""
+        if self.total is None:
+            return None
+        return min(self.processed / self.total, 1.0) if self.total else 1.0
+
     class Config:
         from_attributes = True
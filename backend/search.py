@@ -0,0 +1,179 @@
+"""Full-text search over recipes.
+
+Postgres keeps a weighted ``tsvector`` in ``recipes.search_vector`` behind a
+GIN index; SQLite (used by the tests) keeps an FTS5 table ``recipes_fts``
+keyed by recipe id. Both are maintained by the CRUD layer whenever a recipe
+or its ingredients are written, and both rank matches best-first.
+"""
+import re
+from typing import Iterable, List
+
+from sqlalchemy import DDL, bindparam, column, event, false, func, literal_column
+from sqlalchemy import cast, table, text
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION
+from sqlalchemy.orm import Session
+
+import models
+
+TS_CONFIG = "english"
+
+FTS_TABLE = "recipes_fts"
+
+# Relative importance of each field when ranking matches
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 4.0
+INGREDIENTS_WEIGHT = 4.0
+INSTRUCTIONS_WEIGHT = 1.0
+
+recipes_fts = table(
+    FTS_TABLE,
+    column("rowid"),
+    column("title"),
+    column("description"),
+    column("instructions"),
+    column("ingredients"),
+)
+
+# Postgres: weighted tsvector of title (A), description and ingredient names
+# (B) and instructions (C), computed for the recipes bound to :ids.
+POSTGRES_REINDEX = text(
+    f"""
+    UPDATE recipes AS r SET search_vector =
+        setweight(to_tsvector('{TS_CONFIG}', coalesce(r.title, '')), 'A') ||
+        setweight(to_tsvector('{TS_CONFIG}', coalesce(r.description, '')), 'B') ||
+        setweight(to_tsvector('{TS_CONFIG}', coalesce(i.names, '')), 'B') ||
+        setweight(to_tsvector('{TS_CONFIG}', coalesce(r.instructions, '')), 'C')
+    FROM (
+        SELECT rr.id, string_agg(ing.name, ' ') AS names
+        FROM recipes AS rr
+        LEFT JOIN ingredients AS ing ON ing.recipe_id = rr.id
+        WHERE rr.id IN :ids
+        GROUP BY rr.id
+    ) AS i
+    WHERE r.id = i.id
+    """
+).bindparams(bindparam("ids", expanding=True))
+
+SQLITE_DELETE = text(f"DELETE FROM {FTS_TABLE} WHERE rowid IN :ids").bindparams(
+    bindparam("ids", expanding=True)
+)
+
+SQLITE_INSERT = text(
+    f"""
+    INSERT INTO {FTS_TABLE} (rowid, title, description, instructions, ingredients)
+    SELECT r.id, r.title, coalesce(r.description, ''), r.instructions,
+           coalesce((SELECT group_concat(ing.name, ' ')
+                     FROM ingredients AS ing
+                     WHERE ing.recipe_id = r.id), '')
+    FROM recipes AS r
+    WHERE r.id IN :ids
+    """
+).bindparams(bindparam("ids", expanding=True))
+
+# Schema objects for databases built with Base.metadata.create_all (tests,
+# fresh installs); existing databases get them from migration 003.
+event.listen(
+    models.Recipe.__table__,
+    "after_create",
+    DDL(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        "title, description, instructions, ingredients, "
+        "tokenize='porter unicode61 remove_diacritics 2')"
+    ).execute_if(dialect="sqlite"),
+)
+event.listen(
+    models.Recipe.__table__,
+    "before_drop",
+    DDL(f"DROP TABLE IF EXISTS {FTS_TABLE}").execute_if(dialect="sqlite"),
+)
+event.listen(
+    models.Recipe.__table__,
+    "after_create",
+    DDL("ALTER TABLE recipes ADD COLUMN search_vector tsvector").execute_if(
+        dialect="postgresql"
+    ),
+)
+event.listen(
+    models.Recipe.__table__,
+    "after_create",
+    DDL(
+        "CREATE INDEX ix_recipes_search_vector ON recipes USING GIN (search_vector)"
+    ).execute_if(dialect="postgresql"),
+)
+
+
+def _dialect(db: Session) -> str:
+    return db.get_bind().dialect.name
+
+
+def tokenize(search: str) -> List[str]:
+    """Split a user search string into lowercase word tokens"""
+    return re.findall(r"\w+", search.lower())
+
+
+def index_recipes(db: Session, recipe_ids: Iterable[int]) -> None:
+    """Refresh the search entries of the given recipes.
+
+    Must run in the same transaction as the write it reflects, after the
+    recipe and ingredient rows have been flushed.
+    """
+    ids = list(recipe_ids)
+    if not ids:
+        return
+    dialect = _dialect(db)
+    if dialect == "postgresql":
+        db.execute(POSTGRES_REINDEX, {"ids": ids})
+    elif dialect == "sqlite":
+        db.execute(SQLITE_DELETE, {"ids": ids})
+        db.execute(SQLITE_INSERT, {"ids": ids})
+
+
+def remove_recipes(db: Session, recipe_ids: Iterable[int]) -> None:
+    """Drop the search entries of deleted recipes"""
+    ids = list(recipe_ids)
+    if ids and _dialect(db) == "sqlite":
+        db.execute(SQLITE_DELETE, {"ids": ids})
+
+
+def apply_search(db: Session, query, search: str):
+    """Restrict a Recipe query to full-text matches of ``search``.
+
+    Every token is matched as a prefix, so partial words typed into the
+    search box still hit. Returns ``(query, score)`` where ``score`` sorts
+    the best match first when ordered ascending.
+    """
+    tokens = tokenize(search)
+    dialect = _dialect(db)
+
+    if not tokens:
+        return query.filter(false()), models.Recipe.id
+
+    if dialect == "postgresql":
+        ts_query = func.to_tsquery(
+            TS_CONFIG, " & ".join(f"{token}:*" for token in tokens)
+        )
+        search_vector = literal_column("recipes.search_vector")
+        # ts_rank_cd is a float4, which a cursor's float8 never equals; as a
+        # double the rank comes back from the cursor exactly
+        score = -cast(func.ts_rank_cd(search_vector, ts_query), DOUBLE_PRECISION)
+        return query.filter(search_vector.op("@@")(ts_query)), score
+
+    if dialect == "sqlite":
+        match = " ".join(f'"{token}"*' for token in tokens)
+        score = func.bm25(
+            literal_column(FTS_TABLE),
+            TITLE_WEIGHT,
+            DESCRIPTION_WEIGHT,
+            INSTRUCTIONS_WEIGHT,
+            INGREDIENTS_WEIGHT,
+        )
+        query = query.join(
+            recipes_fts, recipes_fts.c.rowid == models.Recipe.id
+        ).filter(literal_column(FTS_TABLE).op("MATCH")(match))
+        return query, score
+
+    # Other databases: fall back to a title substring match
+    return (
+        query.filter(func.lower(models.Recipe.title).contains(search.lower())),
+        models.Recipe.id,
+    )
@@ -0,0 +1,193 @@
+"""Shopping lists: merged ingredient totals for a set of recipes.
+
+Each recipe is scaled from its own servings to the servings wanted, and the
+ingredients of the whole plan are summed in one aggregate query grouped by
+normalized name and unit. The grouped rows, one per name and unit spelling,
+are then merged across convertible units in Python.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+
+# Recipes one shopping list may combine
+MAX_RECIPES = 500
+
+
+@dataclass(frozen=True)
+class Unit:
+    name: str
+    dimension: str  # units of one dimension convert into each other
+    size: float  # in the dimension's base unit: grams or millilitres
+    system: str  # totals are shown in the system their units came from
+
+
+UNITS = [
+    Unit("mg", "mass", 0.001, "metric"),
+    Unit("g", "mass", 1.0, "metric"),
+    Unit("kg", "mass", 1000.0, "metric"),
+    Unit("ml", "volume", 1.0, "metric"),
+    Unit("l", "volume", 1000.0, "metric"),
+    Unit("tsp", "volume", 4.92892, "us"),
+    Unit("tbsp", "volume", 14.78676, "us"),
+    Unit("cup", "volume", 236.58824, "us"),
+]
+
+# Spellings of each unit, lowercased
+ALIASES = {
+    "milligram": "mg",
+    "milligrams": "mg",
+    "gram": "g",
+    "grams": "g",
+    "gr": "g",
+    "kilogram": "kg",
+    "kilograms": "kg",
+    "kgs": "kg",
+    "millilitre": "ml",
+    "millilitres": "ml",
+    "milliliter": "ml",
+    "milliliters": "ml",
+    "litre": "l",
+    "litres": "l",
+    "liter": "l",
+    "liters": "l",
+    "teaspoon": "tsp",
+    "teaspoons": "tsp",
+    "tsps": "tsp",
+    "tablespoon": "tbsp",
+    "tablespoons": "tbsp",
+    "tbsps": "tbsp",
+    "tbs": "tbsp",
+    "cups": "cup",
+}
+
+_UNITS = {unit.name: unit for unit in UNITS}
+# Units a total may be shown in, smallest first, per (dimension, system)
+_LADDERS: Dict[Tuple[str, str], List[Unit]] = {}
+for _unit in sorted(UNITS, key=lambda unit: unit.size):
+    _LADDERS.setdefault((_unit.dimension, _unit.system), []).append(_unit)
+
+
+def find_unit(unit: Optional[str]) -> Optional[Unit]:
+    """The known unit ``unit`` spells, or None"""
+    if not unit:
+        return None
+    name = unit.strip().lower().rstrip(".")
+    return _UNITS.get(ALIASES.get(name, name))
+
+
+def display(total: float, dimension: str, systems: set) -> Tuple[float, str]:
+    """A total in base units, in the largest unit it makes at least 1 of.
+
+    Amounts from one system stay in it; a mix is shown in metric.
+    """
+    system = next(iter(systems)) if len(systems) == 1 else "metric"
+    ladder = _LADDERS[(dimension, system)]
+    unit = ladder[0]
+    for candidate in ladder:
+        if total >= candidate.size:
+            unit = candidate
+    return total / unit.size, unit.name
+
+
+@dataclass
+class _Line:
+    """One line of the list while it is being summed"""
+
+    name: str
+    dimension: Optional[str] = None  # for amounts in known units
+    unit: Optional[str] = None  # for any other unit, as written
+    total: Optional[float] = None  # in the dimension's base unit if known
+    systems: set = field(default_factory=set)
+
+    def add(self, amount: float, unit: Optional[Unit]) -> None:
+        self.total = (self.total or 0.0) + amount
+        if unit:
+            self.systems.add(unit.system)
+
+    def item(self) -> schemas.ShoppingItem:
+        amount, unit = self.total, self.unit
+        if amount is not None and self.dimension:
+            amount, unit = display(amount, self.dimension, self.systems)
+        return schemas.ShoppingItem(
+            name=self.name,
+            amount=None if amount is None else round(amount, 2),
+            unit=unit,
+        )
+
+
+def recipe_scales(
+    db: Session, items: Sequence[schemas.ShoppingListRecipe]
+) -> Tuple[Dict[int, float], List[int]]:
+    """Factor to multiply each recipe's amounts by, and the ids not found.
+
+    A recipe listed more than once is bought for every listing; one without
+    target servings, or without servings of its own, is bought once as is.
+    """
+    ids = list(dict.fromkeys(item.recipe_id for item in items))
+    servings = dict(
+        db.execute(
+            select(models.Recipe.id, models.Recipe.servings).where(
+                models.Recipe.id.in_(ids)
+            )
+        ).all()
+    )
+    scales: Dict[int, float] = {}
+    for item in items:
+        if item.recipe_id not in servings:
+            continue
+        own = servings[item.recipe_id]
+        factor = item.servings / own if item.servings and own else 1.0
+        scales[item.recipe_id] = scales.get(item.recipe_id, 0.0) + factor
+    return scales, [i for i in ids if i not in servings]
+
+
+def shopping_list(
+    db: Session, items: Sequence[schemas.ShoppingListRecipe]
+) -> schemas.ShoppingList:
+    """Ingredient totals for ``items``, sorted by name.
+
+    Amounts in known units are converted and summed per dimension, so
+    "1 kg" and "500 g" of flour make "1.5 kg"; mass and volume of the same
+    ingredient stay separate lines, as do unknown units. An ingredient with
+    no amount anywhere in the plan is listed with amount None.
+    """
+    scales, missing = recipe_scales(db, items)
+    if not scales:
+        return schemas.ShoppingList(items=[], missing=missing)
+
+    Ingredient = models.Ingredient
+    unit = func.lower(func.trim(Ingredient.unit))
+    scale = case(scales, value=Ingredient.recipe_id, else_=0.0)
+    rows = db.execute(
+        select(
+            Ingredient.name_key,
+            func.min(Ingredient.name),
+            unit,
+            func.sum(Ingredient.amount * scale),
+        )
+        .where(Ingredient.recipe_id.in_(list(scales)))
+        .group_by(Ingredient.name_key, unit)
+    ).all()
+
+    lines: Dict[Tuple[str, Optional[str], Optional[str]], _Line] = {}
+    for name_key, name, unit_name, total in rows:
+        known = find_unit(unit_name)
+        if known:
+            line = _Line(name, dimension=known.dimension)
+        else:
+            line = _Line(name, unit=unit_name or None)
+        line = lines.setdefault((name_key, line.dimension, line.unit), line)
+        line.name = min(line.name, name)
+        if total is not None:
+            line.add(total * known.size if known else total, known)
+
+    result = sorted(
+        (line.item() for line in lines.values()),
+        key=lambda item: (item.name.lower(), item.unit or ""),
+    )
+    return schemas.ShoppingList(items=result, missing=missing)
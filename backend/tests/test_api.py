@@ -1,12 +1,42 @@
+import asyncio
+import csv
+import io
+import json
+import os
+import sqlite3
+import threading
+from typing import List
+
 import pytest
+from fastapi import Request, Response
 from fastapi.testclient import TestClient
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import autocomplete
+import bulk_import
+import crud
+import jobs
+import metrics
+import schemas
+from autocomplete import memory_indexes
+from cache import response_cache
+from conftest import TestingSessionLocal, count_queries
+from database import Base, ReplicaSession, SessionRouter, get_db
+from main import app
+from pagination import encode_cursor
 
 
 def test_health_check(client: TestClient):
     """Test the health check endpoint"""
     response = client.get("/health")
     assert response.status_code == 200
-    assert response.json() == {"status": "healthy", "service": "recipe-manager-api"}
+    data = response.json()
+    assert data["status"] == "healthy"
+    assert data["service"] == "recipe-manager-api"
+    assert "checked_out" in data["database"]
+    assert "overflow" in data["database"]
 
 
 def test_root(client: TestClient):
@@ -35,7 +65,8 @@ class TestCategories:
         """Test getting all categories"""
         # Create a category first
         client.post(
-            "/api/categories", json={"name": "Breakfast", "description": "Morning meals"}
+            "/api/categories",
+            json={"name": "Breakfast", "description": "Morning meals"},
         )
 
         response = client.get("/api/categories")
@@ -132,6 +163,140 @@ class TestRecipes:
         assert data["title"] == "New Title"
         assert data["instructions"] == "New instructions"
 
+    def test_update_recipe_keeps_unchanged_ingredients(self, client: TestClient):
+        """Test that PUT only rewrites the ingredients that changed"""
+        recipe_data = {
+            "title": "Stew",
+            "instructions": "Simmer",
+            "ingredients": [
+                {"name": "Carrot", "amount": 2, "unit": "pcs"},
+                {"name": "Onion", "amount": 1, "unit": "pcs"},
+                {"name": "Beef", "amount": 500, "unit": "g"},
+            ],
+        }
+        created = client.post("/api/recipes", json=recipe_data).json()
+        ids = {i["name"]: i["id"] for i in created["ingredients"]}
+
+        update_data = {
+            "title": "Stew",
+            "instructions": "Simmer",
+            "ingredients": [
+                {"name": "Carrot", "amount": 3, "unit": "pcs"},
+                {"name": "Beef", "amount": 500, "unit": "g"},
+                {"name": "Potato", "amount": 4, "unit": "pcs"},
+            ],
+        }
+        response = client.put(f"/api/recipes/{created['id']}", json=update_data)
+        assert response.status_code == 200
+        ingredients = {i["name"]: i for i in response.json()["ingredients"]}
+        assert set(ingredients) == {"Carrot", "Beef", "Potato"}
+        assert ingredients["Carrot"]["id"] == ids["Carrot"]
+        assert ingredients["Carrot"]["amount"] == 3
+        assert ingredients["Beef"]["id"] == ids["Beef"]
+        assert ingredients["Potato"]["id"] not in ids.values()
+
+        # Renaming by id keeps the row
+        update_data["ingredients"][0] = {"id": ids["Carrot"], "name": "Carrots"}
+        response = client.put(f"/api/recipes/{created['id']}", json=update_data)
+        renamed = [i for i in response.json()["ingredients"] if i["name"] == "Carrots"]
+        assert renamed[0]["id"] == ids["Carrot"]
+
+    def test_update_recipe_reorders_ingredients(self, client: TestClient):
+        """Test that PUT keeps the ingredient order it was sent"""
+        recipe_data = {
+            "title": "Pancakes",
+            "instructions": "Whisk and fry",
+            "ingredients": [{"name": "Flour"}, {"name": "Milk"}],
+        }
+        created = client.post("/api/recipes", json=recipe_data).json()
+        ids = {i["name"]: i["id"] for i in created["ingredients"]}
+        url = f"/api/recipes/{created['id']}"
+
+        recipe_data["ingredients"].reverse()
+        response = client.put(url, json=recipe_data)
+        assert [(i["name"], i["id"]) for i in response.json()["ingredients"]] == [
+            ("Milk", ids["Milk"]),
+            ("Flour", ids["Flour"]),
+        ]
+
+        recipe_data["ingredients"].insert(1, {"name": "Egg"})
+        response = client.put(url, json=recipe_data)
+        names = ["Milk", "Egg", "Flour"]
+        assert [i["name"] for i in response.json()["ingredients"]] == names
+        assert [i["name"] for i in client.get(url).json()["ingredients"]] == names
+        assert response.json()["ingredients"][2]["id"] == ids["Flour"]
+
+    def test_unchanged_update_keeps_etag(self, client: TestClient):
+        """Test that a PUT changing nothing does not bump the version"""
+        recipe_data = {
+            "title": "Toast",
+            "instructions": "Toast it",
+            "ingredients": [{"name": "Bread", "amount": 1, "unit": "slice"}],
+        }
+        recipe_id = client.post("/api/recipes", json=recipe_data).json()["id"]
+        etag = client.get(f"/api/recipes/{recipe_id}").headers["etag"]
+
+        client.put(f"/api/recipes/{recipe_id}", json=recipe_data)
+        assert client.get(f"/api/recipes/{recipe_id}").headers["etag"] == etag
+
+    def test_patch_recipe(self, client: TestClient):
+        """Test changing single fields and ingredients with PATCH"""
+        recipe_data = {
+            "title": "Salad",
+            "description": "Fresh",
+            "instructions": "Toss",
+            "servings": 2,
+            "ingredients": [
+                {"name": "Lettuce", "amount": 1, "unit": "head"},
+                {"name": "Tomato", "amount": 2, "unit": "pcs"},
+            ],
+        }
+        created = client.post("/api/recipes", json=recipe_data).json()
+        lettuce, tomato = created["ingredients"]
+
+        response = client.patch(
+            f"/api/recipes/{created['id']}",
+            json={
+                "description": None,
+                "servings": 4,
+                "ingredients": {
+                    "add": [{"name": "Cucumber", "amount": 1}],
+                    "update": [{"id": lettuce["id"], "amount": 2}],
+                    "remove": [tomato["id"]],
+                },
+            },
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["title"] == "Salad"
+        assert data["description"] is None
+        assert data["servings"] == 4
+        assert [i["name"] for i in data["ingredients"]] == ["Lettuce", "Cucumber"]
+        assert data["ingredients"][0]["id"] == lettuce["id"]
+        assert data["ingredients"][0]["amount"] == 2
+        assert data["ingredients"][0]["unit"] == "head"
+
+        # The search index follows ingredient changes
+        response = client.get("/api/recipes", params={"search": "cucumber"})
+        assert [r["id"] for r in response.json()] == [created["id"]]
+
+    def test_patch_recipe_invalid(self, client: TestClient):
+        """Test PATCH errors"""
+        recipe_data = {"title": "Soup", "instructions": "Boil", "ingredients": []}
+        recipe_id = client.post("/api/recipes", json=recipe_data).json()["id"]
+
+        response = client.patch(f"/api/recipes/{recipe_id}", json={"title": None})
+        assert response.status_code == 422
+
+        response = client.patch(
+            f"/api/recipes/{recipe_id}",
+            json={"ingredients": {"remove": [999]}},
+        )
+        assert response.status_code == 422
+
+        response = client.patch("/api/recipes/999", json={"title": "Nope"})
+        assert response.status_code == 404
+
     def test_delete_recipe(self, client: TestClient):
         """Test deleting a recipe"""
         # Create a recipe
@@ -182,3 +347,1671 @@ class TestRecipes:
         data = response.json()
         assert len(data) > 0
         assert any("Chocolate" in r["title"] for r in data)
+
+
+class TestRecipeBatch:
+    """Test fetching several recipes at once"""
+
+    def _seed(self, client: TestClient, count: int) -> List[int]:
+        category = client.post("/api/categories", json={"name": "Mains"})
+        category_id = category.json()["id"]
+        return [
+            client.post(
+                "/api/recipes",
+                json={
+                    "title": f"Recipe {i}",
+                    "instructions": "Cook",
+                    "category_id": category_id,
+                    "ingredients": [{"name": "salt"}, {"name": "pepper"}],
+                },
+            ).json()["id"]
+            for i in range(count)
+        ]
+
+    def test_keeps_order_and_reports_missing(self, client: TestClient):
+        """Test recipes come back as asked, missing ids listed, duplicates once"""
+        first, second, third = self._seed(client, 3)
+
+        response = client.get(f"/api/recipes/batch?ids={third},999,{first},{third}")
+        assert response.status_code == 200
+        data = response.json()
+        assert [r["id"] for r in data["recipes"]] == [third, first]
+        assert data["missing"] == [999]
+        assert data["recipes"][0]["category"]["name"] == "Mains"
+        assert len(data["recipes"][0]["ingredients"]) == 2
+
+    def test_post_body(self, client: TestClient):
+        """Test the POST form returns the same as the query string form"""
+        ids = self._seed(client, 2)
+
+        posted = client.post("/api/recipes/batch", json={"ids": ids[::-1]})
+        assert posted.status_code == 200
+        got = client.get(f"/api/recipes/batch?ids={ids[1]},{ids[0]}")
+        assert posted.json() == got.json()
+
+    def test_constant_query_count(self, client: TestClient, assert_max_queries):
+        """Test recipes, categories and ingredients load in two queries"""
+        ids = self._seed(client, 30)
+
+        with assert_max_queries(2):
+            response = client.post("/api/recipes/batch", json={"ids": ids})
+        assert len(response.json()["recipes"]) == 30
+
+    def test_fields(self, client: TestClient):
+        """Test ?fields= trims every recipe in the batch"""
+        ids = self._seed(client, 2)
+
+        response = client.get(f"/api/recipes/batch?ids={ids[0]},0&fields=id,title")
+        assert response.json() == {
+            "recipes": [{"id": ids[0], "title": "Recipe 0"}],
+            "missing": [0],
+        }
+
+    def test_sees_writes(self, client: TestClient):
+        """Test a cached batch is invalidated by changes to its recipes"""
+        recipe_id = self._seed(client, 1)[0]
+        url = f"/api/recipes/batch?ids={recipe_id},{recipe_id + 1}"
+        assert client.get(url).json()["missing"] == [recipe_id + 1]
+
+        client.patch(f"/api/recipes/{recipe_id}", json={"title": "Renamed"})
+        client.post("/api/recipes", json={"title": "New", "instructions": "Cook"})
+
+        data = client.get(url).json()
+        assert [r["title"] for r in data["recipes"]] == ["Renamed", "New"]
+        assert data["missing"] == []
+
+    @pytest.mark.parametrize(
+        "ids",
+        [
+            "",
+            "1,x",
+            ",".join(str(i) for i in range(crud.MAX_BATCH_IDS + 1)),
+            "1,99999999999999999999999",
+        ],
+        ids=["empty", "not_integers", "too_many", "out_of_range"],
+    )
+    def test_invalid_ids(self, client: TestClient, ids: str):
+        """Test malformed or oversized id lists are rejected"""
+        response = client.get(f"/api/recipes/batch?ids={ids}")
+        assert response.status_code == 400
+
+    def test_out_of_range_ids_in_body(self, client: TestClient):
+        """Test a posted id too large for the id column is rejected"""
+        response = client.post("/api/recipes/batch", json={"ids": [2**31]})
+        assert response.status_code == 400
+
+
+class TestShoppingList:
+    """Test merged ingredient totals for a meal plan"""
+
+    def _recipe(self, client: TestClient, servings, ingredients) -> int:
+        return client.post(
+            "/api/recipes",
+            json={
+                "title": "Recipe",
+                "instructions": "Cook",
+                "servings": servings,
+                "ingredients": ingredients,
+            },
+        ).json()["id"]
+
+    def _items(self, response) -> dict:
+        return {
+            (item["name"], item["unit"]): item["amount"]
+            for item in response.json()["items"]
+        }
+
+    def test_scales_and_merges(self, client: TestClient):
+        """Test amounts scale to the servings wanted and merge across units"""
+        bread = self._recipe(
+            client,
+            2,
+            [
+                {"name": "Flour", "amount": 500, "unit": "g"},
+                {"name": "Milk", "amount": 1, "unit": "cup"},
+                {"name": "Salt", "amount": 1, "unit": "tsp"},
+            ],
+        )
+        cake = self._recipe(
+            client,
+            4,
+            [
+                {"name": "flour", "amount": 1, "unit": "kg"},
+                {"name": "Salt", "amount": 1, "unit": "Tbsp"},
+                {"name": "eggs", "amount": 3},
+                {"name": "Vanilla", "amount": 2, "unit": "pods"},
+                {"name": "pepper"},
+            ],
+        )
+
+        response = client.post(
+            "/api/recipes/shopping-list",
+            json={
+                "recipes": [
+                    {"recipe_id": bread, "servings": 4},
+                    {"recipe_id": cake},
+                ]
+            },
+        )
+        assert response.status_code == 200
+        assert self._items(response) == {
+            # 2 x 500 g + 1 kg
+            ("Flour", "kg"): 2.0,
+            ("Milk", "cup"): 2.0,
+            # 2 tsp + 1 tbsp
+            ("Salt", "tbsp"): 1.67,
+            ("eggs", None): 3.0,
+            ("Vanilla", "pods"): 2.0,
+            ("pepper", None): None,
+        }
+        assert response.json()["missing"] == []
+
+    def test_mass_and_volume_stay_apart(self, client: TestClient):
+        """Test units that cannot convert into each other make separate lines"""
+        first = self._recipe(
+            client, None, [{"name": "sugar", "amount": 200, "unit": "g"}]
+        )
+        second = self._recipe(
+            client,
+            None,
+            [
+                {"name": "Sugar", "amount": 1, "unit": "cup"},
+                {"name": "water", "amount": 1, "unit": "cup"},
+            ],
+        )
+        third = self._recipe(
+            client, None, [{"name": "water", "amount": 250, "unit": "ml"}]
+        )
+
+        response = client.post(
+            "/api/recipes/shopping-list",
+            json={
+                "recipes": [
+                    {"recipe_id": first},
+                    # Without servings of its own, a recipe is used as is
+                    {"recipe_id": second, "servings": 10},
+                    {"recipe_id": third},
+                ]
+            },
+        )
+        assert self._items(response) == {
+            ("sugar", "g"): 200.0,
+            ("Sugar", "cup"): 1.0,
+            # Mixed cups and millilitres are shown in metric
+            ("water", "ml"): 486.59,
+        }
+
+    def test_repeats_and_missing(self, client: TestClient, assert_max_queries):
+        """Test a repeated recipe is bought twice and unknown ids are listed"""
+        recipe_id = self._recipe(
+            client, 4, [{"name": "rice", "amount": 100, "unit": "g"}]
+        )
+
+        with assert_max_queries(2):
+            response = client.post(
+                "/api/recipes/shopping-list",
+                json={
+                    "recipes": [
+                        {"recipe_id": recipe_id, "servings": 2},
+                        {"recipe_id": 999},
+                        {"recipe_id": recipe_id},
+                    ]
+                },
+            )
+        assert self._items(response) == {("rice", "g"): 150.0}
+        assert response.json()["missing"] == [999]
+
+    def test_invalid_requests(self, client: TestClient):
+        """Test empty plans and non-positive servings are rejected"""
+        url = "/api/recipes/shopping-list"
+        assert client.post(url, json={"recipes": []}).status_code == 422
+        response = client.post(url, json={"recipes": [{"recipe_id": 1, "servings": 0}]})
+        assert response.status_code == 422
+
+
+class TestJobs:
+    """Test submitting, polling and cancelling background jobs"""
+
+    @pytest.fixture
+    def runner(self, monkeypatch):
+        # Not started, so jobs only run when a test runs them
+        runner = jobs.JobRunner(TestingSessionLocal, chunk_size=2)
+        monkeypatch.setattr(jobs, "job_runner", runner)
+        return runner
+
+    def test_submit_and_poll(self, client: TestClient, runner):
+        """Test a job is accepted, runs later and reports its progress"""
+        old = client.post("/api/categories", json={"name": "Old"}).json()["id"]
+        new = client.post("/api/categories", json={"name": "New"}).json()["id"]
+        recipe_ids = [
+            client.post(
+                "/api/recipes",
+                json={"title": f"R{i}", "instructions": "Cook", "category_id": old},
+            ).json()["id"]
+            for i in range(3)
+        ]
+        cached = client.get(f"/api/recipes/{recipe_ids[0]}").json()
+        assert cached["category"]["name"] == "Old"
+
+        response = client.post(
+            "/api/jobs",
+            json={
+                "kind": "recategorize",
+                "params": {"from_category_id": old, "to_category_id": new},
+            },
+        )
+        assert response.status_code == 202
+        job = response.json()
+        assert job["status"] == "queued"
+        assert job["progress"] is None
+        assert response.headers["Location"] == f"/api/jobs/{job['id']}"
+
+        runner.run(job["id"])
+
+        job = client.get(response.headers["Location"]).json()
+        assert (job["status"], job["processed"], job["total"]) == ("succeeded", 3, 3)
+        assert job["progress"] == 1.0
+        recipe = client.get(f"/api/recipes/{recipe_ids[0]}").json()
+        assert recipe["category"]["name"] == "New"
+        assert [j["id"] for j in client.get("/api/jobs?status=succeeded").json()] == [
+            job["id"]
+        ]
+
+    def test_cancel(self, client: TestClient, runner):
+        """Test a queued job can be cancelled once, then conflicts"""
+        job_id = client.post("/api/jobs", json={"kind": "reindex"}).json()["id"]
+
+        response = client.post(f"/api/jobs/{job_id}/cancel")
+        assert response.status_code == 200
+        assert response.json()["status"] == "cancelled"
+        assert client.post(f"/api/jobs/{job_id}/cancel").status_code == 409
+        assert client.post("/api/jobs/999/cancel").status_code == 404
+        assert client.get("/api/jobs/999").status_code == 404
+
+    @pytest.mark.parametrize(
+        "body, status",
+        [
+            ({"kind": "nope"}, 422),
+            ({"kind": "recategorize", "params": {}}, 422),
+            ({"kind": "recategorize", "params": {"to_category_id": 999}}, 404),
+        ],
+        ids=["unknown_kind", "same_category", "unknown_category"],
+    )
+    def test_invalid_jobs(self, client: TestClient, runner, body, status):
+        """Test bad job requests are rejected before anything is queued"""
+        assert client.post("/api/jobs", json=body).status_code == status
+        assert client.get("/api/jobs").json() == []
+
+
+class TestChangeFeed:
+    """Test syncing recipes and categories through the change feed"""
+
+    def _changes(self, client: TestClient, since: int, **params):
+        response = client.get("/api/changes", params={"since": since, **params})
+        assert response.status_code == 200
+        return response.json()
+
+    def test_upserts_and_tombstones(self, client: TestClient):
+        """Test each write shows up once with the entity's current state"""
+        start = client.get("/api/changes").json()
+        assert start == {"changes": [], "next": 0, "has_more": False}
+
+        category_id = client.post("/api/categories", json={"name": "Soups"}).json()[
+            "id"
+        ]
+        recipe_id = client.post(
+            "/api/recipes",
+            json={
+                "title": "Soup",
+                "instructions": "Simmer",
+                "category_id": category_id,
+            },
+        ).json()["id"]
+        client.patch(f"/api/recipes/{recipe_id}", json={"title": "Tomato Soup"})
+        other_id = client.post(
+            "/api/recipes", json={"title": "Bread", "instructions": "Bake"}
+        ).json()["id"]
+        client.delete(f"/api/recipes/{other_id}")
+
+        feed = self._changes(client, since=0)
+        assert [(c["type"], c["id"], c["deleted"]) for c in feed["changes"]] == [
+            ("category", category_id, False),
+            ("recipe", recipe_id, False),
+            ("recipe", other_id, True),
+        ]
+        assert [c["revision"] for c in feed["changes"]] == [1, 3, 5]
+        assert feed["changes"][0]["category"]["name"] == "Soups"
+        assert feed["changes"][1]["recipe"]["title"] == "Tomato Soup"
+        assert feed["changes"][2]["recipe"] is None
+        assert (feed["next"], feed["has_more"]) == (5, False)
+        assert client.get("/api/changes").json()["next"] == 5
+        assert self._changes(client, since=5)["changes"] == []
+
+    def test_paging(self, client: TestClient):
+        """Test a client catches up page by page from the last next"""
+        client.post(
+            "/api/recipes/import",
+            json=[{"title": f"R{i}", "instructions": "Cook"} for i in range(5)],
+        )
+
+        seen, since, has_more = [], 0, True
+        while has_more:
+            feed = self._changes(client, since=since, limit=2)
+            seen += [c["recipe"]["title"] for c in feed["changes"]]
+            since, has_more = feed["next"], feed["has_more"]
+        assert seen == [f"R{i}" for i in range(5)]
+        assert since == 5
+
+    def test_deleting_a_category_changes_its_recipes(self, client: TestClient):
+        """Test recipes left without a category are logged with it"""
+        category_id = client.post("/api/categories", json={"name": "Soups"}).json()[
+            "id"
+        ]
+        recipe_id = client.post(
+            "/api/recipes",
+            json={
+                "title": "Soup",
+                "instructions": "Simmer",
+                "category_id": category_id,
+            },
+        ).json()["id"]
+        since = client.get("/api/changes").json()["next"]
+
+        client.delete(f"/api/categories/{category_id}")
+
+        changes = self._changes(client, since=since)["changes"]
+        assert [(c["type"], c["id"], c["deleted"]) for c in changes] == [
+            ("recipe", recipe_id, False),
+            ("category", category_id, True),
+        ]
+        assert changes[0]["recipe"]["category"] is None
+
+    def test_recategorize_job_is_logged(self, client: TestClient, monkeypatch):
+        """Test recipes moved by a background job show up in the feed"""
+        runner = jobs.JobRunner(TestingSessionLocal)
+        monkeypatch.setattr(jobs, "job_runner", runner)
+        new = client.post("/api/categories", json={"name": "New"}).json()["id"]
+        client.post("/api/recipes", json={"title": "Soup", "instructions": "Cook"})
+        since = client.get("/api/changes").json()["next"]
+
+        job_id = client.post(
+            "/api/jobs",
+            json={"kind": "recategorize", "params": {"to_category_id": new}},
+        ).json()["id"]
+        runner.run(job_id)
+
+        changes = self._changes(client, since=since)["changes"]
+        assert [c["recipe"]["category"]["name"] for c in changes] == ["New"]
+
+    def test_revision_from_the_future(self, client: TestClient):
+        """Test a revision the log never reached asks for a full resync"""
+        assert client.get("/api/changes?since=1").status_code == 410
+        assert client.get("/api/changes?since=-1").status_code == 422
+
+
+class TestPagination:
+    """Test cursor (keyset) pagination on list endpoints"""
+
+    def test_recipe_cursor_pages(self, client: TestClient):
+        """Test walking recipes page by page with the next cursor"""
+        for i in range(5):
+            client.post(
+                "/api/recipes",
+                json={
+                    "title": f"Recipe {i}",
+                    "instructions": "Cook",
+                    "ingredients": [],
+                },
+            )
+
+        first = client.get("/api/recipes?limit=2")
+        assert first.status_code == 200
+        assert [r["title"] for r in first.json()] == ["Recipe 0", "Recipe 1"]
+        cursor = first.headers["X-Next-Cursor"]
+
+        second = client.get(f"/api/recipes?limit=2&cursor={cursor}")
+        assert [r["title"] for r in second.json()] == ["Recipe 2", "Recipe 3"]
+
+        last = client.get(
+            f"/api/recipes?limit=2&cursor={second.headers['X-Next-Cursor']}"
+        )
+        assert [r["title"] for r in last.json()] == ["Recipe 4"]
+        assert "X-Next-Cursor" not in last.headers
+
+    def test_skip_still_supported(self, client: TestClient):
+        """Test that offset pagination keeps working for old clients"""
+        for i in range(3):
+            client.post(
+                "/api/recipes",
+                json={
+                    "title": f"Recipe {i}",
+                    "instructions": "Cook",
+                    "ingredients": [],
+                },
+            )
+
+        response = client.get("/api/recipes?skip=2&limit=2")
+        assert response.status_code == 200
+        assert [r["title"] for r in response.json()] == ["Recipe 2"]
+
+    def test_category_cursor_pages(self, client: TestClient):
+        """Test categories are paged in name order with a cursor"""
+        for name in ["Lunch", "Breakfast", "Dinner"]:
+            client.post("/api/categories", json={"name": name})
+
+        first = client.get("/api/categories?limit=2")
+        assert [c["name"] for c in first.json()] == ["Breakfast", "Dinner"]
+
+        second = client.get(
+            f"/api/categories?limit=2&cursor={first.headers['X-Next-Cursor']}"
+        )
+        assert [c["name"] for c in second.json()] == ["Lunch"]
+
+    def test_invalid_cursor(self, client: TestClient):
+        """Test that a malformed cursor is rejected"""
+        response = client.get("/api/recipes?cursor=not-a-cursor")
+        assert response.status_code == 400
+
+    @pytest.mark.parametrize(
+        "url, values",
+        [
+            ("/api/recipes", ["x"]),
+            ("/api/recipes", [True]),
+            ("/api/recipes?sort=title", [1, 1]),
+            ("/api/recipes?sort=-created_at", ["2026-10-17", 1]),
+            ("/api/recipes?sort=prep_time", [None, 1]),
+            ("/api/categories", [1, "x"]),
+        ],
+    )
+    def test_cursor_of_wrong_types(self, client: TestClient, url, values):
+        """Test that a well-formed cursor not fitting the sort is rejected"""
+        separator = "&" if "?" in url else "?"
+        response = client.get(f"{url}{separator}cursor={encode_cursor(values)}")
+        assert response.status_code == 400
+
+
+class TestSearch:
+    """Test full-text recipe search"""
+
+    def test_search_instructions_and_ingredients(self, client: TestClient):
+        """Test that search looks beyond the title"""
+        client.post(
+            "/api/recipes",
+            json={
+                "title": "Weeknight Stew",
+                "instructions": "Simmer slowly for two hours",
+                "ingredients": [{"name": "carrots"}],
+            },
+        )
+
+        by_instructions = client.get("/api/recipes?search=simmer").json()
+        assert [r["title"] for r in by_instructions] == ["Weeknight Stew"]
+
+        by_ingredient = client.get("/api/recipes?search=carrot").json()
+        assert [r["title"] for r in by_ingredient] == ["Weeknight Stew"]
+
+    def test_search_ranks_title_matches_first(self, client: TestClient):
+        """Test that a title match outranks an instructions match"""
+        client.post(
+            "/api/recipes",
+            json={
+                "title": "Fruit Salad",
+                "instructions": "Top with a little lemon zest",
+                "ingredients": [],
+            },
+        )
+        client.post(
+            "/api/recipes",
+            json={
+                "title": "Lemon Tart",
+                "instructions": "Bake the shell blind",
+                "ingredients": [],
+            },
+        )
+
+        data = client.get("/api/recipes?search=lemon").json()
+        assert [r["title"] for r in data] == ["Lemon Tart", "Fruit Salad"]
+
+    def test_search_follows_updates_and_deletes(self, client: TestClient):
+        """Test that the search index tracks edits and deletions"""
+        recipe_id = client.post(
+            "/api/recipes",
+            json={"title": "Plain Rice", "instructions": "Boil", "ingredients": []},
+        ).json()["id"]
+
+        client.put(
+            f"/api/recipes/{recipe_id}",
+            json={"title": "Saffron Rice", "instructions": "Boil", "ingredients": []},
+        )
+        assert len(client.get("/api/recipes?search=saffron").json()) == 1
+        assert client.get("/api/recipes?search=plain").json() == []
+
+        client.delete(f"/api/recipes/{recipe_id}")
+        assert client.get("/api/recipes?search=saffron").json() == []
+
+    def test_search_results_page_with_cursor(self, client: TestClient):
+        """Test that ranked search results can be paged with a cursor"""
+        for i in range(3):
+            client.post(
+                "/api/recipes",
+                json={"title": f"Soup {i}", "instructions": "Stir", "ingredients": []},
+            )
+
+        first = client.get("/api/recipes?search=soup&limit=2")
+        second = client.get(
+            f"/api/recipes?search=soup&limit=2&cursor={first.headers['X-Next-Cursor']}"
+        )
+        titles = [r["title"] for r in first.json() + second.json()]
+        assert sorted(titles) == ["Soup 0", "Soup 1", "Soup 2"]
+
+    @pytest.mark.skipif(
+        not os.environ.get("TEST_POSTGRES_URL"), reason="TEST_POSTGRES_URL is not set"
+    )
+    def test_postgres_cursor_pages_through_tied_ranks(self):
+        """Test paging on Postgres neither skips nor repeats equally ranked rows"""
+        # A scratch database: its tables are dropped and recreated
+        pg_engine = create_engine(os.environ["TEST_POSTGRES_URL"])
+        Base.metadata.drop_all(bind=pg_engine)
+        Base.metadata.create_all(bind=pg_engine)
+        try:
+            with sessionmaker(bind=pg_engine)() as db:
+                ids = [
+                    crud.create_recipe(
+                        db,
+                        schemas.RecipeCreate(
+                            title=title, instructions="Simmer the lemon slowly"
+                        ),
+                    ).id
+                    # Two groups of equally ranked recipes, split across pages
+                    for title in ["Lemon Soup"] * 5 + ["Barley Stew"] * 4
+                ]
+                seen, cursor = [], None
+                while True:
+                    body, cursor = crud.get_recipes_page_json(
+                        db, limit=2, search="lemon", cursor=cursor, fields=("id",)
+                    )
+                    seen += [r["id"] for r in json.loads(body)]
+                    assert len(seen) <= len(ids), "cursor did not advance"
+                    if cursor is None:
+                        break
+            assert sorted(seen) == ids
+        finally:
+            Base.metadata.drop_all(bind=pg_engine)
+            pg_engine.dispose()
+
+
+class TestCookWith:
+    """Test ranking recipes by the ingredients on hand"""
+
+    def _create(self, client: TestClient, title, ingredient_names):
+        client.post(
+            "/api/recipes",
+            json={
+                "title": title,
+                "instructions": "Cook",
+                "ingredients": [{"name": name} for name in ingredient_names],
+            },
+        )
+
+    def test_ranked_by_coverage(self, client: TestClient):
+        """Test recipes missing fewer ingredients come first"""
+        self._create(client, "Omelette", ["Eggs", "Butter"])
+        self._create(client, "Pancakes", ["eggs", "flour", "milk"])
+        self._create(client, "Salad", ["Lettuce"])
+
+        response = client.get("/api/recipes/cook-with?ingredients=egg,butter,milk")
+        assert response.status_code == 200
+        data = response.json()
+        assert [m["recipe"]["title"] for m in data] == ["Omelette", "Pancakes"]
+        assert data[0]["matched_count"] == 2
+        assert data[0]["missing_count"] == 0
+        assert data[1]["missing_ingredients"] == ["flour"]
+
+    def test_max_missing(self, client: TestClient):
+        """Test filtering out recipes missing too many ingredients"""
+        self._create(client, "Pancakes", ["eggs", "flour", "milk"])
+
+        response = client.get(
+            "/api/recipes/cook-with?ingredients=Tomatoes,eggs&max_missing=1"
+        )
+        assert response.json() == []
+
+
+class TestSortingAndFilters:
+    """Test sort= and min_/max_ range filters on recipe lists"""
+
+    def _seed(self, client: TestClient):
+        recipes = [
+            ("Omelette", 5, 5, 1),
+            ("Roast Chicken", 20, 90, 4),
+            ("Salad", 10, None, 2),
+            ("Bread", None, None, 8),
+            ("Pasta", 10, 12, 2),
+        ]
+        for title, prep_time, cook_time, servings in recipes:
+            client.post(
+                "/api/recipes",
+                json={
+                    "title": title,
+                    "instructions": "Cook",
+                    "prep_time": prep_time,
+                    "cook_time": cook_time,
+                    "servings": servings,
+                },
+            )
+
+    def _titles(self, client: TestClient, **params):
+        response = client.get("/api/recipes", params={"fields": "title", **params})
+        assert response.status_code == 200
+        return [r["title"] for r in response.json()]
+
+    def test_sort(self, client: TestClient):
+        """Test each sort key, ascending and descending"""
+        self._seed(client)
+
+        assert self._titles(client, sort="title") == [
+            "Bread",
+            "Omelette",
+            "Pasta",
+            "Roast Chicken",
+            "Salad",
+        ]
+        assert self._titles(client, sort="-title")[0] == "Salad"
+        # Unknown times sort last
+        assert self._titles(client, sort="total_time") == [
+            "Omelette",
+            "Salad",
+            "Pasta",
+            "Roast Chicken",
+            "Bread",
+        ]
+        assert self._titles(client, sort="cook_time")[-2:] == ["Salad", "Bread"]
+        # ...descending too
+        assert self._titles(client, sort="-prep_time") == [
+            "Roast Chicken",
+            "Pasta",
+            "Salad",
+            "Omelette",
+            "Bread",
+        ]
+        # Both unknown; the id tie-breaker descends with the sort
+        assert self._titles(client, sort="-cook_time")[-2:] == ["Bread", "Salad"]
+        assert self._titles(client, sort="-total_time") == [
+            "Roast Chicken",
+            "Pasta",
+            "Salad",
+            "Omelette",
+            "Bread",
+        ]
+        # Same created_at second: id breaks the tie
+        assert self._titles(client, sort="-created_at") == [
+            "Pasta",
+            "Bread",
+            "Salad",
+            "Roast Chicken",
+            "Omelette",
+        ]
+
+        assert client.get("/api/recipes?sort=instructions").status_code == 422
+
+    def test_range_filters(self, client: TestClient):
+        """Test inclusive min_/max_ filters"""
+        self._seed(client)
+
+        assert self._titles(client, max_total_time=22, sort="total_time") == [
+            "Omelette",
+            "Salad",
+            "Pasta",
+        ]
+        # Recipes without a time never match a time filter
+        assert self._titles(client, min_cook_time=10, sort="cook_time") == [
+            "Pasta",
+            "Roast Chicken",
+        ]
+        assert self._titles(client, min_servings=2, max_servings=4, sort="title") == [
+            "Pasta",
+            "Roast Chicken",
+            "Salad",
+        ]
+
+        response = client.get("/api/recipes?max_total_time=30&count=exact")
+        assert response.headers["X-Total-Count"] == "3"
+        facets = client.get("/api/recipes/facets?max_total_time=30").json()
+        assert facets["total"] == 3
+
+        assert client.get("/api/recipes?min_prep_time=-1").status_code == 422
+
+    @pytest.mark.parametrize(
+        "sort",
+        [
+            "created_at",
+            "-created_at",
+            "title",
+            "total_time",
+            "-prep_time",
+            "-cook_time",
+            "-total_time",
+        ],
+    )
+    def test_cursor_pages(self, client: TestClient, sort):
+        """Test keyset paging through every sort key, including NULL times"""
+        self._seed(client)
+        expected = self._titles(client, sort=sort)
+
+        seen = []
+        params = {"sort": sort, "limit": 2}
+        while True:
+            response = client.get("/api/recipes", params={"fields": "title", **params})
+            seen += [r["title"] for r in response.json()]
+            assert len(seen) <= len(expected), "cursor did not advance"
+            if "X-Next-Cursor" not in response.headers:
+                break
+            params["cursor"] = response.headers["X-Next-Cursor"]
+        assert seen == expected
+
+
+class TestAutocomplete:
+    """Test typeahead suggestions"""
+
+    def _seed(self, client: TestClient):
+        recipes = [
+            ("Tomato Basil Soup", [("Tomato", "g"), ("Basil", "bunch")]),
+            ("Tomato Salad", [("tomato", "G"), ("Olive Oil", "tbsp")]),
+            ("Basil Pesto", [("Basil", "cup"), ("Pine Nuts", "tbsp")]),
+        ]
+        for title, ingredients in recipes:
+            client.post(
+                "/api/recipes",
+                json={
+                    "title": title,
+                    "instructions": "Cook",
+                    "ingredients": [
+                        {"name": name, "amount": "1", "unit": unit}
+                        for name, unit in ingredients
+                    ],
+                },
+            )
+
+    def test_prefix_and_word_prefix(self, client: TestClient):
+        """Test title prefixes come before words later in the title"""
+        self._seed(client)
+        response = client.get("/api/recipes/autocomplete?q=bas&kind=title")
+        assert response.status_code == 200
+        assert [s["text"] for s in response.json()] == [
+            "Basil Pesto",
+            "Tomato Basil Soup",
+        ]
+
+    def test_ingredients_grouped_by_normalized_name(self, client: TestClient):
+        """Test spellings of one ingredient give one suggestion with its recipe count"""
+        self._seed(client)
+        response = client.get("/api/recipes/autocomplete?q=tom&kind=ingredient")
+        assert response.json() == [{"text": "Tomato", "kind": "ingredient", "count": 2}]
+
+    def test_units(self, client: TestClient):
+        """Test units are suggested case-insensitively"""
+        self._seed(client)
+        response = client.get("/api/recipes/autocomplete?q=tb&kind=unit")
+        assert response.json() == [{"text": "tbsp", "kind": "unit", "count": 2}]
+
+    def test_all_kinds(self, client: TestClient):
+        """Test every kind is searched when none is given, most common first"""
+        self._seed(client)
+        data = client.get("/api/recipes/autocomplete?q=basil").json()
+        assert [(s["kind"], s["text"], s["count"]) for s in data] == [
+            ("ingredient", "Basil", 2),
+            ("title", "Basil Pesto", 1),
+            ("title", "Tomato Basil Soup", 1),
+        ]
+
+    def test_typo(self, client: TestClient):
+        """Test a misspelt query still finds the title"""
+        self._seed(client)
+        data = client.get("/api/recipes/autocomplete?q=pesot&kind=title").json()
+        assert [s["text"] for s in data] == ["Basil Pesto"]
+        data = client.get("/api/recipes/autocomplete?q=basli pe&kind=title").json()
+        assert [s["text"] for s in data] == ["Basil Pesto"]
+
+    def test_limit(self, client: TestClient):
+        """Test the limit applies across kinds"""
+        self._seed(client)
+        response = client.get("/api/recipes/autocomplete?q=t&limit=2")
+        assert len(response.json()) == 2
+        assert client.get("/api/recipes/autocomplete?q=t&limit=51").status_code == 422
+        assert client.get("/api/recipes/autocomplete?q=").status_code == 422
+        assert client.get("/api/recipes/autocomplete?q=t&kind=x").status_code == 422
+
+    def test_refreshed_after_writes(self, client: TestClient, monkeypatch):
+        """Test new, renamed and deleted recipes show up once rebuilt"""
+        monkeypatch.setattr(memory_indexes, "min_rebuild_seconds", 0)
+        self._seed(client)
+        url = "/api/recipes/autocomplete?q=gaz&kind=title"
+        assert client.get(url).json() == []
+
+        def lookup_after_rebuild():
+            client.get(url)  # starts the rebuild
+            memory_indexes.wait()
+            return [s["text"] for s in client.get(url).json()]
+
+        recipe = client.post(
+            "/api/recipes", json={"title": "Gazpacho", "instructions": "Blend"}
+        ).json()
+        assert lookup_after_rebuild() == ["Gazpacho"]
+
+        client.patch(f"/api/recipes/{recipe['id']}", json={"title": "Gazpacho Verde"})
+        assert lookup_after_rebuild() == ["Gazpacho Verde"]
+
+        client.delete(f"/api/recipes/{recipe['id']}")
+        assert lookup_after_rebuild() == []
+
+    def test_rebuild_does_not_block_lookups(
+        self, client: TestClient, monkeypatch, assert_max_queries
+    ):
+        """Test lookups after a write answer from the previous index"""
+        monkeypatch.setattr(memory_indexes, "min_rebuild_seconds", 0)
+        self._seed(client)
+        url = "/api/recipes/autocomplete?q=gaz&kind=title"
+        client.get(url)
+        client.post("/api/recipes", json={"title": "Gazpacho", "instructions": "Blend"})
+
+        release = threading.Event()
+        build_rows = autocomplete._memory_rows
+
+        def slow_rows(db, kind):
+            release.wait(5)
+            return build_rows(db, kind)
+
+        monkeypatch.setattr(autocomplete, "_memory_rows", slow_rows)
+        with assert_max_queries(0):
+            assert client.get(url).json() == []
+            assert client.get(url).json() == []
+        release.set()
+        memory_indexes.wait()
+        assert [s["text"] for s in client.get(url).json()] == ["Gazpacho"]
+
+
+class TestFacets:
+    """Test facet counts and X-Total-Count"""
+
+    def _seed(self, client: TestClient):
+        desserts = client.post("/api/categories", json={"name": "Desserts"}).json()
+        mains = client.post("/api/categories", json={"name": "Mains"}).json()
+        recipes = [
+            ("Chocolate Cake", desserts["id"], 20, 40, 8),
+            ("Lemon Tart", desserts["id"], 15, 30, 6),
+            ("Fruit Salad", desserts["id"], 10, None, 2),
+            ("Beef Stew", mains["id"], 20, 120, 4),
+            ("Plain Rice", None, None, None, None),
+        ]
+        for title, category_id, prep_time, cook_time, servings in recipes:
+            client.post(
+                "/api/recipes",
+                json={
+                    "title": title,
+                    "instructions": "Cook",
+                    "category_id": category_id,
+                    "prep_time": prep_time,
+                    "cook_time": cook_time,
+                    "servings": servings,
+                },
+            )
+        return desserts, mains
+
+    def test_facets(self, client: TestClient, assert_max_queries):
+        """Test all facets come from one query"""
+        desserts, mains = self._seed(client)
+
+        with assert_max_queries(1):
+            response = client.get("/api/recipes/facets")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total"] == 5
+        assert data["categories"] == [
+            {"category_id": desserts["id"], "name": "Desserts", "count": 3},
+            {"category_id": mains["id"], "name": "Mains", "count": 1},
+            {"category_id": None, "name": None, "count": 1},
+        ]
+        assert [b["count"] for b in data["total_time"]] == [1, 0, 1, 2]
+        assert data["total_time"][0] == {
+            "label": "under 15 min",
+            "min": 0,
+            "max": 15,
+            "count": 1,
+        }
+        assert [b["count"] for b in data["servings"]] == [1, 1, 1, 1]
+
+    def test_facets_follow_search(self, client: TestClient):
+        """Test facets count only search matches"""
+        self._seed(client)
+
+        data = client.get("/api/recipes/facets?search=cake").json()
+        assert data["total"] == 1
+        assert [c["name"] for c in data["categories"]] == ["Desserts"]
+
+    def test_facets_invalidated_by_writes(self, client: TestClient):
+        """Test cached facets are dropped when a recipe is added"""
+        self._seed(client)
+        assert client.get("/api/recipes/facets").json()["total"] == 5
+
+        client.post("/api/recipes", json={"title": "Toast", "instructions": "Toast"})
+        assert client.get("/api/recipes/facets").json()["total"] == 6
+
+    def test_total_count(self, client: TestClient):
+        """Test X-Total-Count is sent only when asked for"""
+        desserts, _ = self._seed(client)
+
+        response = client.get("/api/recipes?limit=2")
+        assert "X-Total-Count" not in response.headers
+
+        response = client.get("/api/recipes?limit=2&count=exact")
+        assert len(response.json()) == 2
+        assert response.headers["X-Total-Count"] == "5"
+
+        response = client.get(
+            "/api/recipes",
+            params={"category_id": desserts["id"], "count": "exact"},
+        )
+        assert response.headers["X-Total-Count"] == "3"
+
+        response = client.get("/api/recipes?search=tart&count=exact")
+        assert response.headers["X-Total-Count"] == "1"
+
+        # No planner statistics on SQLite: falls back to an exact count
+        response = client.get("/api/recipes?count=estimated")
+        assert response.headers["X-Total-Count"] == "5"
+        assert "X-Total-Count-Estimated" not in response.headers
+
+        assert client.get("/api/recipes?count=some").status_code == 422
+
+    def test_total_count_changes_etag(self, client: TestClient):
+        """Test a new recipe beyond the page changes the ETag"""
+        self._seed(client)
+        first = client.get("/api/recipes?limit=1&count=exact")
+
+        client.post("/api/recipes", json={"title": "Toast", "instructions": "Toast"})
+        second = client.get("/api/recipes?limit=1&count=exact")
+        assert second.content == first.content
+        assert second.headers["ETag"] != first.headers["ETag"]
+
+
+class TestQueryCounts:
+    """Guard against N+1 queries when serializing recipes"""
+
+    def _seed(self, client: TestClient, count: int):
+        ids = []
+        for i in range(count):
+            category_id = client.post(
+                "/api/categories", json={"name": f"Category {i}"}
+            ).json()["id"]
+            ids.append(
+                client.post(
+                    "/api/recipes",
+                    json={
+                        "title": f"Recipe {i}",
+                        "instructions": "Cook",
+                        "category_id": category_id,
+                        "ingredients": [{"name": "salt"}, {"name": "pepper"}],
+                    },
+                ).json()["id"]
+            )
+        return ids
+
+    def test_list_recipes_query_count(self, client: TestClient, assert_max_queries):
+        """Test listing recipes loads categories in the same query"""
+        self._seed(client, 10)
+
+        with assert_max_queries(1):
+            response = client.get("/api/recipes")
+        assert all(r["category"] is not None for r in response.json())
+
+    def test_get_recipe_query_count(self, client: TestClient, assert_max_queries):
+        """Test a recipe with category and ingredients loads in two queries"""
+        recipe_id = self._seed(client, 1)[0]
+
+        with assert_max_queries(2):
+            response = client.get(f"/api/recipes/{recipe_id}")
+        assert len(response.json()["ingredients"]) == 2
+
+    def test_cook_with_query_count(self, client: TestClient, assert_max_queries):
+        """Test ingredient matching does not load recipes one by one"""
+        self._seed(client, 10)
+
+        with assert_max_queries(3):
+            response = client.get("/api/recipes/cook-with?ingredients=salt")
+        assert len(response.json()) == 10
+
+
+class TestMetrics:
+    """Test the Prometheus metrics at /metrics"""
+
+    def test_requests_are_labelled_by_route_template(self, client: TestClient):
+        """Test recipe ids are folded into one route label with its status"""
+        labels = ("GET", "/api/recipes/{recipe_id}", "404")
+        before = metrics.REQUESTS.value(*labels)
+
+        client.get("/api/recipes/123")
+        client.get("/api/recipes/456")
+
+        assert metrics.REQUESTS.value(*labels) == before + 2
+        assert metrics.REQUESTS.value("GET", "/api/recipes/123", "404") == 0
+
+    def test_unknown_paths_share_a_label(self, client: TestClient):
+        """Test paths no route matches cannot grow the label set"""
+        before = metrics.REQUESTS.value("GET", metrics.UNMATCHED_ROUTE, "404")
+
+        client.get("/no/such/path")
+
+        assert metrics.REQUESTS.value("GET", "unmatched", "404") == before + 1
+
+    def test_statements_are_counted_per_request(self, client: TestClient):
+        """Test the statement count histogram sees the request's SQL"""
+        labels = ("GET", "/api/recipes/{recipe_id}")
+        recipe_id = client.post(
+            "/api/recipes", json={"title": "Soup", "instructions": "Stir"}
+        ).json()["id"]
+        before = metrics.REQUEST_STATEMENTS.sum(*labels)
+
+        with count_queries() as statements:
+            client.get(f"/api/recipes/{recipe_id}")
+
+        assert statements
+        after = metrics.REQUEST_STATEMENTS.sum(*labels)
+        assert after - before == len(statements)
+
+    def test_metrics_endpoint(self, client: TestClient):
+        """Test the exposition has request, statement and pool metrics"""
+        client.get("/api/categories")
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        body = response.text
+        assert (
+            'http_requests_total{method="GET",route="/api/categories/",status="200"}'
+            in body
+        )
+        assert 'http_request_duration_seconds_bucket{method="GET"' in body
+        assert 'db_statement_duration_seconds_count{database="primary"' in body
+        assert 'db_pool_checkout_seconds_count{database="primary"}' in body
+        # The scrape itself is in flight while it renders
+        assert 'http_requests_in_progress{method="GET",route="/metrics"} 1' in body
+
+
+class TestSparseFieldsets:
+    """Test trimming responses with ?fields="""
+
+    def _seed(self, client: TestClient):
+        category_id = client.post("/api/categories", json={"name": "Dinner"}).json()[
+            "id"
+        ]
+        return client.post(
+            "/api/recipes",
+            json={
+                "title": "Curry",
+                "description": "Spicy",
+                "instructions": "Simmer for an hour",
+                "prep_time": 15,
+                "cook_time": 60,
+                "category_id": category_id,
+                "ingredients": [{"name": "rice"}],
+            },
+        ).json()
+
+    def test_total_time(self, client: TestClient):
+        """Test full responses include total_time"""
+        recipe = self._seed(client)
+        assert recipe["total_time"] == 75
+        assert client.get("/api/recipes").json()[0]["total_time"] == 75
+
+    def test_list_recipes_fields(self, client: TestClient):
+        """Test a projected list reads only the requested columns"""
+        self._seed(client)
+
+        with count_queries() as statements:
+            response = client.get("/api/recipes?fields=id,title,total_time")
+        assert response.status_code == 200
+        assert response.json() == [{"id": 1, "title": "Curry", "total_time": 75}]
+        assert len(statements) == 1
+        sql = statements[0].lower()
+        assert "categories" not in sql
+        assert "description" not in sql
+
+    def test_get_recipe_fields(self, client: TestClient):
+        """Test a projected detail skips unrequested relationships"""
+        recipe = self._seed(client)
+
+        with count_queries() as statements:
+            response = client.get(f"/api/recipes/{recipe['id']}?fields=title")
+        assert response.json() == {"title": "Curry"}
+        assert not any("ingredients" in sql.lower() for sql in statements)
+        assert not any("instructions" in sql.lower() for sql in statements)
+
+        response = client.get(
+            f"/api/recipes/{recipe['id']}?fields=ingredients,category"
+        )
+        data = response.json()
+        assert list(data) == ["category", "ingredients"]
+        assert data["category"]["name"] == "Dinner"
+        assert data["ingredients"][0]["name"] == "rice"
+
+    def test_projected_detail_etag(self, client: TestClient):
+        """Test a projected detail revalidates like the full one"""
+        recipe = self._seed(client)
+        url = f"/api/recipes/{recipe['id']}"
+        full = client.get(url)
+        projected = client.get(url, params={"fields": "id,title"})
+        assert projected.headers["etag"] == full.headers["etag"]
+
+        response = client.get(
+            url,
+            params={"fields": "id,title"},
+            headers={"If-None-Match": projected.headers["etag"]},
+        )
+        assert response.status_code == 304
+
+        # Changing the category changes the projected ETag too
+        client.put(f"/api/categories/{recipe['category_id']}", json={"name": "Supper"})
+        response = client.get(url, params={"fields": "id,title"})
+        assert response.headers["etag"] != projected.headers["etag"]
+
+    def test_category_fields(self, client: TestClient):
+        """Test fields= on category endpoints"""
+        recipe = self._seed(client)
+        category_id = recipe["category_id"]
+
+        response = client.get("/api/categories?fields=name")
+        assert response.json() == [{"name": "Dinner"}]
+
+        response = client.get(f"/api/categories/{category_id}?fields=id,name")
+        assert response.json() == {"id": category_id, "name": "Dinner"}
+        assert "ETag" in response.headers
+
+    def test_unknown_field(self, client: TestClient):
+        """Test unknown and empty field lists are rejected"""
+        assert client.get("/api/recipes?fields=id,secret").status_code == 400
+        assert client.get("/api/recipes?fields=instructions").status_code == 400
+        assert client.get("/api/categories?fields=,").status_code == 400
+
+
+class TestListSerialization:
+    """Test the plain-row list path against ORM + schema serialization"""
+
+    def test_matches_schema_output(self, client: TestClient):
+        """Test row-based list bodies equal the RecipeList serialization"""
+        category_id = client.post(
+            "/api/categories", json={"name": "Baking", "description": "Oven"}
+        ).json()["id"]
+        for i in range(5):
+            client.post(
+                "/api/recipes",
+                json={
+                    "title": f"Bread {i}",
+                    "description": None if i % 2 else "Crusty",
+                    "instructions": "Knead",
+                    "prep_time": i or None,
+                    "servings": 2,
+                    "category_id": category_id if i % 2 else None,
+                    "ingredients": [{"name": "flour"}],
+                },
+            )
+
+        adapter = TypeAdapter(List[schemas.RecipeList])
+        db = TestingSessionLocal()
+        try:
+            for params in [{}, {"search": "bread", "limit": 2}]:
+                recipes, _ = crud.get_recipes_page(db, **params)
+                expected = adapter.dump_json(adapter.validate_python(recipes))
+                body, _ = crud.get_recipes_page_json(db, **params)
+                assert body == expected
+        finally:
+            db.close()
+
+    def test_cursor_pages(self, client: TestClient):
+        """Test keyset paging over plain rows"""
+        for i in range(5):
+            client.post(
+                "/api/recipes",
+                json={"title": f"Dish {i}", "instructions": "Cook"},
+            )
+
+        seen = []
+        params = {"limit": 2, "fields": "title"}
+        while True:
+            response = client.get("/api/recipes", params=params)
+            seen += [r["title"] for r in response.json()]
+            if "X-Next-Cursor" not in response.headers:
+                break
+            params["cursor"] = response.headers["X-Next-Cursor"]
+        assert seen == [f"Dish {i}" for i in range(5)]
+
+
+class TestAsyncSessions:
+    """Test the endpoints on the AsyncSession code path"""
+
+    def test_recipe_lifecycle(self, async_client: TestClient):
+        """Test create, read, search, update and delete over AsyncSession"""
+        category = async_client.post("/api/categories", json={"name": "Soups"})
+        assert category.status_code == 201
+
+        created = async_client.post(
+            "/api/recipes",
+            json={
+                "title": "Leek Soup",
+                "instructions": "Sweat the leeks",
+                "category_id": category.json()["id"],
+                "ingredients": [{"name": "leeks", "amount": 2}],
+            },
+        )
+        assert created.status_code == 201
+        recipe_id = created.json()["id"]
+        assert created.json()["category"]["name"] == "Soups"
+
+        detail = async_client.get(f"/api/recipes/{recipe_id}").json()
+        assert detail["ingredients"][0]["name"] == "leeks"
+
+        listed = async_client.get("/api/recipes?search=leek").json()
+        assert [r["id"] for r in listed] == [recipe_id]
+
+        updated = async_client.put(
+            f"/api/recipes/{recipe_id}",
+            json={"title": "Potato Leek Soup", "instructions": "Sweat the leeks"},
+        )
+        assert updated.json()["title"] == "Potato Leek Soup"
+
+        leeks = updated.json()["ingredients"][0]
+        patched = async_client.patch(
+            f"/api/recipes/{recipe_id}",
+            json={"ingredients": {"update": [{"id": leeks["id"], "amount": 3}]}},
+        )
+        assert patched.json()["ingredients"] == [{**leeks, "amount": 3}]
+
+        assert async_client.delete(f"/api/recipes/{recipe_id}").status_code == 204
+        assert async_client.get(f"/api/recipes/{recipe_id}").status_code == 404
+
+    def test_list_categories(self, async_client: TestClient):
+        """Test paging categories over AsyncSession"""
+        for name in ["Lunch", "Breakfast"]:
+            async_client.post("/api/categories", json={"name": name})
+
+        response = async_client.get("/api/categories?limit=1")
+        assert [c["name"] for c in response.json()] == ["Breakfast"]
+        assert "X-Next-Cursor" in response.headers
+
+
+class TestResponseCache:
+    """Test caching of read responses and invalidation on writes"""
+
+    def test_repeat_read_served_from_cache(
+        self, client: TestClient, assert_max_queries
+    ):
+        """Test a second read of a recipe does not touch the database"""
+        recipe_id = client.post(
+            "/api/recipes",
+            json={"title": "Toast", "instructions": "Toast it", "ingredients": []},
+        ).json()["id"]
+        first = client.get(f"/api/recipes/{recipe_id}")
+
+        with assert_max_queries(0):
+            second = client.get(f"/api/recipes/{recipe_id}")
+        assert second.json() == first.json()
+
+    def test_recipe_write_invalidates(self, client: TestClient):
+        """Test updating a recipe refreshes its detail and the lists"""
+        recipe_id = client.post(
+            "/api/recipes",
+            json={"title": "Toast", "instructions": "Toast it", "ingredients": []},
+        ).json()["id"]
+        client.get(f"/api/recipes/{recipe_id}")
+        client.get("/api/recipes")
+
+        client.put(
+            f"/api/recipes/{recipe_id}",
+            json={"title": "French Toast", "instructions": "Soak and fry"},
+        )
+        assert client.get(f"/api/recipes/{recipe_id}").json()["title"] == "French Toast"
+        assert client.get("/api/recipes").json()[0]["title"] == "French Toast"
+
+    def test_stale_replica_read_is_not_cached(
+        self, client: TestClient, monkeypatch, tmp_path
+    ):
+        """Test a lagging replica's answer right after a write is not cached"""
+        recipe_id = client.post(
+            "/api/recipes",
+            json={"title": "Toast", "instructions": "Toast it", "ingredients": []},
+        ).json()["id"]
+        # A replica that has not replayed anything after this point
+        replica_path = tmp_path / "replica.db"
+        with sqlite3.connect("test.db") as primary, sqlite3.connect(
+            replica_path
+        ) as replica:
+            primary.backup(replica)
+
+        router = SessionRouter(
+            TestingSessionLocal,
+            sessionmaker(
+                class_=ReplicaSession, bind=create_engine(f"sqlite:///{replica_path}")
+            ),
+            read_your_writes_seconds=60,
+        )
+
+        def routed_db(request: Request, response: Response):
+            db = router.session(request, response)
+            try:
+                yield db
+            finally:
+                db.close()
+
+        monkeypatch.setitem(app.dependency_overrides, get_db, routed_db)
+        writer, reader = TestClient(app), TestClient(app)
+        writer.put(
+            f"/api/recipes/{recipe_id}",
+            json={"title": "French Toast", "instructions": "Soak and fry"},
+        )
+
+        # Other clients read the replica, which is still behind
+        assert reader.get(f"/api/recipes/{recipe_id}").json()["title"] == "Toast"
+        assert reader.get("/api/recipes").json()[0]["title"] == "Toast"
+        # The writer is pinned to the primary and must not get those bytes
+        assert writer.get(f"/api/recipes/{recipe_id}").json()["title"] == (
+            "French Toast"
+        )
+        assert writer.get("/api/recipes").json()[0]["title"] == "French Toast"
+
+    def test_category_write_invalidates_embedding_recipes(self, client: TestClient):
+        """Test renaming a category refreshes recipes that embed it"""
+        category_id = client.post("/api/categories", json={"name": "Brunch"}).json()[
+            "id"
+        ]
+        recipe_id = client.post(
+            "/api/recipes",
+            json={
+                "title": "Eggs Benedict",
+                "instructions": "Poach",
+                "category_id": category_id,
+            },
+        ).json()["id"]
+        client.get(f"/api/recipes/{recipe_id}")
+        client.get("/api/categories")
+
+        client.put(f"/api/categories/{category_id}", json={"name": "Breakfast"})
+        detail = client.get(f"/api/recipes/{recipe_id}").json()
+        assert detail["category"]["name"] == "Breakfast"
+        assert client.get("/api/categories").json()[0]["name"] == "Breakfast"
+
+    def test_cache_stats(self, client: TestClient):
+        """Test hit and miss counters are exposed"""
+        client.post("/api/categories", json={"name": "Snacks"})
+        before = client.get("/cache/stats").json()
+        client.get("/api/categories")
+        client.get("/api/categories")
+
+        after = client.get("/cache/stats").json()
+        assert after["misses"] - before["misses"] == 1
+        assert after["hits"] - before["hits"] == 1
+
+
+class TestConditionalRequests:
+    """Test ETag / Last-Modified validators and 304 responses"""
+
+    def _create(self, client: TestClient, **fields):
+        recipe = {"title": "Toast", "instructions": "Toast it", "ingredients": []}
+        recipe.update(fields)
+        return client.post("/api/recipes", json=recipe).json()
+
+    def test_updated_at_set_on_insert(self, client: TestClient):
+        """Test new rows carry updated_at straight away"""
+        assert self._create(client)["updated_at"] is not None
+        category = client.post("/api/categories", json={"name": "Snacks"}).json()
+        assert category["updated_at"] is not None
+
+    def test_if_none_match(self, client: TestClient):
+        """Test a matching ETag gets a 304 with no body"""
+        recipe_id = self._create(client)["id"]
+        response = client.get(f"/api/recipes/{recipe_id}")
+        etag = response.headers["ETag"]
+        assert "Last-Modified" in response.headers
+
+        revalidated = client.get(
+            f"/api/recipes/{recipe_id}", headers={"If-None-Match": etag}
+        )
+        assert revalidated.status_code == 304
+        assert revalidated.content == b""
+        assert revalidated.headers["ETag"] == etag
+
+    def test_revalidation_skips_ingredients(
+        self, client: TestClient, assert_max_queries
+    ):
+        """Test a 304 is answered from the version columns alone"""
+        recipe_id = self._create(client, ingredients=[{"name": "bread"}])["id"]
+        etag = client.get(f"/api/recipes/{recipe_id}").headers["ETag"]
+        response_cache.clear()
+
+        with assert_max_queries(1) as statements:
+            response = client.get(
+                f"/api/recipes/{recipe_id}", headers={"If-None-Match": etag}
+            )
+        assert response.status_code == 304
+        assert "ingredients" not in statements[0]
+
+    def test_ingredient_edit_changes_etag(self, client: TestClient):
+        """Test an ingredient-only edit produces a new validator"""
+        recipe = self._create(client, ingredients=[{"name": "bread"}])
+        etag = client.get(f"/api/recipes/{recipe['id']}").headers["ETag"]
+
+        client.put(
+            f"/api/recipes/{recipe['id']}",
+            json={
+                "title": recipe["title"],
+                "instructions": recipe["instructions"],
+                "ingredients": [{"name": "bread"}, {"name": "butter"}],
+            },
+        )
+        response = client.get(
+            f"/api/recipes/{recipe['id']}", headers={"If-None-Match": etag}
+        )
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
+    def test_category_edit_changes_recipe_etag(self, client: TestClient):
+        """Test renaming the embedded category invalidates the recipe ETag"""
+        category_id = client.post("/api/categories", json={"name": "Brunch"}).json()[
+            "id"
+        ]
+        recipe_id = self._create(client, category_id=category_id)["id"]
+        etag = client.get(f"/api/recipes/{recipe_id}").headers["ETag"]
+
+        client.put(f"/api/categories/{category_id}", json={"name": "Breakfast"})
+        response = client.get(
+            f"/api/recipes/{recipe_id}", headers={"If-None-Match": etag}
+        )
+        assert response.status_code == 200
+
+    def test_if_modified_since(self, client: TestClient):
+        """Test If-Modified-Since at or after Last-Modified gets a 304"""
+        recipe_id = self._create(client)["id"]
+        last_modified = client.get(f"/api/recipes/{recipe_id}").headers["Last-Modified"]
+
+        response = client.get(
+            f"/api/recipes/{recipe_id}", headers={"If-Modified-Since": last_modified}
+        )
+        assert response.status_code == 304
+
+        response = client.get(
+            f"/api/recipes/{recipe_id}",
+            headers={"If-Modified-Since": "Mon, 01 Jan 2001 00:00:00 GMT"},
+        )
+        assert response.status_code == 200
+
+    def test_list_etag(self, client: TestClient):
+        """Test list responses carry a content ETag and honour it"""
+        self._create(client)
+        etag = client.get("/api/recipes").headers["ETag"]
+
+        assert (
+            client.get("/api/recipes", headers={"If-None-Match": etag}).status_code
+            == 304
+        )
+        self._create(client, title="Jam")
+        assert (
+            client.get("/api/recipes", headers={"If-None-Match": etag}).status_code
+            == 200
+        )
+
+
+class TestBulkImport:
+    """Test the streaming bulk import endpoint"""
+
+    def test_ndjson_import_reports_bad_rows(self, client: TestClient):
+        """Test valid NDJSON rows are inserted and invalid ones reported"""
+        body = "\n".join(
+            [
+                json.dumps(
+                    {
+                        "title": "Imported Soup",
+                        "instructions": "Simmer",
+                        "ingredients": [{"name": "Tomatoes", "amount": 3}],
+                    }
+                ),
+                json.dumps({"title": "No instructions"}),
+                "{not json",
+                "",
+                json.dumps({"title": "Imported Bread", "instructions": "Bake"}),
+            ]
+        )
+        response = client.post(
+            "/api/recipes/import?batch_size=1",
+            content=body,
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+        assert response.status_code == 200
+        result = response.json()
+        assert result["inserted"] == 2
+        assert result["failed"] == 2
+        assert [e["row"] for e in result["errors"]] == [2, 3]
+
+        # Imported rows are searchable and matchable like any other recipe
+        assert len(client.get("/api/recipes?search=imported").json()) == 2
+        matches = client.get("/api/recipes/cook-with?ingredients=tomato").json()
+        assert [m["recipe"]["title"] for m in matches] == ["Imported Soup"]
+
+    def test_batch_statement_count(self, client: TestClient, assert_max_queries):
+        """Test a batch is inserted in a fixed number of statements"""
+        body = "\n".join(
+            json.dumps(
+                {
+                    "title": f"Recipe {i}",
+                    "instructions": "Cook",
+                    "ingredients": [{"name": "salt"}, {"name": f"spice {i}"}],
+                }
+            )
+            for i in range(100)
+        )
+        # Recipes, ingredients, the search index (2), the change log (2)
+        with assert_max_queries(6):
+            response = client.post(
+                "/api/recipes/import",
+                content=body,
+                headers={"Content-Type": "application/x-ndjson"},
+            )
+        assert response.json()["inserted"] == 100
+
+        # Ids still line up with the rows they came from
+        recipes = client.get("/api/recipes?limit=100").json()
+        recipe = next(r for r in recipes if r["title"] == "Recipe 42")
+        detail = client.get(f"/api/recipes/{recipe['id']}").json()
+        assert sorted(i["name"] for i in detail["ingredients"]) == ["salt", "spice 42"]
+
+    def test_json_array_import(self, client: TestClient):
+        """Test importing a JSON array body"""
+        recipes = [{"title": f"Recipe {i}", "instructions": "Cook"} for i in range(5)]
+        response = client.post("/api/recipes/import", json=recipes)
+        assert response.json()["inserted"] == 5
+        assert len(client.get("/api/recipes").json()) == 5
+
+    def test_unknown_category_rejected_per_row(self, client: TestClient):
+        """Test a row with a missing category does not sink its batch"""
+        category_id = client.post("/api/categories", json={"name": "Soups"}).json()[
+            "id"
+        ]
+        recipes = [
+            {"title": "Good", "instructions": "Cook", "category_id": category_id},
+            {"title": "Bad", "instructions": "Cook", "category_id": 999},
+        ]
+        result = client.post("/api/recipes/import", json=recipes).json()
+        assert result["inserted"] == 1
+        assert result["errors"][0]["row"] == 2
+
+    def test_malformed_array_aborts(self, client: TestClient):
+        """Test rows before a syntax error are kept and the error reported"""
+        body = '[{"title": "Kept", "instructions": "Cook"} {"title": "Lost"}]'
+        result = client.post("/api/recipes/import", content=body).json()
+        assert result["inserted"] == 1
+        assert result["aborted"]
+
+
+def test_iter_rows_across_chunk_boundaries():
+    """Test rows and multi-byte characters split across chunks parse intact"""
+    body = json.dumps(
+        [{"title": "Crème brûlée", "instructions": "Torch"}, {"title": "Ça va"}, 12]
+    ).encode()
+
+    async def chunks():
+        for i in range(0, len(body), 3):
+            yield body[i : i + 3]
+
+    async def collect():
+        return [row async for row in bulk_import.iter_rows(chunks())]
+
+    rows = asyncio.run(collect())
+    assert [row for row, _ in rows] == [1, 2, 3]
+    assert rows[0][1]["title"] == "Crème brûlée"
+    assert rows[2][1] == 12
+
+
+class TestExport:
+    """Test the streaming catalogue export"""
+
+    def _seed(self, client: TestClient):
+        category_id = client.post("/api/categories", json={"name": "Soups"}).json()[
+            "id"
+        ]
+        recipes = [
+            {
+                "title": f"Soup {i}",
+                "instructions": "Simmer",
+                "category_id": category_id,
+                "ingredients": [{"name": "water", "amount": i, "unit": "cup"}],
+            }
+            for i in range(7)
+        ]
+        client.post("/api/recipes/import", json=recipes)
+
+    def test_ndjson_export(self, client: TestClient, assert_max_queries):
+        """Test NDJSON export loads ingredients once per batch"""
+        self._seed(client)
+
+        # One recipe query plus one ingredient query per batch of 3
+        with assert_max_queries(4):
+            response = client.get("/api/recipes/export?batch_size=3")
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [r["title"] for r in rows] == [f"Soup {i}" for i in range(7)]
+        assert rows[0]["category"]["name"] == "Soups"
+        assert rows[6]["ingredients"][0]["amount"] == 6
+
+    def test_csv_export(self, client: TestClient):
+        """Test CSV export has a header and one row per recipe"""
+        self._seed(client)
+
+        response = client.get("/api/recipes/export?format=csv")
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert len(rows) == 7
+        assert rows[0]["category_name"] == "Soups"
+        assert json.loads(rows[0]["ingredients"])[0]["name"] == "water"
+
+    def test_async_export(self, async_client: TestClient):
+        """Test the export streams from an AsyncSession too"""
+        self._seed(async_client)
+
+        response = async_client.get("/api/recipes/export?batch_size=2")
+        assert len(response.text.splitlines()) == 7
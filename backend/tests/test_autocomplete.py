@@ -0,0 +1,62 @@
+import time
+
+from autocomplete import TYPO, PREFIX, WORD_PREFIX, PrefixIndex, prefix_distance
+
+
+def search(index, query, limit=10, budget=1.0):
+    return index.search(query, limit, time.perf_counter() + budget)
+
+
+def test_prefix_distance():
+    """Test the distance is to the closest prefix, transpositions costing one"""
+    assert prefix_distance("tom", "tomato", 1) == 0
+    assert prefix_distance("tmoato", "tomato soup", 1) == 1
+    assert prefix_distance("tomaot", "tomato", 1) == 1
+    assert prefix_distance("tomto", "tomato", 1) == 1
+    assert prefix_distance("tamoto", "tomato", 1) is None
+    assert prefix_distance("tamoto", "tomato", 2) == 2
+
+
+def test_prefix_before_word_prefix():
+    """Test whole-title prefixes rank above matches later in the title"""
+    index = PrefixIndex([("Basil Pesto", 1), ("Tomato Basil Soup", 5)])
+    assert search(index, "bas") == [
+        (PREFIX, "Basil Pesto", 1),
+        (WORD_PREFIX, "Tomato Basil Soup", 5),
+    ]
+
+
+def test_ranked_by_count_within_match_quality():
+    """Test more common entries come first among equal matches"""
+    index = PrefixIndex([("salt", 3), ("sage", 9), ("sugar", 20)])
+    assert [text for _, text, _ in search(index, "sa")] == ["sage", "salt"]
+    assert [text for _, text, _ in search(index, "s", limit=2)] == ["sugar", "sage"]
+
+
+def test_case_and_accent_insensitive():
+    """Test queries match regardless of case and accents"""
+    index = PrefixIndex([("Crème Brûlée", 1)])
+    assert search(index, "CREME BR") == [(PREFIX, "Crème Brûlée", 1)]
+
+
+def test_typos():
+    """Test typos are tolerated only once the query is long enough"""
+    index = PrefixIndex([("tomato", 1), ("potato", 1)])
+    assert search(index, "tmoat") == [(TYPO, "tomato", 1)]
+    # Too short to guess at
+    assert search(index, "tmo") == []
+
+
+def test_typos_only_fill_remaining_slots():
+    """Test typo matches are not looked for once the limit is reached"""
+    index = PrefixIndex([("pasta", 1), ("paste", 1), ("pastry", 1)])
+    assert search(index, "past", limit=2) == [
+        (PREFIX, "pasta", 1),
+        (PREFIX, "paste", 1),
+    ]
+
+
+def test_expired_budget_returns_nothing_found_yet():
+    """Test a lookup past its deadline stops scanning"""
+    index = PrefixIndex([("rice", 1)])
+    assert search(index, "ri", budget=-1) == []
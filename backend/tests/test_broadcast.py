@@ -0,0 +1,208 @@
+import asyncio
+import json
+
+import bulk_import
+import changelog
+import crud
+import schemas
+from broadcast import Broadcaster, ChangeEvent, broadcaster
+from conftest import TestingSessionLocal
+from main import app
+
+
+def _event(revision: int, *category_ids, type="recipe") -> ChangeEvent:
+    return ChangeEvent(revision, type, revision, False, category_ids)
+
+
+def test_category_filter():
+    """Test subscribers only get events for the category they filter on"""
+
+    async def run():
+        hub = Broadcaster()
+        everything = hub.subscribe()
+        soups = hub.subscribe(category_id=1)
+        breads = hub.subscribe(category_id=2)
+        # A recipe moving from category 1 to 2 concerns both
+        hub.publish([_event(1, 1), _event(2, 1, 2), _event(3)])
+        await asyncio.sleep(0)
+
+        def revisions(subscription):
+            queue = subscription.queue
+            return [queue.get_nowait().revision for _ in range(queue.qsize())]
+
+        assert revisions(everything) == [1, 2, 3]
+        assert revisions(soups) == [1, 2]
+        assert revisions(breads) == [2]
+
+        hub.unsubscribe(soups)
+        assert hub.subscriber_count == 2
+
+    asyncio.run(run())
+
+
+def test_slow_subscriber_is_told_to_resync():
+    """Test a full queue is replaced by one overflow marker"""
+
+    async def run():
+        hub = Broadcaster(max_pending=2)
+        stream = hub.stream(None, keepalive_seconds=60)
+        assert await stream.__anext__() == ": connected\n\n"
+        hub.publish([_event(1), _event(2), _event(3)])
+        await asyncio.sleep(0)
+        assert await stream.__anext__() == "event: resync\ndata: {}\n\n"
+        assert [chunk async for chunk in stream] == []
+        assert hub.subscriber_count == 0
+
+    asyncio.run(run())
+
+
+def test_stream_format_and_keepalive():
+    """Test events carry their revision as id, with comments in between"""
+
+    async def run():
+        hub = Broadcaster()
+        stream = hub.stream(None, keepalive_seconds=0.01)
+        await stream.__anext__()
+        assert await stream.__anext__() == ": keepalive\n\n"
+        hub.publish([_event(7, 3)])
+        chunk = await stream.__anext__()
+        assert chunk.startswith("id: 7\ndata: ")
+        assert json.loads(chunk.split("data: ")[1]) == {
+            "revision": 7,
+            "type": "recipe",
+            "id": 7,
+            "deleted": False,
+            "category_ids": [3],
+        }
+        await stream.aclose()
+        assert hub.subscriber_count == 0
+
+    asyncio.run(run())
+
+
+def test_published_on_commit_only(test_db):
+    """Test writes reach subscribers when they commit, and never on rollback"""
+
+    async def run():
+        subscription = broadcaster.subscribe()
+        try:
+            with TestingSessionLocal() as db:
+                category_id = crud.create_category(
+                    db, schemas.CategoryCreate(name="Soups")
+                ).id
+                recipe_id = crud.create_recipe(
+                    db,
+                    schemas.RecipeCreate(
+                        title="Soup", instructions="Simmer", category_id=category_id
+                    ),
+                ).id
+                crud.patch_recipe(db, recipe_id, schemas.RecipePatch(category_id=None))
+
+                changelog.record(db, changelog.RECIPE, [recipe_id], deleted=True)
+                db.rollback()
+            await asyncio.sleep(0)
+
+            queue = subscription.queue
+            events = [queue.get_nowait() for _ in range(queue.qsize())]
+            assert [(e.type, e.id, e.category_ids) for e in events] == [
+                ("category", category_id, (category_id,)),
+                ("recipe", recipe_id, (category_id,)),
+                # Moved out of the category, so its subscribers hear about it
+                ("recipe", recipe_id, (category_id,)),
+            ]
+            assert [e.revision for e in events] == [1, 2, 3]
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    asyncio.run(run())
+
+
+def test_stream_endpoint(test_db):
+    """Test GET /api/changes/stream pushes a write and ends on disconnect"""
+
+    async def run():
+        chunks = asyncio.Queue()
+        disconnected = asyncio.Event()
+        request_sent = False
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                headers = dict(message["headers"])
+                assert headers[b"content-type"].startswith(b"text/event-stream")
+            elif message.get("body"):
+                await chunks.put(message["body"].decode())
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": "/api/changes/stream",
+            "raw_path": b"/api/changes/stream",
+            "query_string": b"category_id=1",
+            "root_path": "",
+            "headers": [(b"host", b"testserver")],
+            "client": ("testclient", 50000),
+            "server": ("testserver", 80),
+        }
+        task = asyncio.create_task(app(scope, receive, send))
+        assert await asyncio.wait_for(chunks.get(), 5) == ": connected\n\n"
+
+        with TestingSessionLocal() as db:
+            crud.create_category(db, schemas.CategoryCreate(name="Soups"))
+            crud.create_category(db, schemas.CategoryCreate(name="Breads"))
+        chunk = await asyncio.wait_for(chunks.get(), 5)
+        assert chunk.startswith("id: 1\n")
+        assert chunks.empty()  # category 2 is filtered out
+
+        disconnected.set()
+        await asyncio.wait_for(task, 5)
+        assert broadcaster.subscriber_count == 0
+
+    asyncio.run(run())
+
+
+def test_bulk_import_events_carry_each_recipes_category(test_db):
+    """Test an imported batch only reaches subscribers of each recipe's category"""
+
+    async def run():
+        with TestingSessionLocal() as db:
+            soups, breads = (
+                crud.create_category(db, schemas.CategoryCreate(name=name)).id
+                for name in ("Soups", "Breads")
+            )
+        subscription = broadcaster.subscribe(category_id=soups)
+        try:
+            rows = [
+                schemas.RecipeCreate(
+                    title=title, instructions="Cook", category_id=category_id
+                )
+                for title, category_id in [
+                    ("Leek Soup", soups),
+                    ("Rye", breads),
+                    ("Pea Soup", soups),
+                ]
+            ]
+            with TestingSessionLocal() as db:
+                bulk_import.insert_batch(
+                    db, list(enumerate(rows, 1)), bulk_import.ImportReport()
+                )
+            await asyncio.sleep(0)
+
+            queue = subscription.queue
+            events = [queue.get_nowait() for _ in range(queue.qsize())]
+            assert [e.category_ids for e in events] == [(soups,), (soups,)]
+            assert len({e.id for e in events}) == 2
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    asyncio.run(run())
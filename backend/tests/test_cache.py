@@ -0,0 +1,70 @@
+from cache import LRUTTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_eviction():
+    """Test the least recently used entry is evicted first"""
+    cache = LRUTTLCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_expiry():
+    """Test entries expire after the TTL"""
+    clock = FakeClock()
+    cache = LRUTTLCache(ttl_seconds=10, clock=clock)
+    cache.set("a", 1)
+
+    clock.now = 9
+    assert cache.get("a") == 1
+    clock.now = 10
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_invalidate_by_tag():
+    """Test invalidating a tag drops exactly the entries carrying it"""
+    cache = LRUTTLCache()
+    cache.set("recipe-1", 1, tags=["recipe:1", "category:1"])
+    cache.set("recipe-2", 2, tags=["recipe:2"])
+
+    assert cache.invalidate_tags(["category:1"]) == 1
+    assert cache.get("recipe-1") is None
+    assert cache.get("recipe-2") == 2
+
+
+def test_stale_fill_is_dropped():
+    """Test a value loaded before an invalidation is not stored"""
+    cache = LRUTTLCache()
+    generation = cache.generation
+    cache.invalidate_tags(["recipe:1"])
+    cache.set("recipe-1", "stale", tags=["recipe:1"], generation=generation)
+
+    assert cache.get("recipe-1") is None
+
+
+def test_replica_fill_waits_for_lag():
+    """Test a value from a lagging source is not stored right after a write"""
+    clock = FakeClock()
+    cache = LRUTTLCache(clock=clock)
+    cache.invalidate_tags(["recipe:1"])
+
+    clock.now = 4
+    cache.set("recipe-1", "stale", tags=["recipe:1"], lag_seconds=5)
+    assert cache.get("recipe-1") is None
+    clock.now = 5
+    cache.set("recipe-1", "fresh", tags=["recipe:1"], lag_seconds=5)
+    assert cache.get("recipe-1") == "fresh"
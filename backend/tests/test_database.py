@@ -0,0 +1,173 @@
+import asyncio
+
+from fastapi import Request, Response
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+import main
+from config import Settings
+from database import (
+    READ_YOUR_WRITES_COOKIE,
+    ReplicaSession,
+    SessionRouter,
+    _engine_options,
+    replica_lag,
+)
+
+
+def test_engine_options_postgres():
+    """Test pool sizing, pre-ping and statement timeout reach the engine"""
+    config = Settings(
+        db_pool_size=20,
+        db_max_overflow=5,
+        db_pool_recycle=600,
+        db_statement_timeout_ms=1500,
+    )
+    options = _engine_options(config.database_url, config)
+
+    assert options["echo"] is False
+    assert options["pool_size"] == 20
+    assert options["max_overflow"] == 5
+    assert options["pool_recycle"] == 600
+    assert options["pool_pre_ping"] is True
+    assert options["connect_args"] == {"options": "-c statement_timeout=1500"}
+
+
+def test_engine_options_asyncpg_statement_timeout():
+    """Test the statement timeout is passed as an asyncpg server setting"""
+    config = Settings(db_statement_timeout_ms=1500)
+    options = _engine_options(config.async_database_url, config)
+
+    assert options["connect_args"] == {
+        "server_settings": {"statement_timeout": "1500"}
+    }
+
+
+def test_engine_options_sqlite():
+    """Test SQLite engines only get the echo flag"""
+    assert _engine_options("sqlite:///./test.db", Settings()) == {"echo": False}
+
+
+def _request(method: str, cookie: str = "") -> Request:
+    headers = [(b"cookie", cookie.encode())] if cookie else []
+    return Request({"type": "http", "method": method, "headers": headers})
+
+
+def _factory(url: str, class_=ReplicaSession):
+    return sessionmaker(class_=class_, bind=create_engine(url))
+
+
+def _primary(url: str):
+    return _factory(url, class_=Session)
+
+
+def _database(db) -> str:
+    return db.get_bind().url.database
+
+
+class TestSessionRouter:
+    """Test read/write splitting between primary and replica"""
+
+    def test_reads_go_to_replica(self, tmp_path):
+        """Test GET requests get a replica session"""
+        router = SessionRouter(
+            _primary(f"sqlite:///{tmp_path}/primary.db"),
+            _factory(f"sqlite:///{tmp_path}/replica.db"),
+        )
+        db = router.session(_request("GET"), Response())
+        assert _database(db).endswith("replica.db")
+        db.close()
+
+    def test_replica_connects_on_first_query(self, tmp_path):
+        """Test a replica session takes no connection until it queries"""
+        replica = _factory(f"sqlite:///{tmp_path}/replica.db")
+        router = SessionRouter(_primary(f"sqlite:///{tmp_path}/primary.db"), replica)
+        pool = replica.kw["bind"].pool
+
+        db = router.session(_request("GET"), Response())
+        assert pool.checkedout() == 0
+        db.execute(text("SELECT 1"))
+        assert pool.checkedout() == 1
+        db.close()
+        assert pool.checkedout() == 0
+
+    def test_writes_go_to_primary_and_pin_reads(self, tmp_path):
+        """Test a write pins the client's following reads to the primary"""
+        router = SessionRouter(
+            _primary(f"sqlite:///{tmp_path}/primary.db"),
+            _factory(f"sqlite:///{tmp_path}/replica.db"),
+            read_your_writes_seconds=60,
+        )
+        response = Response()
+        db = router.session(_request("POST"), response)
+        assert _database(db).endswith("primary.db")
+
+        cookie = response.headers["set-cookie"].split(";")[0]
+        assert cookie.startswith(READ_YOUR_WRITES_COOKIE)
+        db = router.session(_request("GET", cookie), Response())
+        assert _database(db).endswith("primary.db")
+
+    def test_replica_down_falls_back_to_primary(self, tmp_path):
+        """Test reads use the primary while the replica cannot connect"""
+        router = SessionRouter(
+            _primary(f"sqlite:///{tmp_path}/primary.db"),
+            _factory(f"sqlite:///{tmp_path}/missing/replica.db"),
+        )
+        db = router.session(_request("GET"), Response())
+        # The replica is only found to be down by the first query
+        assert router.wants_replica(_request("GET"))
+        assert db.execute(text("SELECT 1")).scalar() == 1
+        assert _database(db).endswith("primary.db")
+        assert replica_lag(db) == 0
+        assert not router.wants_replica(_request("GET"))
+        db.close()
+
+    def test_async_replica_down_falls_back_to_primary(self, tmp_path):
+        """Test an async read falls back to the primary on its first query"""
+        primary = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/primary.db")
+        replica = create_async_engine(
+            f"sqlite+aiosqlite:///{tmp_path}/missing/replica.db"
+        )
+        router = SessionRouter(
+            async_sessionmaker(primary),
+            async_sessionmaker(replica, sync_session_class=ReplicaSession),
+        )
+
+        async def run():
+            db = router.session(_request("GET"), Response())
+            try:
+                assert (await db.execute(text("SELECT 1"))).scalar() == 1
+                assert db.get_bind() is primary.sync_engine
+            finally:
+                await db.close()
+            await primary.dispose()
+            await replica.dispose()
+
+        asyncio.run(run())
+        assert not router.wants_replica(_request("GET"))
+
+
+def test_shutdown_disposes_async_engines(monkeypatch):
+    """Test the primary and replica async pools are closed on shutdown"""
+    disposed = []
+
+    class FakeEngine:
+        def __init__(self, name):
+            self.name = name
+
+        async def dispose(self):
+            disposed.append(self.name)
+
+    monkeypatch.setattr(main, "async_engine", FakeEngine("primary"))
+    monkeypatch.setattr(main, "async_replica_engine", FakeEngine("replica"))
+    # Nothing to run, and no database to look for jobs in
+    monkeypatch.setattr(main.job_runner, "start", lambda: None)
+    monkeypatch.setattr(main.job_runner, "stop", lambda: None)
+
+    async def run():
+        async with main.lifespan(main.app):
+            pass
+
+    asyncio.run(run())
+    assert disposed == ["primary", "replica"]
@@ -0,0 +1,206 @@
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+import crud
+import jobs
+import models
+import schemas
+import search as search_engine
+from conftest import TestingSessionLocal
+
+
+@pytest.fixture
+def runner(test_db):
+    return jobs.JobRunner(TestingSessionLocal, workers=1, chunk_size=2)
+
+
+def _recipes(db, count: int, category_id=None, title="Soup"):
+    return [
+        crud.create_recipe(
+            db,
+            schemas.RecipeCreate(
+                title=f"{title} {i}", instructions="Stir", category_id=category_id
+            ),
+        ).id
+        for i in range(count)
+    ]
+
+
+def _job(db, kind: str, **params) -> int:
+    return jobs.create_job(db, kind, jobs.KINDS[kind].params(**params)).id
+
+
+def _state(job_id: int) -> models.Job:
+    with TestingSessionLocal() as db:
+        return jobs.get_job(db, job_id)
+
+
+def test_reindex_in_chunks(runner):
+    """Test a job works through every row in chunks and records its progress"""
+    with TestingSessionLocal() as db:
+        ids = _recipes(db, 5)
+        search_engine.remove_recipes(db, ids)
+        db.commit()
+        assert crud.count_recipes(db, search="soup")[0] == 0
+        job_id = _job(db, "reindex")
+
+    runner.run(job_id)
+
+    job = _state(job_id)
+    assert (job.status, job.processed, job.total, job.cursor) == (
+        "succeeded",
+        5,
+        5,
+        max(ids),
+    )
+    assert job.started_at is not None and job.finished_at is not None
+    with TestingSessionLocal() as db:
+        assert crud.count_recipes(db, search="soup")[0] == 5
+
+
+def test_recategorize(runner):
+    """Test only matching recipes move, each as a new version"""
+    with TestingSessionLocal() as db:
+        old = crud.create_category(db, schemas.CategoryCreate(name="Old")).id
+        new = crud.create_category(db, schemas.CategoryCreate(name="New")).id
+        soups = _recipes(db, 3, old)
+        cakes = _recipes(db, 2, old, title="Cake")
+        job_id = _job(
+            db, "recategorize", from_category_id=old, search="soup", to_category_id=new
+        )
+
+    runner.run(job_id)
+
+    assert _state(job_id).processed == 3
+    with TestingSessionLocal() as db:
+        for recipe_id in soups:
+            recipe = crud.get_recipe(db, recipe_id)
+            assert (recipe.category_id, recipe.version) == (new, 2)
+        assert all(crud.get_recipe(db, i).category_id == old for i in cakes)
+
+
+def test_resumes_after_stopping(runner):
+    """Test a job stopped between chunks carries on where it left off"""
+    with TestingSessionLocal() as db:
+        ids = _recipes(db, 5)
+        category_id = crud.create_category(db, schemas.CategoryCreate(name="A")).id
+        job_id = _job(db, "recategorize", to_category_id=category_id)
+
+    kind = jobs.KINDS["recategorize"]
+    after_commit = kind.after_commit
+    try:
+        # Shut down after the first chunk
+        kind.after_commit = lambda params, ids: runner._stopping.set()
+        runner.run(job_id)
+    finally:
+        kind.after_commit = after_commit
+
+    job = _state(job_id)
+    assert (job.status, job.processed, job.cursor) == ("queued", 2, ids[1])
+
+    runner._stopping.clear()
+    assert runner.recover() == [job_id]
+    runner.run(job_id)
+
+    job = _state(job_id)
+    assert (job.status, job.processed) == ("succeeded", 5)
+    with TestingSessionLocal() as db:
+        # Moved once each, none twice
+        assert {crud.get_recipe(db, i).version for i in ids} == {2}
+
+
+def test_cancel_running_job(runner):
+    """Test a running job stops at the next chunk boundary when cancelled"""
+    with TestingSessionLocal() as db:
+        _recipes(db, 5)
+        job_id = _job(db, "reindex")
+
+    kind = jobs.KINDS["reindex"]
+    after_commit = kind.after_commit
+
+    def cancel(params, ids):
+        with TestingSessionLocal() as db:
+            assert jobs.cancel_job(db, job_id).status == "cancelling"
+
+    try:
+        kind.after_commit = cancel
+        runner.run(job_id)
+    finally:
+        kind.after_commit = after_commit
+
+    job = _state(job_id)
+    assert (job.status, job.processed) == ("cancelled", 2)
+    with TestingSessionLocal() as db, pytest.raises(jobs.JobFinished):
+        jobs.cancel_job(db, job_id)
+
+
+def test_cancel_queued_job(runner):
+    """Test a queued job is cancelled before it ever runs"""
+    with TestingSessionLocal() as db:
+        job_id = _job(db, "reindex")
+        assert jobs.cancel_job(db, job_id).status == "cancelled"
+        assert jobs.cancel_job(db, 999) is None
+
+    runner.run(job_id)
+    assert _state(job_id).processed == 0
+
+
+def test_failed_job_records_error(runner):
+    """Test an exception fails the job with its message"""
+    with TestingSessionLocal() as db:
+        job_id = jobs.create_job(db, "reindex", schemas.ReindexParams()).id
+        db.get(models.Job, job_id).kind = "removed"
+        db.commit()
+
+    runner.run(job_id)
+
+    job = _state(job_id)
+    assert job.status == "failed"
+    assert "KeyError" in job.error
+
+
+def test_stale_jobs_are_taken_over(runner):
+    """Test running jobs are only claimed once their heartbeat is stale"""
+    long_ago = datetime(2000, 1, 1, tzinfo=timezone.utc)
+    with TestingSessionLocal() as db:
+        alive, dead, stopping = (_job(db, "reindex") for _ in range(3))
+        for job_id, status in [(alive, "running"), (dead, "running")]:
+            db.get(models.Job, job_id).status = status
+        db.get(models.Job, alive).heartbeat_at = datetime.now(timezone.utc)
+        db.get(models.Job, dead).heartbeat_at = long_ago
+        db.get(models.Job, stopping).status = "cancelling"
+        db.get(models.Job, stopping).heartbeat_at = long_ago
+        db.commit()
+
+    assert runner.recover() == [dead]
+    assert _state(stopping).status == "cancelled"
+    runner.run(alive)
+    assert _state(alive).status == "running"
+    runner.run(dead)
+    assert _state(dead).status == "succeeded"
+
+
+def test_runner_thread_pool(runner):
+    """Test a started runner picks up queued jobs and finishes them"""
+    with TestingSessionLocal() as db:
+        _recipes(db, 3)
+        queued = _job(db, "reindex")
+
+    runner.start()
+    try:
+        submitted = None
+        with TestingSessionLocal() as db:
+            submitted = _job(db, "reindex")
+        runner.enqueue(submitted)
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            if {_state(queued).status, _state(submitted).status} == {"succeeded"}:
+                break
+            time.sleep(0.01)
+    finally:
+        runner.stop()
+
+    assert _state(queued).status == "succeeded"
+    assert _state(submitted).status == "succeeded"
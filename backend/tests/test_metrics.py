@@ -0,0 +1,95 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import QueuePool
+
+import metrics
+from metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_counter_renders_labelled_samples():
+    """Test a counter keeps one sample per label set"""
+    counter = Counter("jobs_total", "Jobs run", ("queue",))
+    counter.inc("fast")
+    counter.inc("fast")
+    counter.inc("slow", amount=3)
+
+    assert counter.render() == "\n".join(
+        [
+            "# HELP jobs_total Jobs run",
+            "# TYPE jobs_total counter",
+            'jobs_total{queue="fast"} 2',
+            'jobs_total{queue="slow"} 3',
+        ]
+    )
+
+
+def test_label_values_are_escaped():
+    """Test quotes, backslashes and newlines cannot break the format"""
+    counter = Counter("paths_total", "Paths", ("path",))
+    counter.inc('a"b\\c\nd')
+
+    assert 'paths_total{path="a\\"b\\\\c\\nd"} 1' in counter.render()
+
+
+def test_histogram_buckets_are_cumulative():
+    """Test each bucket counts every observation at or below its bound"""
+    histogram = Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+
+    samples = histogram.render().splitlines()[2:]
+    assert samples == [
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1.0"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 2.65",
+        "latency_seconds_count 4",
+    ]
+    assert histogram.count() == 4
+
+
+def test_gauge_function_is_read_at_scrape_time():
+    """Test a gauge with a function reports its current return value"""
+    level = {"value": 1}
+    gauge = Gauge(
+        "level", "Level", ("tank",), function=lambda: {("a",): level["value"]}
+    )
+    level["value"] = 7
+
+    assert 'level{tank="a"} 7' in gauge.render()
+
+
+def test_registry_renders_every_metric():
+    """Test the exposition ends with a newline, as Prometheus requires"""
+    registry = Registry()
+    registry.register(Counter("a_total", "A")).inc()
+    registry.register(Gauge("b", "B")).dec()
+
+    body = registry.render()
+    assert body.endswith("\n")
+    assert "a_total 1\n" in body
+    assert "b -1\n" in body
+
+
+def test_instrumented_engine_times_statements_and_checkouts():
+    """Test statements are timed by operation and pool checkouts are timed"""
+    engine = create_engine("sqlite://", poolclass=QueuePool, pool_size=2)
+    metrics.instrument_engine(engine, "instrumented")
+    statements = metrics.STATEMENT_DURATION.count("instrumented", "SELECT")
+    checkouts = metrics.POOL_WAIT.count("instrumented")
+
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        connection.execute(text("select 2"))
+        try:
+            connection.execute(text("SELECT * FROM missing"))
+        except Exception:
+            pass
+
+        body = metrics.registry.render()
+        assert 'db_pool_checked_out{database="instrumented"} 1' in body
+        assert 'db_pool_saturation{database="instrumented"}' in body
+
+    assert metrics.STATEMENT_DURATION.count("instrumented", "SELECT") == statements + 2
+    assert metrics.STATEMENT_ERRORS.value("instrumented", "SELECT") == 1
+    assert metrics.POOL_WAIT.count("instrumented") == checkouts + 1
+    engine.dispose()
@@ -0,0 +1,317 @@
+"""Query-plan regression tests for the hot CRUD queries.
+
+Seeds a realistic dataset, runs each query through crud while capturing the
+SQL it sends, and EXPLAINs every statement. A test fails when a large table
+is read in full, an expected index goes unused, a paged query sorts instead
+of reading in index order, or (Postgres only) the planner's cost or row
+estimate goes over budget.
+
+Runs on SQLite. Set TEST_POSTGRES_URL to a scratch Postgres database (its
+tables are dropped and recreated) to check the same plans there.
+"""
+import os
+from dataclasses import dataclass
+from typing import Callable, Tuple, Union
+
+import pytest
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import crud
+import schemas
+import shopping
+from benchmarks.data import Dataset, generate
+from database import Base
+from query_plans import capture, explain
+
+POSTGRES_URL = os.environ.get("TEST_POSTGRES_URL")
+
+PAGE = 20
+
+# Tables big enough that reading one in full is a regression. Categories
+# number in the dozens: a sequential read of them is the right plan.
+LARGE_TABLES = {"recipes", "ingredients"}
+
+# Expected indexes; a tuple accepts any one of its names. Postgres may look
+# a row up through the primary key or the redundant ix_<table>_id index.
+RECIPES_PK = ("recipes_pkey", "ix_recipes_id")
+CATEGORIES_PK = ("categories_pkey", "ix_categories_id")
+SEARCH_INDEX = ("recipes_fts", "ix_recipes_search_vector")
+INGREDIENTS_BY_RECIPE = "ix_ingredients_recipe_id_name_key"
+# Where indexes tie, SQLite takes the first one created, and create_all
+# creates a table's indexes in set order, which varies with the hash seed.
+# Any index led by category_id finds a category's recipes
+BY_CATEGORY = (
+    "ix_recipes_category_id_id",
+    "ix_recipes_category_id_created_at_id",
+    "ix_recipes_category_id_title_id",
+)
+# SQLite indexes end with the rowid, so ix_recipes_title also orders by id
+TITLE_ORDER = ("ix_recipes_title_id", "ix_recipes_title")
+
+
+@dataclass
+class PlanCase:
+    name: str
+    run: Callable[[Session, Dataset], object]
+    uses: Tuple[Union[str, Tuple[str, ...]], ...] = ()
+    scans: Tuple[str, ...] = ()  # large tables this query may read in full
+    sorts: bool = False  # whether a limited query may sort (e.g. by rank)
+    max_cost: float = 100.0
+    max_rows: float = 100.0
+
+
+def _second_page(db: Session, sort: str):
+    _, cursor = crud.get_recipes_page_json(db, limit=PAGE, sort=sort)
+    return crud.get_recipes_page_json(db, limit=PAGE, sort=sort, cursor=cursor)
+
+
+CASES = [
+    PlanCase(
+        "get_recipe",
+        lambda db, s: crud.get_recipe(db, s.recipe_ids[100]),
+        uses=(RECIPES_PK, CATEGORIES_PK, INGREDIENTS_BY_RECIPE),
+    ),
+    PlanCase(
+        "get_recipe_projected",
+        lambda db, s: crud.get_recipe(db, s.recipe_ids[100], fields=("id", "title")),
+        uses=(RECIPES_PK,),
+    ),
+    PlanCase(
+        "get_recipes_by_ids",
+        lambda db, s: crud.get_recipes_by_ids(db, s.recipe_ids[100:130]),
+        uses=(RECIPES_PK, CATEGORIES_PK, INGREDIENTS_BY_RECIPE),
+    ),
+    PlanCase(
+        "get_recipe_validators",
+        lambda db, s: crud.get_recipe_validators(db, s.recipe_ids[100]),
+        uses=(RECIPES_PK,),
+    ),
+    PlanCase(
+        "list",
+        lambda db, s: crud.get_recipes_page_json(db, limit=PAGE),
+        uses=(RECIPES_PK,),
+    ),
+    *[
+        PlanCase(
+            f"list_sort_{sort}",
+            lambda db, s, sort=sort: crud.get_recipes_page_json(
+                db, limit=PAGE, sort=sort
+            ),
+            uses=(index,),
+        )
+        for sort, index in [
+            ("-created_at", "ix_recipes_created_at_id"),
+            ("title", TITLE_ORDER),
+            ("prep_time", "ix_recipes_prep_time_key"),
+            ("-cook_time", "ix_recipes_cook_time_desc_key"),
+            ("total_time", "ix_recipes_total_time_key"),
+        ]
+    ],
+    PlanCase(
+        "list_next_page",
+        lambda db, s: _second_page(db, "title"),
+        uses=(TITLE_ORDER,),
+    ),
+    PlanCase(
+        "list_category",
+        lambda db, s: crud.get_recipes_page_json(
+            db, limit=PAGE, category_id=s.category_ids[3]
+        ),
+        uses=("ix_recipes_category_id_id",),
+    ),
+    PlanCase(
+        "list_category_by_title",
+        lambda db, s: crud.get_recipes_page_json(
+            db, limit=PAGE, category_id=s.category_ids[3], sort="title"
+        ),
+        uses=("ix_recipes_category_id_title_id",),
+    ),
+    PlanCase(
+        "list_category_newest",
+        lambda db, s: crud.get_recipes_page_json(
+            db, limit=PAGE, category_id=s.category_ids[3], sort="-created_at"
+        ),
+        uses=("ix_recipes_category_id_created_at_id",),
+    ),
+    PlanCase(
+        "list_total_time_range",
+        lambda db, s: crud.get_recipes_page_json(
+            db, limit=PAGE, ranges=(("total_time", None, 20),), sort="total_time"
+        ),
+        uses=("ix_recipes_total_time_key",),
+    ),
+    PlanCase(
+        "list_servings_range",
+        lambda db, s: crud.get_recipes_page_json(
+            db, limit=PAGE, ranges=(("servings", 8, None),)
+        ),
+    ),
+    PlanCase(
+        "list_search",
+        lambda db, s: crud.get_recipes_page_json(db, limit=PAGE, search="basil"),
+        uses=(SEARCH_INDEX,),
+        # Ranked by relevance, which no index stores
+        sorts=True,
+        max_cost=500.0,
+    ),
+    PlanCase(
+        "count_category",
+        lambda db, s: crud.count_recipes(db, category_id=s.category_ids[3]),
+        uses=(BY_CATEGORY,),
+    ),
+    PlanCase(
+        "count_search",
+        lambda db, s: crud.count_recipes(db, search="basil"),
+        uses=(SEARCH_INDEX,),
+        max_cost=500.0,
+    ),
+    PlanCase(
+        "count_all",
+        lambda db, s: crud.count_recipes(db),
+        # An exact count reads every row; count=estimated avoids it
+        scans=("recipes",),
+        max_cost=1000.0,
+    ),
+    PlanCase(
+        "cook_with",
+        lambda db, s: crud.get_recipes_by_ingredients(
+            db, ["tomato 3", "basil 5"], limit=PAGE
+        ),
+        uses=("ix_ingredients_name_key_recipe_id", RECIPES_PK),
+        # Ranked by coverage, computed per query
+        sorts=True,
+        max_cost=1000.0,
+    ),
+    PlanCase(
+        "shopping_list",
+        lambda db, s: shopping.shopping_list(
+            db,
+            [
+                schemas.ShoppingListRecipe(recipe_id=recipe_id, servings=4)
+                for recipe_id in s.recipe_ids[:300]
+            ],
+        ),
+        uses=(RECIPES_PK, INGREDIENTS_BY_RECIPE),
+        # One row per distinct ingredient and unit of the plan
+        max_cost=5000.0,
+        max_rows=5000.0,
+    ),
+    PlanCase(
+        "get_category",
+        lambda db, s: crud.get_category(db, s.category_ids[3]),
+        uses=(CATEGORIES_PK,),
+    ),
+    PlanCase(
+        "get_category_by_name",
+        lambda db, s: crud.get_category_by_name(db, "Category 7"),
+        uses=("ix_categories_name",),
+    ),
+    PlanCase(
+        "list_categories",
+        lambda db, s: crud.get_categories_page(db, limit=PAGE),
+    ),
+    # Writes touch rows no other case reads
+    PlanCase(
+        "patch_recipe",
+        lambda db, s: crud.patch_recipe(
+            db, s.recipe_ids[200], schemas.RecipePatch(title="Renamed")
+        ),
+        uses=(RECIPES_PK, INGREDIENTS_BY_RECIPE),
+    ),
+    PlanCase(
+        "delete_recipe",
+        lambda db, s: crud.delete_recipe(db, s.recipe_ids[300]),
+        uses=(RECIPES_PK, INGREDIENTS_BY_RECIPE),
+    ),
+    PlanCase(
+        "delete_category",
+        lambda db, s: crud.delete_category(db, s.category_ids[5]),
+        # Its recipes are found by category_id and detached one by one
+        uses=(CATEGORIES_PK, BY_CATEGORY, RECIPES_PK),
+        max_rows=1000.0,
+    ),
+]
+
+
+def _engine(dialect: str):
+    if dialect == "sqlite":
+        return create_engine(
+            "sqlite://",
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+        )
+    if not POSTGRES_URL:
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    return create_engine(POSTGRES_URL)
+
+
+@pytest.fixture(scope="module", params=["sqlite", "postgresql"])
+def seeded(request):
+    """An engine over the seeded dataset, with its session factory and ids"""
+    engine = _engine(request.param)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autoflush=False, bind=engine)
+    with session_factory() as db:
+        ids = generate(db, categories=40, recipes=5000, ingredients=8)
+    # Planner statistics, as a maintained production database has them
+    with engine.begin() as connection:
+        connection.exec_driver_sql("ANALYZE")
+    yield engine, session_factory, ids
+    Base.metadata.drop_all(bind=engine)
+    engine.dispose()
+
+
+def _problems(case: PlanCase, plans) -> list:
+    problems = []
+    used = set().union(*(plan.indexes for plan in plans))
+    for expected in case.uses:
+        names = (expected,) if isinstance(expected, str) else expected
+        if not used.intersection(names):
+            problems.append(f"uses none of {', '.join(names)}")
+    for plan in plans:
+        scans = (plan.full_scans & LARGE_TABLES) - set(case.scans)
+        if scans:
+            problems.append(f"reads {', '.join(sorted(scans))} in full:\n{plan}")
+        if plan.temp_sorts and not case.sorts and " LIMIT " in plan.sql:
+            problems.append(f"sorts a paged query instead of using an index:\n{plan}")
+        if plan.cost is not None and plan.cost > case.max_cost:
+            problems.append(f"costs {plan.cost} > {case.max_cost}:\n{plan}")
+        if plan.rows is not None and plan.rows > case.max_rows:
+            problems.append(f"estimates {plan.rows} rows > {case.max_rows}:\n{plan}")
+    return problems
+
+
+@pytest.mark.parametrize("case", CASES, ids=lambda case: case.name)
+def test_query_plan(seeded, case: PlanCase):
+    """Test every statement of a hot query is planned within its budget"""
+    engine, session_factory, ids = seeded
+    with session_factory() as db, capture(engine) as statements:
+        case.run(db, ids)
+    assert statements, f"{case.name} sent no SQL"
+
+    with engine.connect() as connection:
+        plans = [explain(connection, statement) for statement in statements]
+    problems = _problems(case, plans)
+    assert not problems, f"{case.name}: " + "\n\n".join(problems)
+
+
+# Reflection cannot describe the expression indexes; they are not needed here
+@pytest.mark.filterwarnings("ignore:Skipped unsupported reflection")
+def test_foreign_keys_are_indexed(seeded):
+    """Test every foreign key leads an index, for joins and cascades"""
+    engine = seeded[0]
+    inspector = inspect(engine)
+    unindexed = []
+    for table in LARGE_TABLES:
+        leading = {
+            tuple(index["column_names"][: len(fk["constrained_columns"])])
+            for index in inspector.get_indexes(table)
+            for fk in inspector.get_foreign_keys(table)
+        }
+        for fk in inspector.get_foreign_keys(table):
+            if tuple(fk["constrained_columns"]) not in leading:
+                unindexed.append(f"{table}.{', '.join(fk['constrained_columns'])}")
+    assert not unindexed
@@ -0,0 +1,44 @@
+import pytest
+
+from shopping import display, find_unit
+
+
+@pytest.mark.parametrize(
+    "written, unit",
+    [
+        ("g", "g"),
+        ("Grams", "g"),
+        (" KG ", "kg"),
+        ("Tbsp.", "tbsp"),
+        ("tablespoons", "tbsp"),
+        ("Cups", "cup"),
+        ("litre", "l"),
+        ("pinch", None),
+        ("", None),
+        (None, None),
+    ],
+)
+def test_find_unit(written, unit):
+    """Test unit spellings map to the unit table"""
+    found = find_unit(written)
+    assert (found.name if found else None) == unit
+
+
+@pytest.mark.parametrize(
+    "total, dimension, systems, expected",
+    [
+        (500.0, "mass", {"metric"}, (500.0, "g")),
+        (1500.0, "mass", {"metric"}, (1.5, "kg")),
+        (0.5, "mass", {"metric"}, (500.0, "mg")),
+        (2000.0, "volume", {"metric"}, (2.0, "l")),
+        (14.78676 * 2, "volume", {"us"}, (2.0, "tbsp")),
+        (236.58824 * 1.5, "volume", {"us"}, (1.5, "cup")),
+        (2.0, "volume", {"us"}, (2.0 / 4.92892, "tsp")),
+        # Mixed systems are shown in metric
+        (250.0, "volume", {"us", "metric"}, (250.0, "ml")),
+    ],
+)
+def test_display(total, dimension, systems, expected):
+    """Test totals are shown in the largest unit they make at least 1 of"""
+    amount, unit = display(total, dimension, systems)
+    assert (unit, amount) == (expected[1], pytest.approx(expected[0]))